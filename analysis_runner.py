@@ -0,0 +1,191 @@
+import os
+import sys
+import glob
+import shutil
+import copy
+import importlib
+from datetime import datetime
+
+from utils import helper, cases, timing, artifact_store
+import phantoms.helper
+import dicom_helper
+
+# Headless analysis of one case, shared by the GUI, the watcher and the other services.
+# A job is a dict:
+#   {'site', 'device', 'phantom', 'files': [...], 'output_folder',
+#    'performed_by', 'performed_date' (yyyy-mm-dd), 'notes'}
+
+def get_app_dir():
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+def load_app_config(config_dir=None):
+    return helper.read_json_file(os.path.join(config_dir or get_app_dir(), 'config.json'))
+
+# config file -> (mtime, config), filled by warm_up() in worker processes
+_phantom_configs = {}
+
+def load_phantom_config(site, device, phantom, config_dir=None):
+    config_file = os.path.join(config_dir or get_app_dir(), f'config.{site.lower()}.{device.lower()}.{phantom.lower()}.json')
+    if not os.path.exists(config_file):
+        raise Exception(f"Error:Phantom config file not found. {config_file}")
+
+    cached = _phantom_configs.get(config_file)
+    if cached and cached[0] == os.path.getmtime(config_file):
+        # callers modify the config (metadata, open_file)
+        return copy.deepcopy(cached[1])
+
+    return helper.read_json_file(config_file)
+
+def get_phantom_dim(app_config, phantom):
+    for p in app_config['phantoms']:
+        if p['id'].lower() == phantom.lower():
+            return p['dim']
+    raise Exception(f'Unknown phantom: {phantom}')
+
+def get_phantom_module(phantom):
+    return importlib.import_module(f'phantoms.{phantom.lower()}')
+
+def get_case_output_folder(output_folder, site, device, phantom, dicom_file, performed_date, log_message=print, create=True):
+    # output_folder/<site>_<device>_<phantom>/<image date time>/, created unless an artifact store publishes it
+    try:
+        dt_str = dicom_helper.get_instance_creation_datetime_str(dicom_file)
+    except Exception:
+        log_message('No instance creation date time found. Using performed date.')
+        dt_str = performed_date.replace('-', '') + '_000000'
+
+    folder = os.path.join(output_folder, cases.phantom_folder_name(site, device, phantom), dt_str)
+    if create and not os.path.exists(folder):
+        log_message(f'creating a folder: {folder}')
+        os.makedirs(folder)
+
+    return folder
+
+def validate_input(module, dim, files, phantom_config, log_message=print):
+    """Returns the files to stage, checked (3D) and selected by the phantom module. Reads headers only."""
+    if dim == 2:
+        return files[:1]
+
+    headers = phantoms.helper.validate_input_slices(files, phantom_config, log_message=log_message)
+    input_files = [h['file'] for h in headers]
+
+    # phantom modules may stage only the slices they need
+    if hasattr(module, 'select_input_files'):
+        input_files = module.select_input_files(input_files, phantom_config, log_message=log_message, headers=headers)
+    return input_files
+
+def stage_input(dim, files, case_dir, log_message=print, log_file=None):
+    """Copies the input files to the case folder. Returns the input file (2D) or folder (3D) of the analysis."""
+    log_file = log_file or log_message
+    with timing.span('stage_input'):
+        if dim == 2:
+            dst_file = os.path.join(case_dir, 'input.dcm')
+            shutil.copy(files[0], dst_file)
+            return dst_file
+
+        log_message(f'copying {len(files)} files to {case_dir}...')
+        for i, src_file in enumerate(files):
+            dst_file = os.path.join(case_dir, f'input_{str(i).zfill(3)}.dcm')
+            # per-file lines only go to log_file
+            log_file(f'copying file...{src_file}-->{dst_file}')
+            shutil.copy(src_file, dst_file)
+        return case_dir
+
+def get_notes(phantom_config, user_notes=''):
+    config_notes = phantom_config['publish_pdf_params'].get('notes', '')
+    return f'{user_notes}\n{config_notes}'
+
+def get_metadata(phantom_config, performed_by, performed_date):
+    metadata = phantom_config['publish_pdf_params']['metadata']
+    metadata['Performed By'] = performed_by
+    metadata['Performed Date'] = performed_date
+    return metadata
+
+def run_module(module, dim, device_id, input_path, case_dir, phantom_config, notes, metadata, log_message=print):
+    if dim == 2:
+        module.run_analysis(device_id=device_id, input_file=input_path, output_dir=case_dir,
+                            config=phantom_config, notes=notes, metadata=metadata, log_message=log_message)
+    else:
+        module.run_analysis(device_id=device_id, input_dir=input_path, output_dir=case_dir,
+                            config=phantom_config, notes=notes, metadata=metadata, log_message=log_message)
+
+def run_case(job, app_config=None, metrics_dir=None, app_version=None, log_message=print):
+    """Stages and analyzes one case without the GUI. Returns {'status', 'case_dir', 'error', 'total_s'}.
+
+    The PDF is never opened. If metrics_dir is given, the stage timings are appended to the metrics file.
+    If an artifact store is configured, the case is written to its staging folder and published in the background.
+    """
+    app_config = app_config or load_app_config()
+    site, device, phantom = job['site'], job['device'], job['phantom']
+    performed_date = job.get('performed_date') or datetime.now().strftime('%Y-%m-%d')
+    store = artifact_store.get_store()
+    case_dir = None
+    work_dir = None
+
+    with timing.record() as recorder:
+        try:
+            with timing.span('run_analysis'):
+                module = get_phantom_module(phantom)
+                dim = get_phantom_dim(app_config, phantom)
+                phantom_config = load_phantom_config(site, device, phantom, config_dir=job.get('config_dir'))
+                phantom_config['publish_pdf_params']['open_file'] = False
+
+                input_files = validate_input(module, dim, job['files'], phantom_config, log_message=log_message)
+                case_dir = get_case_output_folder(job['output_folder'], site, device, phantom, input_files[0],
+                                                  performed_date, log_message=log_message, create=store is None)
+                work_dir = store.stage(case_dir) if store else case_dir
+                input_path = stage_input(dim, input_files, work_dir, log_message=log_message, log_file=lambda m: None)
+
+                run_module(module, dim, f'{site}|{device}', input_path, work_dir, phantom_config,
+                           notes=get_notes(phantom_config, job.get('notes', '')),
+                           metadata=get_metadata(phantom_config, job.get('performed_by', ''), performed_date),
+                           log_message=log_message)
+        except Exception as e:
+            log_message(f'Error: {e}')
+            if store and work_dir:
+                store.discard(work_dir)
+            return {'status': 'error', 'case_dir': case_dir, 'error': str(e), 'total_s': round(recorder.total_s(), 3)}
+
+    if metrics_dir:
+        phantoms.helper.save_timings(recorder, output_dir=work_dir, metrics_dir=metrics_dir, log_message=log_message,
+                                     stage='analysis', device_id=f'{site}|{device}', phantom=phantom, app_version=app_version)
+
+    if store:
+        store.publish(work_dir, case_dir)
+
+    return {'status': 'ok', 'case_dir': case_dir, 'error': None, 'total_s': round(recorder.total_s(), 3)}
+
+def warm_up():
+    """Worker process initializer: imports pylinac and the phantom modules and parses the phantom configs once, before the first job."""
+    import matplotlib
+    matplotlib.use('Agg')
+
+    for p in load_app_config()['phantoms']:
+        get_phantom_module(p['id'])
+
+    for config_file in glob.glob(os.path.join(get_app_dir(), 'config.*.*.*.json')):
+        _phantom_configs[config_file] = (os.path.getmtime(config_file), helper.read_json_file(config_file))
+
+def run_job(job, progress_queue=None):
+    """Runs a job in a worker process. The log lines are returned with the result.
+
+    If progress_queue (e.g. a multiprocessing.Manager queue) is given, each log line is also put on it
+    as (job['job_id'], line) while the job runs. If job['app_log'] is set, the lines also go to the app log file.
+    """
+    logger = None
+    if job.get('app_log'):
+        from app_logger import logger
+
+    lines = []
+
+    def log_message(message):
+        lines.append(f'{message}')
+        if logger is not None:
+            logger.info(message)
+        if progress_queue is not None:
+            progress_queue.put((job.get('job_id'), f'{message}'))
+
+    result = run_case(job, metrics_dir=job.get('metrics_dir'), app_version=job.get('app_version'), log_message=log_message)
+    result['log'] = lines
+    return result
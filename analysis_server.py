@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import uuid
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+from utils import helper
+import analysis_runner
+
+from app_logger import logger, logs_dir
+
+APP_VERSION = '0.1.1'
+
+# Local analysis service. Worker processes import pylinac and parse the phantom configs once at
+# start (analysis_runner.warm_up), so a job does not pay the import cost.
+# Jobs are submitted with --submit or submit_job() (CLI and scripts). The GUI runs its analyses in its own
+# process, where the phantom cache and the profiler live.
+# The last max_finished_jobs finished jobs are kept for status and log requests.
+#
+#   POST /jobs                      job spec (see analysis_runner) -> {"job_id"}
+#   GET  /jobs                      all jobs
+#   GET  /jobs/<id>                 status (queued, running, ok, error), case_dir, error
+#   GET  /jobs/<id>/log?since=N&wait=S
+#                                   log lines from line N, waits up to S seconds for new lines
+#   GET  /health
+
+class JobQueue:
+    """Jobs of the server and their progress. Jobs run on a pool of pre-warmed worker processes."""
+    def __init__(self, max_workers=2, metrics_dir=None, app_log=False, max_finished_jobs=200):
+        self.metrics_dir = metrics_dir
+        self.app_log = app_log
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = {}
+        self.condition = threading.Condition()
+
+        context = multiprocessing.get_context('spawn')
+        self.manager = context.Manager()
+        self.progress_queue = self.manager.Queue()
+        self.executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=analysis_runner.warm_up)
+        self.max_workers = max_workers
+
+        # start and warm up all the workers now, not on the first jobs
+        for future in [self.executor.submit(time.sleep, 0.1) for _ in range(max_workers)]:
+            future.result()
+
+        self.progress_thread = threading.Thread(target=self._read_progress, daemon=True)
+        self.progress_thread.start()
+
+    def submit(self, job):
+        for key in ('site', 'device', 'phantom', 'files', 'output_folder'):
+            if key not in job:
+                raise Exception(f'{key} is required.')
+
+        job_id = uuid.uuid4().hex[:12]
+        job = {**job, 'job_id': job_id, 'metrics_dir': self.metrics_dir, 'app_log': self.app_log, 'app_version': APP_VERSION}
+        with self.condition:
+            self.jobs[job_id] = {'job_id': job_id, 'status': 'queued', 'submitted': time.time(),
+                                 'phantom': job['phantom'], 'case_dir': None, 'error': None, 'log': []}
+
+        future = self.executor.submit(analysis_runner.run_job, job, self.progress_queue)
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        return job_id
+
+    def _read_progress(self):
+        while True:
+            try:
+                job_id, line = self.progress_queue.get()
+            except (EOFError, OSError):
+                return
+
+            with self.condition:
+                job = self.jobs.get(job_id)
+                if job is not None:
+                    if job['status'] == 'queued':
+                        job['status'] = 'running'
+                    job['log'].append(line)
+                self.condition.notify_all()
+
+    def _on_done(self, job_id, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {'status': 'error', 'case_dir': None, 'error': str(e), 'log': []}
+
+        with self.condition:
+            job = self.jobs[job_id]
+            # the result holds all the lines, some may not have arrived through the progress queue yet
+            if len(result.get('log', [])) > len(job['log']):
+                job['log'] = result['log']
+            job.update({'status': result['status'], 'case_dir': result['case_dir'], 'error': result['error'],
+                        'total_s': result.get('total_s'), 'finished': time.time()})
+            self._evict_finished()
+            self.condition.notify_all()
+
+    def _evict_finished(self):
+        # the oldest finished jobs beyond max_finished_jobs are forgotten
+        finished = sorted((job['finished'], job_id) for job_id, job in self.jobs.items() if 'finished' in job)
+        for _, job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+
+    def status(self, job_id):
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            return {k: v for k, v in job.items() if k != 'log'} | {'num_lines': len(job['log'])}
+
+    def get_log(self, job_id, since=0, wait_s=0):
+        deadline = time.time() + wait_s
+        with self.condition:
+            while True:
+                job = self.jobs.get(job_id)
+                if job is None:
+                    return None
+                done = job['status'] in ('ok', 'error')
+                if len(job['log']) > since or done or time.time() >= deadline:
+                    return {'lines': job['log'][since:], 'next': len(job['log']), 'status': job['status']}
+                self.condition.wait(timeout=deadline - time.time())
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        self.manager.shutdown()
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/jobs':
+            return self.send_json({'error': 'not found'}, 404)
+
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            job_id = self.server.queue.submit(job)
+        except Exception as e:
+            return self.send_json({'error': str(e)}, 400)
+
+        self.send_json({'job_id': job_id}, 201)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        query = parse_qs(url.query)
+        queue = self.server.queue
+
+        if parts == ['health']:
+            return self.send_json({'status': 'ok', 'workers': queue.max_workers, 'jobs': len(queue.jobs)})
+
+        if parts == ['jobs']:
+            return self.send_json([queue.status(job_id) for job_id in list(queue.jobs)])
+
+        if len(parts) == 2 and parts[0] == 'jobs':
+            status = queue.status(parts[1])
+            return self.send_json(status) if status else self.send_json({'error': 'job not found'}, 404)
+
+        if len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'log':
+            since = int(query.get('since', ['0'])[0])
+            wait_s = min(float(query.get('wait', ['0'])[0]), 60)
+            log = queue.get_log(parts[1], since=since, wait_s=wait_s)
+            return self.send_json(log) if log else self.send_json({'error': 'job not found'}, 404)
+
+        self.send_json({'error': 'not found'}, 404)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+def create_server(address='127.0.0.1', port=8765, max_workers=2, metrics_dir=None, app_log=False, max_finished_jobs=200):
+    """app_log: the workers also write the job log lines to the app log file."""
+    server = ThreadingHTTPServer((address, port), AnalysisRequestHandler)
+    server.daemon_threads = True
+    server.queue = JobQueue(max_workers=max_workers, metrics_dir=metrics_dir, app_log=app_log, max_finished_jobs=max_finished_jobs)
+    return server
+
+# client
+
+def submit_job(server_url, job):
+    response = requests.post(f'{server_url}/jobs', json=job)
+    if response.status_code != 201:
+        raise Exception(f"Job not accepted: {response.json().get('error')}")
+    return response.json()['job_id']
+
+def wait_for_job(server_url, job_id, log_message=print, poll_s=10):
+    """Streams the log lines of a job to log_message until it finishes. Returns the job status."""
+    since = 0
+    while True:
+        log = requests.get(f'{server_url}/jobs/{job_id}/log', params={'since': since, 'wait': poll_s}).json()
+        for line in log['lines']:
+            log_message(line)
+        since = log['next']
+        if log['status'] in ('ok', 'error'):
+            return requests.get(f'{server_url}/jobs/{job_id}').json()
+
+def main():
+    parser = argparse.ArgumentParser(description='Local analysis server with pre-warmed pylinac worker processes.')
+    parser.add_argument('--config', default='config.json', help='app config file (analysis_server)')
+    parser.add_argument('--address', help='listening address (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, help='listening port (default: 8765)')
+    parser.add_argument('--max-workers', type=int, help='number of worker processes')
+    parser.add_argument('--submit', metavar='JOB_JSON', help='submit a job spec file to a running server and wait for it')
+    args = parser.parse_args()
+
+    options = helper.read_json_file(args.config).get('analysis_server', {})
+
+    if args.submit:
+        server_url = f"http://{args.address or options.get('address', '127.0.0.1')}:{args.port or options.get('port', 8765)}"
+        job_id = submit_job(server_url, helper.read_json_file(args.submit))
+        status = wait_for_job(server_url, job_id)
+        print(json.dumps(status, indent=4))
+        return
+    server = create_server(address=args.address or options.get('address', '127.0.0.1'),
+                           port=args.port or options.get('port', 8765),
+                           max_workers=args.max_workers or options.get('max_workers', max(1, (os.cpu_count() or 2) // 2)),
+                           metrics_dir=logs_dir, app_log=True,
+                           max_finished_jobs=options.get('max_finished_jobs', 200))
+
+    logger.info(f'analysis server listening on http://{server.server_address[0]}:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    finally:
+        server.queue.shutdown()
+
+if __name__ == '__main__':
+    main()
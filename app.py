@@ -7,11 +7,12 @@ from tkinter import ttk  # For progress bar
 import threading
 import time
 
-from utils import helper, webservice
+from utils import helper, webservice, cases, timing, profiling, phantom_cache, artifact_store
 
 import importlib
 
 import sys
+import argparse
 
 import phantoms.catphan
 import phantoms.fc2
@@ -22,12 +23,16 @@ import phantoms.helper
 import phantoms.leedstor
 
 from dicom_chooser import DicomChooser, SelectionMode
+from log_bridge import LogBridge
 import dicom_helper
+import analysis_runner
+import session_runner
 
 SETTINGS_FILE = '_settings.json'
 APP_VERSION = '0.1.1'
 
 # Initialize the logger
+import app_logger
 from app_logger import logger
 
 # Splash Screen
@@ -60,7 +65,7 @@ def get_obj_id_list(objs):
     return [obj["id"] for obj in objs]
                   
 class PyLinacGuiApp:
-    def __init__(self, root):
+    def __init__(self, root, profile=False, trace_malloc=False):
         self.root = root
         self.root.title(f'PyLinac GUI {APP_VERSION}')
 
@@ -70,9 +75,27 @@ class PyLinacGuiApp:
         # Set the default font for all widgets
         self.root.option_add("*Font", "Helvetica 10")
 
+        # Log messages (from any thread) are queued and shown by the main loop
+        self.log_bridge = LogBridge(root)
+
         # Load saved settings
         self.settings = self.load_settings()
         self.config = self.load_config()
+        self.profiling_options = profiling.get_profiling_options(self.config, enabled=profile, trace_malloc=trace_malloc)
+
+        # session mode: worker pool (started on the first session) and the last session summary
+        self.session_executor = None
+        self.session_summary = None
+
+        # re-runs of the same input reuse the loaded (and analyzed) phantoms
+        cache_options = self.config.get('phantom_cache', {})
+        phantom_cache.configure(max_mb=cache_options.get('max_mb', 1024), enabled=cache_options.get('enabled', True))
+
+        # cases are written to local disk and published to the output folder in the background
+        self.store_options = artifact_store.get_options(self.config)
+        artifact_store.configure(enabled=self.store_options['enabled'], scratch_folder=self.store_options['scratch_folder'],
+                                 log_message=self.log, retry_delays_s=self.store_options['retry_delays_s'])
+        self.analysis_work_folder = None
     
         # Site, Device, and Phantom Selection Comboboxes
         self.selection_frame = tk.Frame(root)
@@ -170,6 +193,10 @@ class PyLinacGuiApp:
         self.run_button.pack(side=tk.LEFT, padx=5, pady=10)
         self.push_to_server_button = tk.Button(self.buttons_frame, text="Push to Server", command=self.record_result_thread, width=15)
         self.push_to_server_button.pack(side=tk.LEFT, padx=5, pady=10)
+        self.run_session_button = tk.Button(self.buttons_frame, text="Run Session", command=self.run_session_thread, width=15)
+        self.run_session_button.pack(side=tk.LEFT, padx=5, pady=10)
+        self.push_session_button = tk.Button(self.buttons_frame, text="Push Session", command=self.push_session_thread, width=15)
+        self.push_session_button.pack(side=tk.LEFT, padx=5, pady=10)
         self.buttons_frame.pack(expand=True)
        
         # Create a frame to hold the Text widget and the Scrollbar for log output
@@ -187,6 +214,9 @@ class PyLinacGuiApp:
         # Configure the Scrollbar to work with the Text widget
         self.scrollbar.config(command=self.log_output.yview)
 
+        self.log_bridge.set_text_widget(self.log_output)
+        self.log_bridge.start()
+
         # Create a frame to hold the status bar components
         self.status_frame = tk.Frame(root, relief=tk.SUNKEN, bd=1)
         self.status_frame.pack(side=tk.BOTTOM, fill=tk.X)
@@ -271,20 +301,7 @@ class PyLinacGuiApp:
     
 
     def load_phantom_config(self):
-        # config file path
-        current_dir = get_cwd()
-        
-        site = self.site().lower()
-        device = self.device().lower()
-        phantom = self.phantom().lower()
-
-        config_file = os.path.join(current_dir, f'config.{site}.{device}.{phantom}.json')
-
-        if not os.path.exists(config_file):
-            raise Exception(f"Error:Phantom config file not found. {config_file}")
-            return
-
-        return helper.read_json_file(config_file)
+        return analysis_runner.load_phantom_config(self.site(), self.device(), self.phantom(), config_dir=get_cwd())
     
     def populate_performed_by(self):
         users = self.config.get('users', [])
@@ -308,10 +325,8 @@ class PyLinacGuiApp:
             self.output_folder_path.config(text=folder)
 
     def log(self, message):
-        self.log_output.insert(tk.END, message + "\n")
-        self.log_output.see(tk.END)
-
-        logger.info(message)
+        # safe to call from worker threads
+        self.log_bridge.log(message)
 
     def select_dicom_image_2d(self):
         
@@ -378,85 +393,117 @@ class PyLinacGuiApp:
         #self.progress_label.config(text="Running analysis...")
         self.progress_bar.start()
 
+        # the widgets are read here, on the main thread
+        performed_by = self.performed_by_combobox.get()
+        performed_date = self.performed_date_entry.get()
+        user_notes = self.notes_text.get("1.0", tk.END).strip()
+
         # Run analysis in a separate thread
-        threading.Thread(target=self.run_analysis).start()
+        threading.Thread(target=self.run_analysis, args=(performed_by, performed_date, user_notes)).start()
 
-    def run_analysis(self):
+    def run_analysis(self, performed_by, performed_date, user_notes):
         try:
-            module = self.get_phantom_module()
-            self.phantom_config = self.load_phantom_config()
+            self.analysis_work_folder = None
+            profiler = None
+            if self.profiling_options['enabled']:
+                self.log('Profiling is on.')
+                profiler = profiling.Profiler(trace_malloc=self.profiling_options['tracemalloc'], top=self.profiling_options['top'])
+
+            with timing.record() as recorder:
+                if profiler:
+                    profiler.start()
+                try:
+                    with timing.span('run_analysis'):
+                        output_dir = self.run_phantom_analysis(performed_by, performed_date, user_notes)
+                finally:
+                    if profiler:
+                        profiler.stop()
+
+            if output_dir:
+                work_dir = self.analysis_work_folder
+                phantoms.helper.save_timings(recorder,
+                    output_dir=work_dir,
+                    metrics_dir=app_logger.logs_dir,
+                    log_message=self.log,
+                    stage='analysis',
+                    device_id=self.device_id(),
+                    phantom=self.phantom(),
+                    app_version=APP_VERSION)
+
+                if profiler:
+                    profiler.save(work_dir, recorder=recorder, log_message=self.log)
+
+                store = artifact_store.get_store()
+                if store:
+                    store.publish(work_dir, output_dir)
+
+        except Exception as e:
+            self.log(f"Error: {str(e)}")
+            store = artifact_store.get_store()
+            if store and self.analysis_work_folder:
+                store.discard(self.analysis_work_folder)
+        finally:
+            self.log_bridge.call_in_main(self.run_button.config, state=tk.NORMAL)
+            self.log_bridge.call_in_main(self.progress_bar.stop)
+
+    def run_phantom_analysis(self, performed_by, performed_date, user_notes):
+        # returns the case output folder, or None if nothing was analyzed
+        module = self.get_phantom_module()
+        self.phantom_config = self.load_phantom_config()
+
+        metadata = analysis_runner.get_metadata(self.phantom_config,
+                                                performed_by=performed_by,
+                                                performed_date=performed_date)
+
+        notes = analysis_runner.get_notes(self.phantom_config, user_notes)
 
-            metadata=self.phantom_config['publish_pdf_params']['metadata']
-            metadata['Performed By'] = self.performed_by_combobox.get()
-            metadata['Performed Date'] = self.performed_date_entry.get() 
+        dim = self.get_phantom_dim()
+        if dim == 2:
+
+            if self.selected_file == None or self.selected_file == "":
+                self.log('Please select an image first.')                 
+                return 
+            
+            input_files = [self.selected_file]
+        else: # 3d phantom
             
-            config_notes = self.phantom_config['publish_pdf_params'].get('notes', '')
-            user_notes =  self.notes_text.get("1.0", tk.END).strip()
+            if self.selected_series_name == None or self.selected_series_name == "":
+                self.log("Please select the phantom images first.")
+                return
 
-            notes = f'{user_notes}\n{config_notes}'                
+            input_files = self.selected_files
 
-            if self.get_phantom_dim() == 2:
+        # refuse or trim an inconsistent series before copying
+        input_files = analysis_runner.validate_input(module, dim, input_files, self.phantom_config, log_message=self.log)
 
-                if self.selected_file == None or self.selected_file == "":
-                    self.log('Please select an image first.')                 
-                    return 
-                
-                # case output folder
-                case_outdir = self.get_case_output_folder(self.selected_file)
+        # case output folder
+        store = artifact_store.get_store()
+        case_outdir = self.get_case_output_folder(input_files[0], create=store is None)
+        self.log(f'case output folder={case_outdir}')
 
-                import shutil
-                src_file = self.selected_file
-                dst_file = os.path.join(case_outdir, 'input.dcm')
-                shutil.copy(src_file, dst_file)
-                
-                self.analysis_input_file = dst_file
-                self.analysis_result_folder = case_outdir
+        # with an artifact store the case is written to local disk and published after the analysis
+        self.analysis_work_folder = store.stage(case_outdir) if store else case_outdir
 
-                
-                module.run_analysis(device_id=self.device_id(),
-                    input_file=self.analysis_input_file, 
-                    output_dir=self.analysis_result_folder, 
-                    config = self.phantom_config, 
-                    notes=notes, 
-                    metadata=metadata, 
-                    log_message=self.log
-                    )
-            else: # 3d phantom
-                
-                if self.selected_series_name == None or self.selected_series_name == "":
-                    self.log("Please select the phantom images first.")
-                    return
-                
-                # copy files to the output folder
-                # case output folder
-                case_outdir = self.get_case_output_folder(self.selected_files[0])
-                self.log(f'case output folder={case_outdir}')
-
-                import shutil
-                for i, src_file in enumerate(self.selected_files):
-                    dst_file = os.path.join(case_outdir, f'input_{str(i).zfill(3)}.dcm' )
-                    self.log(f'copying file...{src_file}-->{dst_file}')
-                    shutil.copy(src_file, dst_file)
-                
-                self.analysis_input_folder = case_outdir
-                self.analysis_result_folder = case_outdir
-                
-                
-                module.run_analysis(device_id=self.device_id(),
-                    input_dir = self.analysis_input_folder,
-                    output_dir=self.analysis_result_folder, 
-                    config = self.phantom_config, 
-                    notes=notes, 
-                    metadata=metadata, 
-                    log_message=self.log
-                    )
-                
+        # per-file lines only go to the log file
+        input_path = analysis_runner.stage_input(dim, input_files, self.analysis_work_folder, log_message=self.log, log_file=logger.debug)
 
-        except Exception as e:
-            self.log(f"Error: {str(e)}")
-        finally:
-            self.run_button.config(state=tk.NORMAL)
-            self.progress_bar.stop()
+        if dim == 2:
+            self.analysis_input_file = input_path
+        else:
+            self.analysis_input_folder = input_path
+        self.analysis_result_folder = case_outdir
+
+        analysis_runner.run_module(module, dim,
+            device_id=self.device_id(),
+            input_path=input_path,
+            case_dir=self.analysis_work_folder,
+            phantom_config=self.phantom_config,
+            notes=notes,
+            metadata=metadata,
+            log_message=self.log
+            )
+
+        return case_outdir
     
     def get_input_folder(self):
 
@@ -492,7 +539,7 @@ class PyLinacGuiApp:
         
         return folder
 
-    def get_case_output_folder(self, dicom_image_file):
+    def get_case_output_folder(self, dicom_image_file, create=True):
 
         try:
             self.log('Getting instance creation date time from the dicom file...')
@@ -504,7 +551,7 @@ class PyLinacGuiApp:
         # copy all selected files 
         folder = os.path.join(self.get_phantom_folder(), dt_str)
 
-        if not os.path.exists(folder):
+        if create and not os.path.exists(folder):
             self.log(f'folder not found. createing a folder: {folder}')
             os.makedirs(folder)
         
@@ -535,9 +582,14 @@ class PyLinacGuiApp:
 
     def on_closing(self):
         self.save_settings()
+        store = artifact_store.get_store()
+        if store and (not store.flush(timeout=self.store_options['close_timeout_s']) or store.pending() > 0):
+            logger.info(f'{store.pending()} cases not published yet, they are published on the next start.')
+        if self.session_executor is not None:
+            self.session_executor.shutdown(wait=False, cancel_futures=True)
         self.root.destroy()
 
-    def record_result_as_number1ds(self, result_data):
+    def record_result_as_number1ds(self, result_data, time=None):
         # Configuration
         url = self.config['webservice_url'] + '/number1ds'
         app = f'{helper.get_app_name()} {APP_VERSION}'
@@ -552,9 +604,10 @@ class PyLinacGuiApp:
             device_id=device_id,
             phantom_id=self.phantom().lower(),
             url=url,
-            log=self.log)
+            log=self.log,
+            time=time)
         
-    def record_result_as_string1ds(self, result_data):
+    def record_result_as_string1ds(self, result_data, time=None):
         # Configuration
         url = self.config['webservice_url'] + '/string1ds'
         app = f'{helper.get_app_name()} {APP_VERSION}'
@@ -569,10 +622,14 @@ class PyLinacGuiApp:
             device_id=device_id,
             phantom_id=self.phantom().lower(),
             url=url,
-            log=self.log)
+            log=self.log,
+            time=time)
 
     def record_result_thread(self):
-        if not hasattr(self, 'analysis_result_folder') or not os.path.exists(self.analysis_result_folder):
+        # a case still being published is waited for in record_result()
+        store = artifact_store.get_store()
+        publishing = store is not None and store.pending() > 0
+        if not hasattr(self, 'analysis_result_folder') or not (publishing or os.path.exists(self.analysis_result_folder)):
             self.log('Result folder not present. Please run your analysis first')
             return
 
@@ -580,6 +637,115 @@ class PyLinacGuiApp:
         threading.Thread(target=self.record_result).start()
 
 
+    def run_session_thread(self):
+        initdir = self.input_folder_path.cget('text')
+        folder = filedialog.askdirectory(initialdir=initdir if initdir.strip() != '' else None, title='Select the session folder')
+        if not folder:
+            return
+
+        self.progress_bar.start()
+        threading.Thread(target=self.classify_session, args=(folder,)).start()
+
+    def classify_session(self, folder):
+        try:
+            cases, unassigned = session_runner.classify_session([folder], self.config, self.site(), self.device(),
+                min_confidence=self.config.get('session', {}).get('min_confidence', 0.6), log_message=self.log)
+            for case in unassigned:
+                self.log(f"phantom not recognized, pick one in the session dialog: {case['files'][0]}")
+            self.log_bridge.call_in_main(self.show_session_dialog, cases + unassigned)
+        except Exception as e:
+            self.log(f"Error: {str(e)}")
+        finally:
+            self.log_bridge.call_in_main(self.progress_bar.stop)
+
+    def show_session_dialog(self, cases):
+        # one row per case, the phantom can be changed or the case left out;
+        # the files the classifier could not assign (phantom None) start as skipped
+        if len(cases) == 0:
+            self.log('No phantom images found in the session folder.')
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title('Session')
+        dialog.transient(self.root)
+
+        skip = '(skip)'
+        phantom_ids = get_obj_id_list(self.config['phantoms'])
+        comboboxes = []
+        for i, case in enumerate(cases):
+            name = os.path.basename(case['files'][0]) if len(case['files']) == 1 else f"{os.path.dirname(case['files'][0])} ({len(case['files'])} files)"
+            if case['phantom'] is None:
+                name += f" - one of {', '.join(case['candidates'])}?" if case.get('candidates') else ' - not recognized'
+            tk.Label(dialog, text=name, anchor='w').grid(row=i, column=0, sticky='w', padx=5, pady=2)
+            combobox = ttk.Combobox(dialog, values=phantom_ids + [skip], state='readonly')
+            combobox.set(case['phantom'] or skip)
+            combobox.grid(row=i, column=1, padx=5, pady=2)
+            comboboxes.append(combobox)
+
+        def run():
+            selected = [{'site': case['site'], 'device': case['device'], 'phantom': combobox.get(), 'files': case['files']}
+                        for case, combobox in zip(cases, comboboxes) if combobox.get() != skip]
+            dialog.destroy()
+            if len(selected) > 0:
+                # the widgets are read here, on the main thread
+                performed_by = self.performed_by_combobox.get()
+                performed_date = self.performed_date_entry.get()
+                notes = self.notes_text.get("1.0", tk.END).strip()
+                self.progress_bar.start()
+                threading.Thread(target=self.run_session, args=(selected, performed_by, performed_date, notes)).start()
+
+        buttons = tk.Frame(dialog)
+        buttons.grid(row=len(cases), column=0, columnspan=2, pady=5)
+        tk.Button(buttons, text='Run', command=run, width=10).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text='Cancel', command=dialog.destroy, width=10).pack(side=tk.LEFT, padx=5)
+
+    def run_session(self, cases, performed_by, performed_date, notes):
+        try:
+            options = self.config.get('session', {})
+            if self.session_executor is None:
+                self.session_executor = session_runner.create_executor(options.get('max_workers', max(1, (os.cpu_count() or 2) // 2)))
+
+            self.session_summary = session_runner.run_session(cases,
+                output_folder=self.get_output_folder(),
+                performed_by=performed_by,
+                performed_date=performed_date,
+                notes=notes,
+                metrics_dir=app_logger.logs_dir,
+                executor=self.session_executor,
+                log_message=self.log)
+            self.log(session_runner.format_session_summary(self.session_summary))
+        except Exception as e:
+            self.log(f"Error: {str(e)}")
+        finally:
+            self.log_bridge.call_in_main(self.progress_bar.stop)
+
+    def push_session_thread(self):
+        if self.session_summary is None:
+            self.log('No session to push. Please run a session first.')
+            return
+
+        threading.Thread(target=self.push_session).start()
+
+    def push_session(self):
+        self.log_bridge.call_in_main(self.progress_bar.start)
+        try:
+            with timing.record() as recorder:
+                numbers, strings = session_runner.push_session(self.session_summary, self.config,
+                                                               app=f'{helper.get_app_name()} {APP_VERSION}', log_message=self.log)
+            self.log(f'Session pushed: {numbers} numbers, {strings} strings.')
+
+            timing.append_timings(app_logger.logs_dir, {
+                'stage': 'push_session',
+                'device_id': f"{self.session_summary['site']}|{self.session_summary['device']}",
+                'phantom': 'session',
+                'app_version': APP_VERSION,
+                'output_dir': self.session_summary.get('session_dir'),
+                **recorder.to_dict()})
+        except Exception as e:
+            self.log(f"Error: {str(e)}")
+        finally:
+            self.log_bridge.call_in_main(self.progress_bar.stop)
+
     def get_phantom_module(self):
         module_name =f'phantoms.{self.phantom().lower()}'
         self.log(f'Loading module...{module_name}')
@@ -592,39 +758,64 @@ class PyLinacGuiApp:
         
         # Show progress
         #self.progress_label.config(text="Pushing data to server...")
-        self.progress_bar.start()
+        self.log_bridge.call_in_main(self.progress_bar.start)
 
         try:
             #phantom_module = self.get_phantom_module()
 
             #result_data = phantom_module.push_to_server(result_folder=self.analysis_result_folder, config = self.config, log_message=self.log)
 
+            store = artifact_store.get_store()
+            if store and store.pending() > 0:
+                self.log('waiting for the case folder to be published...')
+                store.flush()
+                if not os.path.exists(self.analysis_result_folder):
+                    raise Exception('The case folder is not published yet (the output folder is not reachable). Try again later.')
+
             url = self.config['webservice_url'] +f'/{self.phantom().lower()}results'
             
-            result_data = webservice.post_analysis_result(result_folder=self.analysis_result_folder, config = self.config, url=url, log_message=self.log)   
-            
+            with timing.record() as recorder:
+                result_data = webservice.post_analysis_result(result_folder=self.analysis_result_folder, config = self.config, url=url, log_message=self.log)   
+                
 
-            self.record_result_as_number1ds(result_data)
-            
-            self.record_result_as_string1ds(result_data)
+                # stamp the metrics with the image acquisition time, not the push time
+                acquisition_time = cases.get_case_datetime(self.analysis_result_folder, log_message=self.log)
+
+                with timing.span('post_number1ds'):
+                    self.record_result_as_number1ds(result_data, time=acquisition_time)
+                
+                with timing.span('post_string1ds'):
+                    self.record_result_as_string1ds(result_data, time=acquisition_time)
+
+            timing.append_timings(app_logger.logs_dir, {
+                'stage': 'push',
+                'device_id': self.device_id(),
+                'phantom': self.phantom(),
+                'app_version': APP_VERSION,
+                'output_dir': self.analysis_result_folder,
+                **recorder.to_dict()})
 
         except Exception as e:
             self.log(f"Error: {str(e)}")
-            self.progress_bar.stop()
 
         finally:
             # Re-enable the button and stop progress indicator
-            self.push_to_server_button.config(state=tk.NORMAL)
+            self.log_bridge.call_in_main(self.push_to_server_button.config, state=tk.NORMAL)
             #self.progress_label.config(text="Pushing to the server completed!")
-            self.progress_bar.stop()
+            self.log_bridge.call_in_main(self.progress_bar.stop)
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profile', action='store_true', help='save cProfile stats and a chrome trace in the case folder')
+    parser.add_argument('--tracemalloc', action='store_true', help='also save the top memory allocations (implies --profile)')
+    args, _ = parser.parse_known_args()
+
     # Show the splash screen first
     show_splash_screen()
 
     # Start the main application after splash
     root = tk.Tk()
-    app = PyLinacGuiApp(root)
+    app = PyLinacGuiApp(root, profile=args.profile, trace_malloc=args.tracemalloc)
     root.mainloop()
 
 # Main Application
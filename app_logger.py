@@ -1,7 +1,9 @@
 # logger_setup.py (a separate file)
 import os
+import queue
+import atexit
 import logging
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 from datetime import datetime
 
 # Ensure the _logs directory exists
@@ -22,15 +24,26 @@ handler = TimedRotatingFileHandler(
     backupCount=30  # Keep logs for 30 days
 )
 
+formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(formatter)
+
+# Loggers only put records on the queue, the listener thread writes them to the file and console,
+# so logging from worker threads never blocks on disk I/O.
+log_queue = queue.Queue(-1)
+listener = QueueListener(log_queue, handler, stream_handler, respect_handler_level=True)
+
 # Set up logging
 logging.basicConfig(
     level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        handler,
-        logging.StreamHandler()
+        QueueHandler(log_queue)
     ]
 )
 
+listener.start()
+atexit.register(listener.stop)
+
 # Global logger object
 logger = logging.getLogger(__name__)
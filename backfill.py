@@ -0,0 +1,172 @@
+import os
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from utils import helper, webservice
+from utils.cases import find_case_folders, read_case_result, get_case_datetime
+from utils.checkpoint import Checkpoint
+from utils.model import convert_kvps_to_number1d_or_stirng1d_list
+from utils.object import flatten
+
+from app_logger import logger
+
+APP_VERSION = '0.1.1'
+
+def build_case_records(case, app, log_message):
+    result_data = read_case_result(case['case_dir'])
+    if result_data is None:
+        log_message(f"result.json not found. skipping... {case['case_dir']}")
+        return [], []
+
+    dt = get_case_datetime(case['case_dir'], log_message)
+
+    # device_id in the result keeps the original site/device case (site|device)
+    device_id = result_data.get('device_id', f"{case['site']}|{case['device']}")
+    key_prefix = f"{case['phantom'].lower()}_"
+
+    # flatten once, then split numbers and strings
+    kvps = flatten(result_data)
+    number_kvps = [item for item in kvps if not isinstance(item['value'], str)]
+    string_kvps = [item for item in kvps if isinstance(item['value'], str)]
+
+    number1ds = convert_kvps_to_number1d_or_stirng1d_list(key_value_pairs=number_kvps,
+                                                            key_prefix=key_prefix,
+                                                            device_id=device_id,
+                                                            app=app,
+                                                            time=dt)
+    string1ds = convert_kvps_to_number1d_or_stirng1d_list(key_value_pairs=string_kvps,
+                                                            key_prefix=key_prefix,
+                                                            device_id=device_id,
+                                                            app=app,
+                                                            time=dt)
+    return number1ds, string1ds
+
+def backfill(cases, webservice_url, checkpoint, app, batch_size=5000, max_workers=4, log_message=print):
+    """Pushes the metrics of the cases to the number1ds/string1ds endpoints.
+
+    Records of several cases are combined into batches of up to batch_size objects,
+    and at most max_workers batches are posted at the same time.
+    A case is written to the checkpoint once all the batches holding its records are posted.
+    """
+    urls = {
+        'number1ds': webservice_url + '/number1ds',
+        'string1ds': webservice_url + '/string1ds'
+    }
+
+    pending = {kind: {'records': [], 'cases': set()} for kind in urls}
+    outstanding = {}  # case_dir -> number of batches not posted yet
+    in_flight = {}    # future -> (kind, cases of the batch)
+    failed = set()
+
+    def release(case_dir):
+        outstanding[case_dir] -= 1
+        if outstanding[case_dir] == 0:
+            del outstanding[case_dir]
+            if case_dir not in failed:
+                checkpoint.mark_done(case_dir)
+
+    def on_batch_done(future):
+        kind, batch_cases = in_flight.pop(future)
+        try:
+            future.result()
+        except Exception as e:
+            log_message(f'Error: posting {kind} batch failed - {e}')
+            failed.update(batch_cases)
+
+        for case_dir in batch_cases:
+            release(case_dir)
+
+    def submit(executor, kind):
+        batch = pending[kind]
+        if len(batch['records']) == 0:
+            return
+
+        # bounded concurrency - wait for a slot before submitting another batch
+        while len(in_flight) >= max_workers:
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                on_batch_done(future)
+
+        log_message(f"posting {len(batch['records'])} {kind} of {len(batch['cases'])} cases...")
+        future = executor.submit(webservice.post, batch['records'], urls[kind])
+        in_flight[future] = (kind, batch['cases'])
+        pending[kind] = {'records': [], 'cases': set()}
+
+    num_cases = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for case in cases:
+            case_dir = case['case_dir']
+            if checkpoint.is_done(case_dir):
+                continue
+
+            try:
+                number1ds, string1ds = build_case_records(case, app, log_message)
+            except Exception as e:
+                # not checkpointed: the case is tried again on the next run
+                log_message(f'Error: reading the results of {case_dir} failed - {e}')
+                failed.add(case_dir)
+                continue
+
+            if len(number1ds) == 0 and len(string1ds) == 0:
+                continue
+
+            num_cases += 1
+            # hold the case until all its batches are submitted
+            outstanding[case_dir] = 1
+            for kind, records in (('number1ds', number1ds), ('string1ds', string1ds)):
+                if len(records) == 0:
+                    continue
+
+                outstanding[case_dir] += 1
+                pending[kind]['records'].extend(records)
+                pending[kind]['cases'].add(case_dir)
+
+                if len(pending[kind]['records']) >= batch_size:
+                    submit(executor, kind)
+            release(case_dir)
+
+        for kind in urls:
+            submit(executor, kind)
+
+        while len(in_flight) > 0:
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                on_batch_done(future)
+
+    log_message(f'Backfill completed. cases={num_cases}, failed={len(failed)}')
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description='Push the metrics of existing case folders with their acquisition time.')
+    parser.add_argument('--config', default='config.json', help='app config file (webservice_url, output_folder)')
+    parser.add_argument('--output-folder', help='case folder root (default: output_folder in the config)')
+    parser.add_argument('--site')
+    parser.add_argument('--device')
+    parser.add_argument('--phantom')
+    parser.add_argument('--checkpoint', default='_backfill_checkpoint.txt', help='file of the cases already pushed')
+    parser.add_argument('--batch-size', type=int, default=5000, help='number of objects per POST')
+    parser.add_argument('--max-workers', type=int, default=4, help='number of concurrent POSTs')
+    args = parser.parse_args()
+
+    config = helper.read_json_file(args.config)
+    output_folder = args.output_folder or config['output_folder']
+
+    def log_message(message):
+        logger.info(message)
+
+    cases = find_case_folders(output_folder, site=args.site, device=args.device, phantom=args.phantom)
+    log_message(f'{len(cases)} case folders found in {output_folder}')
+
+    checkpoint = Checkpoint(args.checkpoint)
+    log_message(f'{len(checkpoint)} cases already pushed (checkpoint={os.path.abspath(args.checkpoint)})')
+
+    backfill(cases=cases,
+             webservice_url=config['webservice_url'],
+             checkpoint=checkpoint,
+             app=f'{helper.get_app_name()} {APP_VERSION}',
+             batch_size=args.batch_size,
+             max_workers=args.max_workers,
+             log_message=log_message)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import re
+import time
+import random
+
+from utils.object import flatten
+
+def make_result(num_rois=200, mtf_points=500, depth=6):
+    # a CatPhan-like results_data() dict with per-ROI dicts, MTF arrays and deep nesting
+    rnd = random.Random(0)
+    result = {
+        'catphan_model': '504',
+        'ctp404': {
+            'hu_rois': {f'ROI {i}': {'value': rnd.uniform(-1000, 1000), 'stdev': rnd.random(), 'passed': 'True'} for i in range(num_rois)},
+        },
+        'ctp528': {
+            'mtf_lp_mm': [rnd.random() for _ in range(mtf_points)],
+            'roi_settings': [{'angle': rnd.uniform(0, 360), 'distance': rnd.random()} for _ in range(num_rois)],
+        },
+    }
+
+    nested = result
+    for level in range(depth):
+        nested[f'level {level}'] = {'value-1': rnd.random(), 'name': f'level{level}'}
+        nested = nested[f'level {level}']
+
+    return result
+
+def legacy_traverse_and_collect_numbers_strings(obj, parent_key='', result=None):
+    # the recursive walker flatten() replaced: re.sub per key, sort per level, lists dropped
+    if result is None:
+        result = []
+
+    for key, value in obj.items():
+        full_key = f"{parent_key}_{key}" if parent_key else key
+        full_key = re.sub(r'[^a-zA-Z0-9_]', '_', full_key)
+
+        if isinstance(value, (int, float, str)):
+            result.append({'key': full_key, 'value': value})
+        elif isinstance(value, dict):
+            legacy_traverse_and_collect_numbers_strings(value, full_key, result)
+
+    return sorted(result, key=lambda x: x['key'])
+
+def bench(func, obj, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        kvps = func(obj)
+    elapsed = time.perf_counter() - t0
+    return {'runs_per_sec': repeat / elapsed, 'num_kvps': len(kvps)}
+
+def run(repeat=20):
+    result = make_result()
+    return {
+        'flatten': bench(flatten, result, repeat),
+        'legacy': bench(legacy_traverse_and_collect_numbers_strings, result, repeat),
+    }
+
+if __name__ == '__main__':
+    for name, stats in run().items():
+        print(f"{name}: {stats['runs_per_sec']:.1f} runs/s, {stats['num_kvps']} key value pairs")
@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import glob
+import socket
+import argparse
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+from utils import helper
+
+RESULTS_DIR = os.path.join(REPO_DIR, 'benchmarks', 'results')
+
+def get_baseline_file(hostname):
+    return os.path.join(RESULTS_DIR, f'baseline_{hostname}.json')
+
+def get_history_file(hostname):
+    return os.path.join(RESULTS_DIR, f'history_{hostname}.jsonl')
+
+def compare(current, baseline, threshold=0.2, min_seconds=0.01, memory_threshold=None):
+    """Compares two benchmark reports.
+
+    A benchmark total (mean_s) or stage is a regression when it is slower than the baseline by more
+    than threshold (0.2 = 20%). Times below min_seconds in the baseline are ignored as noise.
+    If memory_threshold is given, peak RSS increases above it are reported too.
+    A benchmark that was 'ok' in the baseline and is not 'ok' now (error, skipped or missing) is a
+    regression of stage 'status'.
+    Returns a list of {'benchmark', 'stage', 'baseline', 'current', 'change'} rows.
+    """
+    regressions = []
+
+    def check(benchmark, stage, base_value, value, limit, min_value):
+        if base_value is None or value is None or base_value < min_value:
+            return
+        change = value / base_value - 1.0
+        if change > limit:
+            regressions.append({
+                'benchmark': benchmark,
+                'stage': stage,
+                'baseline': base_value,
+                'current': value,
+                'change': round(change, 4)
+            })
+
+    for name, base in baseline['benchmarks'].items():
+        status = current['benchmarks'].get(name, {}).get('status', 'missing')
+        if base.get('status') == 'ok' and status != 'ok':
+            regressions.append({'benchmark': name, 'stage': 'status', 'baseline': 'ok', 'current': status, 'change': None})
+
+    for name, stats in current['benchmarks'].items():
+        base = baseline['benchmarks'].get(name)
+        if base is None or stats.get('status') != 'ok' or base.get('status') != 'ok':
+            continue
+
+        check(name, 'total', base.get('mean_s'), stats.get('mean_s'), threshold, min_seconds)
+
+        for stage, value in stats.get('stages', {}).items():
+            check(name, stage, base.get('stages', {}).get(stage), value, threshold, min_seconds)
+
+        if memory_threshold is not None:
+            check(name, 'peak_rss_mb', base.get('peak_rss_mb'), stats.get('peak_rss_mb'), memory_threshold, 0)
+
+    return regressions
+
+def append_history(report, history_file):
+    # one compact line per run: versions and the mean times
+    entry = {
+        'time': report['time'],
+        'packages': report['machine']['packages'],
+        'benchmarks': {
+            name: {'mean_s': stats.get('mean_s'), 'peak_rss_mb': stats.get('peak_rss_mb'), 'stages': stats.get('stages', {})}
+            for name, stats in report['benchmarks'].items() if stats.get('status') == 'ok'
+        }
+    }
+    # comparing the same report again does not add it twice
+    if os.path.exists(history_file):
+        with open(history_file, 'r') as file:
+            if any(json.loads(line).get('time') == report['time'] for line in file if line.strip()):
+                return
+
+    with open(history_file, 'a') as file:
+        file.write(json.dumps(entry) + '\n')
+
+def find_latest_report(hostname):
+    files = sorted(glob.glob(os.path.join(RESULTS_DIR, f'{hostname}_*.json')))
+    if len(files) == 0:
+        raise Exception(f'No benchmark results for {hostname} in {RESULTS_DIR}. Run python -m benchmarks.run_benchmarks first.')
+    return files[-1]
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare a benchmark run with the baseline of this machine.')
+    parser.add_argument('report', nargs='?', help='benchmark result JSON (default: the latest result of this machine)')
+    parser.add_argument('--run', action='store_true', help='run the benchmarks first')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', help='baseline JSON (default: benchmarks/results/baseline_<hostname>.json)')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown, 0.2 = 20%%')
+    parser.add_argument('--min-seconds', type=float, default=0.01, help='ignore stages faster than this in the baseline')
+    parser.add_argument('--memory-threshold', type=float, help='allowed peak RSS increase, e.g. 0.2 = 20%%')
+    parser.add_argument('--update-baseline', action='store_true', help='save the report as the new baseline')
+    args = parser.parse_args()
+
+    hostname = socket.gethostname()
+    if not os.path.exists(RESULTS_DIR):
+        os.makedirs(RESULTS_DIR)
+
+    if args.run:
+        from benchmarks.run_benchmarks import run_benchmarks
+        from datetime import datetime
+
+        report = run_benchmarks(repeat=args.repeat)
+        report_file = os.path.join(RESULTS_DIR, f"{hostname}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        helper.write_json_file(report_file, report, indent=4)
+    else:
+        report_file = args.report or find_latest_report(hostname)
+        report = helper.read_json_file(report_file)
+
+    print(f'report: {report_file}')
+    append_history(report, get_history_file(report['machine']['hostname']))
+
+    baseline_file = args.baseline or get_baseline_file(report['machine']['hostname'])
+    if args.update_baseline or not os.path.exists(baseline_file):
+        helper.write_json_file(baseline_file, report, indent=4)
+        print(f'baseline saved: {baseline_file}')
+        return 0
+
+    baseline = helper.read_json_file(baseline_file)
+    print(f'baseline: {baseline_file} ({baseline["time"]})')
+
+    for package, version in report['machine']['packages'].items():
+        base_version = baseline['machine']['packages'].get(package)
+        if version != base_version:
+            print(f'  {package}: {base_version} -> {version}')
+
+    regressions = compare(report, baseline, threshold=args.threshold, min_seconds=args.min_seconds,
+                          memory_threshold=args.memory_threshold)
+
+    if len(regressions) == 0:
+        print(f'No regressions (threshold={args.threshold:.0%}).')
+        return 0
+
+    print(f'{len(regressions)} regressions (threshold={args.threshold:.0%}):')
+    for r in regressions:
+        change = '' if r['change'] is None else f" (+{r['change']:.0%})"
+        print(f"  {r['benchmark']}/{r['stage']}: {r['baseline']} -> {r['current']}{change}")
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,293 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import socket
+import zipfile
+import argparse
+import platform
+import tempfile
+import importlib
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+# run from the repository root: python -m benchmarks.run_benchmarks
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+from utils import helper, timing
+
+FIXTURES_DIR = os.path.join(REPO_DIR, 'benchmarks', 'fixtures')
+RESULTS_DIR = os.path.join(REPO_DIR, 'benchmarks', 'results')
+
+class SkipBenchmark(Exception):
+    pass
+
+def measure(func, repeat):
+    """Runs func() repeat times, each under a timing recorder. Returns throughput and mean stage times."""
+    totals = []
+    stages = {}
+    for _ in range(repeat):
+        with timing.record() as recorder:
+            t0 = time.perf_counter()
+            func()
+            totals.append(time.perf_counter() - t0)
+
+        for name, stage in recorder.to_dict()['stages'].items():
+            stages.setdefault(name, []).append(stage['wall_s'])
+
+    total_s = sum(totals)
+    return {
+        'runs': repeat,
+        'total_s': round(total_s, 4),
+        'mean_s': round(total_s / repeat, 4),
+        'min_s': round(min(totals), 4),
+        'runs_per_sec': round(repeat / total_s, 4) if total_s > 0 else None,
+        'stages': {name: round(sum(values) / len(values), 4) for name, values in stages.items()}
+    }
+
+def bench_flatten(repeat, **kwargs):
+    from benchmarks.bench_flatten import make_result
+    from utils.object import flatten
+
+    result = make_result()
+    return measure(lambda: flatten(result), repeat)
+
+def bench_parse_dicom_directory(repeat, num_files=2000, **kwargs):
+    from benchmarks.synthetic import write_ct_series
+    import dicom_helper
+
+    work_dir = tempfile.mkdtemp(prefix='bench_dicom_')
+    try:
+        # several series in one flat folder, like a linac export folder
+        num_series = 10
+        for s in range(num_series):
+            write_ct_series(work_dir, num_files // num_series, size=8, z0=s * 1000.0)
+            for file in glob.glob(os.path.join(work_dir, 'CT_*.dcm')):
+                os.rename(file, os.path.join(work_dir, f's{s:02d}_{os.path.basename(file)}'))
+
+        stats = measure(lambda: dicom_helper.parse_dicom_directory(work_dir), repeat)
+        stats['num_files'] = len(os.listdir(work_dir))
+        stats['files_per_sec'] = round(stats['num_files'] / stats['mean_s'], 1)
+        return stats
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def bench_webservice_push(repeat, **kwargs):
+    from benchmarks.bench_flatten import make_result
+    from benchmarks.stub_server import StubServer
+    from utils import webservice
+
+    work_dir = tempfile.mkdtemp(prefix='bench_push_')
+    try:
+        result_folder = os.path.join(work_dir, 'case')
+        temp_folder = os.path.join(work_dir, 'temp')
+        os.makedirs(result_folder)
+        os.makedirs(temp_folder)
+        helper.write_json_file(os.path.join(result_folder, 'result.json'), make_result(), indent=4)
+
+        with StubServer() as server:
+            config = {'webservice_url': server.url, 'temp_folder': temp_folder}
+
+            def push():
+                result_data = webservice.post_analysis_result(result_folder=result_folder, config=config,
+                                                              url=server.url + '/catphanresults', log_message=lambda m: None)
+                for post, endpoint in ((webservice.post_result_as_number1ds, '/number1ds'),
+                                       (webservice.post_result_as_string1ds, '/string1ds')):
+                    post(result_data=result_data, app='bench', site_id='SITE', device_id='Device', phantom_id='catphan',
+                         url=server.url + endpoint, log=lambda m: None)
+
+            stats = measure(push, repeat)
+            stats['num_requests'] = len(server.requests)
+            return stats
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def get_phantom_class(phantom_id, config):
+    import pylinac
+
+    if phantom_id == 'CatPhan':
+        return getattr(pylinac, f"CatPhan{config['catphan_model']}")
+
+    return {
+        'QC3': pylinac.StandardImagingQC3,
+        'QCkV': pylinac.StandardImagingQCkV,
+        'FC2': pylinac.StandardImagingFC2,
+        'LeedsTOR': pylinac.LeedsTOR,
+        'LasVegas': pylinac.LasVegas,
+    }[phantom_id]
+
+def find_phantom_config(phantom_id):
+    files = sorted(glob.glob(os.path.join(REPO_DIR, f'config.*.*.{phantom_id.lower()}.json')))
+    if len(files) == 0:
+        raise SkipBenchmark(f'no phantom config file for {phantom_id}')
+
+    config = helper.read_json_file(files[0])
+    config['publish_pdf_params']['open_file'] = False
+    config['publish_pdf_params']['logo'] = os.path.join(REPO_DIR, 'logo.jpg')
+    return config
+
+def find_fixture(phantom_id, dim, config, fixtures_dir, work_dir, demo=False):
+    """Returns the input file (2D) or folder (3D) of a phantom.
+
+    Stored fixtures (fixtures_dir/<phantom id>/) are used first, then the pylinac demo images if demo is set.
+    Otherwise a synthetic input is generated in work_dir, so the benchmark also runs offline.
+    """
+    fixture_dir = os.path.join(fixtures_dir, phantom_id.lower())
+    if os.path.isdir(fixture_dir):
+        files = sorted(glob.glob(os.path.join(fixture_dir, '*.dcm')))
+        if len(files) > 0:
+            return fixture_dir if dim == 3 else files[0]
+
+    if demo:
+        from pylinac.core.io import retrieve_demo_file
+
+        phantom_class = get_phantom_class(phantom_id, config)
+        try:
+            if dim == 3:
+                demo_zip = retrieve_demo_file(name=phantom_class._demo_url)
+                with zipfile.ZipFile(demo_zip) as zf:
+                    zf.extractall(fixture_dir)
+                return fixture_dir
+
+            return str(retrieve_demo_file(name=phantom_class._demo_filename))
+        except Exception as e:
+            raise SkipBenchmark(f'no fixture in {fixture_dir} and the pylinac demo image is not available ({e})')
+
+    from benchmarks.synthetic import write_phantom_input
+
+    return write_phantom_input(os.path.join(work_dir, 'input'), phantom_id, config)
+
+def bench_phantom(repeat, phantom_id, fixtures_dir=FIXTURES_DIR, demo=False, **kwargs):
+    app_config = helper.read_json_file(os.path.join(REPO_DIR, 'config.json'))
+    dim = next(p['dim'] for p in app_config['phantoms'] if p['id'] == phantom_id)
+
+    config = find_phantom_config(phantom_id)
+    module = importlib.import_module(f'phantoms.{phantom_id.lower()}')
+    metadata = {'Performed By': 'benchmark', 'Performed Date': datetime.now().strftime('%Y-%m-%d')}
+
+    work_dir = tempfile.mkdtemp(prefix=f'bench_{phantom_id.lower()}_')
+    if 'localization' in config:
+        config['localization']['store'] = os.path.join(work_dir, 'localization')
+    run = {'n': 0}
+
+    def analyze():
+        run['n'] += 1
+        output_dir = os.path.join(work_dir, 'phantom', f'run{run["n"]}')
+        if dim == 3:
+            module.run_analysis(device_id='BENCH|Device', input_dir=input_path, output_dir=output_dir,
+                                config=config, notes='', metadata=metadata, log_message=lambda m: None)
+        else:
+            module.run_analysis(device_id='BENCH|Device', input_file=input_path, output_dir=output_dir,
+                                config=config, notes='', metadata=metadata, log_message=lambda m: None)
+
+    try:
+        input_path = find_fixture(phantom_id, dim, config, fixtures_dir, work_dir, demo=demo)
+        stats = measure(analyze, repeat)
+        stats['input'] = 'synthetic' if input_path.startswith(work_dir) else input_path
+        return stats
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def get_benchmarks():
+    app_config = helper.read_json_file(os.path.join(REPO_DIR, 'config.json'))
+    benchmarks = {
+        'flatten': (bench_flatten, {}),
+        'parse_dicom_directory': (bench_parse_dicom_directory, {}),
+        'webservice_push': (bench_webservice_push, {}),
+    }
+    for phantom in app_config['phantoms']:
+        benchmarks[f"phantom_{phantom['id'].lower()}"] = (bench_phantom, {'phantom_id': phantom['id']})
+    return benchmarks
+
+def _run_benchmark(name, repeat, options):
+    # runs in a fresh process, so the peak RSS belongs to this benchmark only
+    func, kwargs = get_benchmarks()[name]
+    try:
+        stats = func(repeat=repeat, **kwargs, **options)
+        stats['status'] = 'ok'
+    except SkipBenchmark as e:
+        stats = {'status': 'skipped', 'reason': str(e)}
+    except Exception as e:
+        stats = {'status': 'error', 'reason': f'{type(e).__name__}: {e}'}
+    stats['peak_rss_mb'] = timing.get_peak_rss_mb()
+    return stats
+
+def get_machine_info():
+    versions = {}
+    for package in ('pylinac', 'pydicom', 'numpy', 'matplotlib', 'scipy'):
+        try:
+            versions[package] = importlib.import_module(package).__version__
+        except Exception:
+            versions[package] = None
+
+    return {
+        'hostname': socket.gethostname(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'packages': versions
+    }
+
+def run_benchmarks(names=None, repeat=3, options=None, log_message=print):
+    benchmarks = get_benchmarks()
+    names = names or list(benchmarks)
+    options = options or {}
+
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for name in names:
+        if name not in benchmarks:
+            raise Exception(f'Unknown benchmark: {name}. Available: {", ".join(benchmarks)}')
+
+        log_message(f'running {name}...')
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results[name] = executor.submit(_run_benchmark, name, repeat, options).result()
+
+        stats = results[name]
+        if stats['status'] == 'ok':
+            log_message(f"  {stats['runs_per_sec']} runs/s, mean {stats['mean_s']}s, peak rss {stats['peak_rss_mb']:.0f} MB")
+        else:
+            log_message(f"  {stats['status']}: {stats['reason']}")
+
+    return {
+        'time': datetime.now().isoformat(),
+        'machine': get_machine_info(),
+        'repeat': repeat,
+        'benchmarks': results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the phantom analyses, DICOM scanning and the webservice push.')
+    parser.add_argument('names', nargs='*', help='benchmarks to run (default: all)')
+    parser.add_argument('--list', action='store_true', help='list the benchmarks')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--num-files', type=int, default=2000, help='number of DICOM files for parse_dicom_directory')
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help='folder of <phantom id>/ input fixtures')
+    parser.add_argument('--demo', action='store_true', help='use the pylinac demo images when there is no fixture (downloads them)')
+    parser.add_argument('--output', help='result JSON file (default: benchmarks/results/<hostname>_<datetime>.json)')
+    args = parser.parse_args()
+
+    if args.list:
+        print('\n'.join(get_benchmarks()))
+        return
+
+    options = {'num_files': args.num_files, 'fixtures_dir': args.fixtures, 'demo': args.demo}
+    report = run_benchmarks(names=args.names, repeat=args.repeat, options=options)
+
+    output = args.output
+    if not output:
+        if not os.path.exists(RESULTS_DIR):
+            os.makedirs(RESULTS_DIR)
+        output = os.path.join(RESULTS_DIR, f"{report['machine']['hostname']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
+    helper.write_json_file(output, report, indent=4)
+    print(f'results saved: {output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+import os
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+CT_IMAGE_STORAGE = '1.2.840.10008.5.1.4.1.1.2'
+RT_IMAGE_STORAGE = '1.2.840.10008.5.1.4.1.1.481.1'
+
+def write_dicom(file_path, pixels, modality='CT', **attributes):
+    """Writes a minimal, valid DICOM image of uint16 pixels. attributes are set on the dataset as-is."""
+    pixels = np.asarray(pixels, dtype=np.uint16)
+
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = CT_IMAGE_STORAGE if modality == 'CT' else RT_IMAGE_STORAGE
+    file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = file_meta
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+
+    ds.SOPClassUID = file_meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    ds.Modality = modality
+    ds.PatientName = 'QA^Phantom'
+    ds.PatientID = 'QA'
+    ds.StudyInstanceUID = generate_uid()
+    ds.SeriesInstanceUID = generate_uid()
+    ds.StudyDate = ds.SeriesDate = ds.AcquisitionDate = ds.InstanceCreationDate = '20240101'
+    ds.StudyTime = ds.SeriesTime = ds.AcquisitionTime = ds.InstanceCreationTime = '080000'
+
+    ds.Rows, ds.Columns = pixels.shape
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 0
+    ds.PixelData = pixels.tobytes()
+
+    for key, value in attributes.items():
+        setattr(ds, key, value)
+
+    ds.save_as(file_path, write_like_original=False)
+    return file_path
+
+def write_ct_series(folder, num_slices, slice_thickness=2.0, z0=0.0, size=32, pixel_spacing=0.5, **attributes):
+    """Writes a CT series with one file per slice, positioned along z. Returns the file paths."""
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    study_uid = generate_uid()
+    series_uid = generate_uid()
+    files = []
+    for i in range(num_slices):
+        z = z0 + i * slice_thickness
+        file = os.path.join(folder, f'CT_{i:04d}.dcm')
+        slice_attributes = dict(StudyInstanceUID=study_uid,
+                                SeriesInstanceUID=series_uid,
+                                InstanceNumber=i + 1,
+                                ImagePositionPatient=[0.0, 0.0, z],
+                                ImageOrientationPatient=[1, 0, 0, 0, 1, 0],
+                                PixelSpacing=[pixel_spacing, pixel_spacing],
+                                SliceThickness=slice_thickness,
+                                AcquisitionNumber=1)
+        slice_attributes.update(attributes)
+        files.append(write_dicom(file, np.full((size, size), i % 4096), modality='CT', **slice_attributes))
+
+    return files
+
+def make_phantom_image(shape='rectangle', size=400, angle=np.pi / 4, seed=0):
+    """A noisy 2D image of a dark rectangle (plate phantoms) or disc (Leeds TOR) on a bright background."""
+    yy, xx = np.indices((size, size)) - size / 2
+    rng = np.random.default_rng(seed)
+    if shape == 'disc':
+        phantom = xx ** 2 + yy ** 2 < (size * 0.3) ** 2
+    else:
+        u = xx * np.cos(angle) + yy * np.sin(angle)
+        v = -xx * np.sin(angle) + yy * np.cos(angle)
+        phantom = (np.abs(u) < size * 0.25) & (np.abs(v) < size * 0.18)
+    return np.where(phantom, 20000, 40000) + rng.normal(0, 100, (size, size))
+
+# planar phantom outlines (bounding box in mm, rotation in degrees, plate aspect ratio) that pylinac localizes
+PLANAR_OUTLINES = {
+    'QC3': ('rectangle', 168.0, 45.0, 7.5 / 6),
+    'QCkV': ('rectangle', 142.0, 45.0, 7.8 / 6.4),
+    'LasVegas': ('rectangle', np.sqrt(20260), 0.0, 1.0),
+    'LeedsTOR': ('disc', 148.0, 0.0, 1.0),
+}
+
+def write_fc2_image(file_path):
+    """A light/radiation field image with 4 BBs, as generated by pylinac for its FC2 tests."""
+    from pylinac.core.image_generator import AS1000Image, FilteredFieldLayer
+    from pylinac.core.image_generator.utils import generate_lightrad
+
+    generate_lightrad(file_path, AS1000Image(sid=1000), FilteredFieldLayer, field_size_mm=(100, 100),
+                      bb_positions=((-40, -40), (-40, 40), (40, -40), (40, 40)))
+    return file_path
+
+def write_planar_phantom_image(file_path, phantom_id, ssd=1000.0):
+    """An EPID image of a planar phantom outline (QC3, QCkV, LasVegas, LeedsTOR) at the given SSD.
+
+    Only the outline is drawn, so the contrast and resolution results are meaningless; the analysis runs end to end.
+    """
+    from pylinac.core.image_generator import AS1000Image
+    from pylinac.core.image_generator.layers import ArrayLayer, GaussianFilterLayer, RandomNoiseLayer
+
+    shape, bbox_mm, angle_deg, aspect = PLANAR_OUTLINES[phantom_id]
+    sid = 1500
+    sim = AS1000Image(sid=sid)
+    scale = 1 / sim.pixel_size * sid / 1000 * 1000 / ssd  # pixels per phantom mm
+    h, w = sim.shape
+    yy, xx = np.indices((h, w)) - np.array([h / 2, w / 2])[:, None, None]
+    if shape == 'disc':
+        plate = xx ** 2 + yy ** 2 < (bbox_mm / 2 * scale) ** 2
+    else:
+        a = np.radians(angle_deg)
+        u = xx * np.cos(a) + yy * np.sin(a)
+        v = -xx * np.sin(a) + yy * np.cos(a)
+        height = bbox_mm / (aspect * abs(np.cos(a)) + abs(np.sin(a)))
+        plate = (np.abs(u) < aspect * height / 2 * scale) & (np.abs(v) < height / 2 * scale)
+
+    pixels = np.where(plate, 20000, 40000)
+    if phantom_id == 'LeedsTOR':
+        # the central high-resolution block is what pylinac uses to find the rotation
+        half = np.sqrt(0.23) * bbox_mm / 2 * scale
+        pixels[(np.abs(xx) < half) & (np.abs(yy) < half)] = 17000
+
+    sim.add_layer(ArrayLayer(pixels.astype(np.uint16)))
+    sim.add_layer(GaussianFilterLayer(sigma_mm=1))
+    sim.add_layer(RandomNoiseLayer(sigma=0.002))
+    sim.generate_dicom(file_path)
+    return file_path
+
+def write_catphan_series(folder, model='504', slice_thickness=2.0, size=512, pixel_spacing=0.5, seed=0):
+    """A CatPhan CT series: a water cylinder with the HU inserts, geometry nodes and air bubbles
+    of the HU module at z = 0, and uniform slices for the other modules. Returns the file paths."""
+    import pylinac
+
+    phantom = getattr(pylinac, f'CatPhan{model}')
+    offsets = {module: settings['offset'] for module, settings in phantom.modules.items()}
+    hu_module = next(module for module, offset in offsets.items() if offset == 0)
+
+    c = size / 2
+    yy, xx = (np.indices((size, size)) - c + 0.5) * pixel_spacing
+    body = np.where(xx ** 2 + yy ** 2 < phantom.catphan_radius_mm ** 2, 0.0, -1000.0)
+    hu_slice = body.copy()
+    for roi in hu_module.roi_settings.values():
+        a = np.radians(roi['angle'])
+        x, y = roi['distance'] * np.cos(a), roi['distance'] * np.sin(a)
+        hu_slice[(xx - x) ** 2 + (yy - y) ** 2 < (roi['radius'] * 1.2) ** 2] = roi['value']
+    for y in (-40, 40):
+        hu_slice[xx ** 2 + (yy - y) ** 2 < phantom.air_bubble_radius_mm ** 2] = -1000
+    for x in (-25, 25):
+        for y in (-25, 25):
+            hu_slice[(xx - x) ** 2 + (yy - y) ** 2 < 1.5 ** 2] = 1000
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    rng = np.random.default_rng(seed)
+    study_uid = generate_uid()
+    series_uid = generate_uid()
+    z_positions = np.arange(min(offsets.values()) - 15, max(offsets.values()) + 15 + slice_thickness, slice_thickness)
+    files = []
+    for i, z in enumerate(z_positions):
+        hu = hu_slice if abs(z) <= 10 else body
+        pixels = np.clip(hu + rng.normal(0, 5, hu.shape) + 1024, 0, 4095)
+        file = os.path.join(folder, f'CT_{i:04d}.dcm')
+        files.append(write_dicom(file, pixels, modality='CT',
+                                 StudyInstanceUID=study_uid,
+                                 SeriesInstanceUID=series_uid,
+                                 InstanceNumber=i + 1,
+                                 ImagePositionPatient=[-c * pixel_spacing, -c * pixel_spacing, float(z)],
+                                 ImageOrientationPatient=[1, 0, 0, 0, 1, 0],
+                                 PixelSpacing=[pixel_spacing, pixel_spacing],
+                                 SliceThickness=slice_thickness,
+                                 RescaleSlope=1,
+                                 RescaleIntercept=-1024,
+                                 KVP=120))
+
+    return files
+
+def write_phantom_input(folder, phantom_id, config):
+    """Writes a synthetic input for a phantom analysis into folder. Returns the file (2D) or folder (3D)."""
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    if phantom_id == 'CatPhan':
+        write_catphan_series(folder, model=config['catphan_model'])
+        return folder
+
+    file_path = os.path.join(folder, f'{phantom_id.lower()}.dcm')
+    if phantom_id == 'FC2':
+        return write_fc2_image(file_path)
+
+    return write_planar_phantom_image(file_path, phantom_id, ssd=config['analysis_params'].get('ssd', 1000.0))
@@ -0,0 +1,130 @@
+import os
+import sys
+import csv
+import time
+import shutil
+import socket
+import argparse
+import importlib
+import tempfile
+from datetime import datetime
+
+# run from the repository root: python -m benchmarks.validate_resample --phantom QC3 image1.dcm image2.dcm
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+from utils import helper
+from utils.object import flatten
+from benchmarks.run_benchmarks import RESULTS_DIR, FIXTURES_DIR, SkipBenchmark, find_phantom_config, find_fixture
+
+import pydicom
+import phantoms.resample
+
+# Analyzes the same images at full resolution and downsampled (phantoms.resample) and reports the change
+# of every numeric result, so a site can choose a target pixel size and method that keeps the results.
+
+def analyze(module, input_file, config):
+    t0 = time.perf_counter()
+    phantom = module.load_phantom(input_file, config)
+    module.analyze_phantom(phantom, config)
+    elapsed = time.perf_counter() - t0
+    metrics = {item['key']: item['value'] for item in flatten(phantom.results_data(as_dict=True))
+               if isinstance(item['value'], (int, float)) and not isinstance(item['value'], bool)}
+    return metrics, elapsed
+
+def compare_metrics(reference, metrics, min_value=1e-6):
+    """Returns {key: relative change} of the metrics in both, and the keys missing in metrics."""
+    changes = {}
+    for key, ref in reference.items():
+        if key in metrics:
+            changes[key] = abs(metrics[key] - ref) / max(abs(ref), min_value)
+    missing = [key for key in reference if key not in metrics]
+    return changes, missing
+
+def validate(module, input_file, config, targets, methods, work_dir, tolerance=0.02, log_message=print):
+    """Returns one row per (method, target pixel size) of an input: factor, time, speedup and the largest metric change."""
+    reference, reference_s = analyze(module, input_file, config)
+    spacing = phantoms.resample.get_pixel_spacing(pydicom.dcmread(input_file, stop_before_pixels=True))
+    if spacing is None:
+        raise Exception(f'No pixel spacing in {input_file}')
+    log_message(f'{input_file}: full resolution {reference_s:.2f}s, pixel {min(spacing):.3f} mm, {len(reference)} metrics')
+
+    rows = [{'input': input_file, 'method': 'full', 'target_pixel_mm': min(spacing), 'factor': 1, 'time_s': round(reference_s, 3),
+             'speedup': 1.0, 'max_change': 0.0, 'worst_metric': None, 'missing': 0, 'safe': True, 'error': None}]
+
+    for method in methods:
+        for target in targets:
+            options = {**phantoms.resample.DEFAULT_OPTIONS, 'enabled': True, 'method': method,
+                       'target_pixel_mm': target, 'min_factor': 1.0}
+            row = {'input': input_file, 'method': method, 'target_pixel_mm': target}
+            factor = phantoms.resample.get_factor(spacing, options)
+            if factor is None:
+                continue
+
+            resampled_file = os.path.join(work_dir, f'{method}_{target}.dcm')
+            ds = pydicom.dcmread(input_file)
+            phantoms.resample.resample_dataset(ds, factor, method).save_as(resampled_file, write_like_original=False)
+
+            try:
+                metrics, elapsed = analyze(module, resampled_file, config)
+                changes, missing = compare_metrics(reference, metrics)
+                worst = max(changes, key=changes.get) if changes else None
+                max_change = changes[worst] if worst else 0.0
+                row.update(factor=round(factor, 3), time_s=round(elapsed, 3), speedup=round(reference_s / elapsed, 2),
+                           max_change=round(max_change, 5), worst_metric=worst, missing=len(missing),
+                           safe=max_change <= tolerance and len(missing) == 0, error=None)
+            except Exception as e:
+                row.update(factor=round(factor, 3), safe=False, error=f'{type(e).__name__}: {e}')
+
+            log_message(f"  {method} {target} mm: " + (f"x{row['speedup']} faster, max change {row['max_change']:.2%} ({row['worst_metric']})"
+                                                        if row['error'] is None else row['error']))
+            rows.append(row)
+
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the 2D phantom results at full resolution and downsampled.')
+    parser.add_argument('inputs', nargs='*', help='DICOM images (default: the fixture or the pylinac demo image)')
+    parser.add_argument('--phantom', required=True, help='2D phantom id, e.g. QC3')
+    parser.add_argument('--config', help='phantom config file (default: the first config.*.*.<phantom>.json)')
+    parser.add_argument('--targets', nargs='+', type=float, default=[0.3, 0.4, 0.6, 0.8], help='target pixel sizes in mm')
+    parser.add_argument('--methods', nargs='+', default=['bin', 'antialias'])
+    parser.add_argument('--tolerance', type=float, default=0.02, help='largest relative metric change that is safe')
+    parser.add_argument('--output', help='CSV file (default: benchmarks/results/resample_<hostname>_<datetime>.csv)')
+    args = parser.parse_args()
+
+    config = helper.read_json_file(args.config) if args.config else find_phantom_config(args.phantom)
+    module = importlib.import_module(f'phantoms.{args.phantom.lower()}')
+    try:
+        inputs = args.inputs or [find_fixture(args.phantom, 2, config, FIXTURES_DIR)]
+    except SkipBenchmark as e:
+        raise Exception(f'No input images: {e}')
+
+    work_dir = tempfile.mkdtemp(prefix='resample_')
+    rows = []
+    try:
+        for input_file in inputs:
+            rows.extend(validate(module, input_file, config, args.targets, args.methods, work_dir, tolerance=args.tolerance))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"resample_{socket.gethostname()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+
+    with open(output, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f'results saved: {output}')
+
+    # the coarsest setting that is safe for every input, per method
+    for method in args.methods:
+        safe = [t for t in args.targets if all(r['safe'] for r in rows if r['method'] == method and r['target_pixel_mm'] == t)
+                and any(r['method'] == method and r['target_pixel_mm'] == t for r in rows)]
+        print(f"{method}: largest safe target pixel size: {max(safe) if safe else 'none'} mm")
+
+if __name__ == '__main__':
+    main()
@@ -72,8 +72,8 @@ def get_dicom_image(dicom_data):
     return image_array
 
 def get_acquisition_datetime(dicom_file_path):
-    # Read the DICOM file
-    dicom_data = pydicom.dcmread(dicom_file_path)
+    # Read the DICOM header (pixel data is not needed)
+    dicom_data = pydicom.dcmread(dicom_file_path, stop_before_pixels=True)
 
     # Extract the acquisition date and time
     acquisition_date = dicom_data.get('AcquisitionDate', None)
@@ -100,8 +100,8 @@ def get_acquisition_datetime_str(dicom_file_path):
     return dt.strftime('%Y%m%d_%H%M%S')
 
 def get_series_datetime(dicom_file_path):
-    # Read the DICOM file
-    dicom_data = pydicom.dcmread(dicom_file_path)
+    # Read the DICOM header (pixel data is not needed)
+    dicom_data = pydicom.dcmread(dicom_file_path, stop_before_pixels=True)
 
     # Extract the study date and time
     study_date = dicom_data.get('SeriesDate', None)
@@ -127,8 +127,8 @@ def get_series_datetime_str(dicom_file_path):
     return dt.strftime('%Y%m%d_%H%M%S')
 
 def get_study_datetime(dicom_file_path):
-    # Read the DICOM file
-    dicom_data = pydicom.dcmread(dicom_file_path)
+    # Read the DICOM header (pixel data is not needed)
+    dicom_data = pydicom.dcmread(dicom_file_path, stop_before_pixels=True)
 
     # Extract the study date and time
     study_date = dicom_data.get('StudyDate', None)
@@ -155,8 +155,8 @@ def get_study_datetime_str(dicom_file_path):
 
 
 def get_instance_creation_datetime(dicom_file_path):
-    # Read the DICOM file
-    dicom_data = pydicom.dcmread(dicom_file_path)
+    # Read the DICOM header (pixel data is not needed)
+    dicom_data = pydicom.dcmread(dicom_file_path, stop_before_pixels=True)
 
     # Extract the study date and time
     study_date = dicom_data.get('InstanceCreationDate', None)
@@ -179,4 +179,121 @@ def get_instance_creation_datetime_str(dicom_file_path):
     dt = get_instance_creation_datetime(dicom_file_path)
     
     # Return formatted string 'yyyyMMdd_HHmmss'
-    return dt.strftime('%Y%m%d_%H%M%S')
\ No newline at end of file
+    return dt.strftime('%Y%m%d_%H%M%S')
+
+def get_image_datetime(dicom_file_path):
+    # Try the acquisition, series and instance creation date time in that order
+    for get_datetime in (get_acquisition_datetime, get_series_datetime, get_instance_creation_datetime):
+        try:
+            return get_datetime(dicom_file_path)
+        except Exception:
+            continue
+
+    raise Exception(f"No acquisition, series or instance creation date time found in the DICOM file ({dicom_file_path}).")
+
+
+SLICE_HEADER_TAGS = ['ImagePositionPatient', 'ImageOrientationPatient', 'PixelSpacing', 'SliceThickness',
+                     'SeriesInstanceUID', 'AcquisitionNumber', 'Rows', 'Columns', 'RescaleSlope', 'RescaleIntercept']
+
+def read_slice_headers(files, log_message=print):
+    """Reads the slice geometry of CT files from the headers only. Returns the headers sorted by z position.
+
+    Files without ImagePositionPatient are skipped.
+    """
+    headers = []
+    for file in files:
+        ds = pydicom.dcmread(file, stop_before_pixels=True, specific_tags=SLICE_HEADER_TAGS)
+        position = ds.get('ImagePositionPatient', None)
+        if position is None:
+            log_message(f"ImagePositionPatient not found. skipping... {file}")
+            continue
+
+        headers.append({
+            'file': file,
+            'position': [float(v) for v in position],
+            'z': float(position[-1]),
+            'orientation': [float(v) for v in ds.get('ImageOrientationPatient', [1, 0, 0, 0, 1, 0])],
+            'pixel_spacing': [float(v) for v in ds.get('PixelSpacing', [0, 0])],
+            'slice_thickness': float(ds.get('SliceThickness', 0) or 0),
+            'series_uid': f"{ds.get('SeriesInstanceUID', '')}",
+            'acquisition_number': ds.get('AcquisitionNumber', None),
+            'shape': (int(ds.get('Rows', 0)), int(ds.get('Columns', 0))),
+            'rescale_slope': float(ds.get('RescaleSlope', 1) or 1),
+            'rescale_intercept': float(ds.get('RescaleIntercept', 0) or 0)
+        })
+
+    headers.sort(key=lambda h: h['z'])
+    return headers
+
+def _majority_mask(values):
+    # True for the rows equal to the most common row
+    _, inverse, counts = np.unique(values, axis=0, return_inverse=True, return_counts=True)
+    return inverse.reshape(-1) == np.argmax(counts)
+
+def check_slice_geometry(headers, spacing_tolerance=0.1):
+    """Checks the geometry of a CT series from its slice headers (see read_slice_headers()).
+
+    Detects duplicate positions, gaps and uneven spacing, and slices that differ from the majority in
+    orientation, pixel spacing, image size, series or acquisition number.
+    Returns a report dict. report['errors'] is empty if the series is consistent.
+    """
+    report = {'num_slices': len(headers), 'spacing': None, 'duplicates': [], 'gaps': [], 'outliers': [], 'errors': []}
+    if len(headers) < 2:
+        report['errors'].append(f'Not enough slices ({len(headers)}).')
+        return report
+
+    z = np.array([h['z'] for h in headers])
+    dz = np.diff(z)
+
+    duplicate = dz < spacing_tolerance
+    spacing = float(np.median(dz[~duplicate])) if np.any(~duplicate) else 0.0
+    uneven = ~duplicate & (np.abs(dz - spacing) > spacing_tolerance)
+    report['spacing'] = round(spacing, 4)
+    report['duplicates'] = z[1:][duplicate].tolist()
+    report['gaps'] = [[float(a), float(b)] for a, b in zip(z[:-1][uneven], z[1:][uneven])]
+
+    if len(report['duplicates']) > 0:
+        report['errors'].append(f"{len(report['duplicates'])} duplicate slice positions (z={report['duplicates'][:5]})")
+    if len(report['gaps']) > 0:
+        report['errors'].append(f"{len(report['gaps'])} gaps or uneven spacing (spacing={spacing:.3f} mm, at z={report['gaps'][:5]})")
+
+    # the same attribute for every slice, compared with the most common value
+    attributes = {
+        'orientation': np.round(np.array([h['orientation'] for h in headers]), 4),
+        'pixel spacing': np.round(np.array([h['pixel_spacing'] for h in headers]), 4),
+        'image size': np.array([h['shape'] for h in headers]),
+        'series': np.array([[h['series_uid']] for h in headers]),
+        'acquisition number': np.array([[f"{h['acquisition_number']}"] for h in headers])
+    }
+    outlier = np.zeros(len(headers), dtype=bool)
+    for name, values in attributes.items():
+        mismatch = ~_majority_mask(values)
+        if np.any(mismatch):
+            report['errors'].append(f'{np.count_nonzero(mismatch)} slices with a different {name}')
+            outlier |= mismatch
+
+    report['outliers'] = z[outlier].tolist()
+    report['slice_mask'] = ~outlier
+    return report
+
+def find_consistent_slices(headers, report, spacing_tolerance=0.1):
+    """Returns the largest evenly spaced run of slices of a checked series (see check_slice_geometry()).
+
+    Outlier slices are dropped and, of duplicate positions, only the first slice is kept.
+    """
+    kept = [h for h, keep in zip(headers, report['slice_mask']) if keep]
+    if len(kept) < 2:
+        return kept
+
+    z = np.array([h['z'] for h in kept])
+    unique = np.concatenate([[True], np.diff(z) >= spacing_tolerance])
+    kept = [h for h, keep in zip(kept, unique) if keep]
+    z = z[unique]
+    if len(kept) < 2:
+        return kept
+
+    # runs are split where the spacing differs from the series spacing
+    breaks = np.flatnonzero(np.abs(np.diff(z) - report['spacing']) > spacing_tolerance) + 1
+    bounds = np.concatenate([[0], breaks, [len(kept)]])
+    longest = int(np.argmax(np.diff(bounds)))
+    return kept[bounds[longest]:bounds[longest + 1]]
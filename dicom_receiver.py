@@ -0,0 +1,173 @@
+import os
+import time
+import argparse
+import threading
+
+from utils import helper
+from utils.checkpoint import Checkpoint
+
+from app_logger import logger, logs_dir
+
+# pynetdicom is optional - only the receiver needs it
+try:
+    from pynetdicom import AE, evt, AllStoragePresentationContexts
+    from pynetdicom.sop_class import Verification
+except ImportError:
+    AE = None
+
+def _require_pynetdicom():
+    if AE is None:
+        raise Exception('pynetdicom is not installed. Install it with "pip install pynetdicom" to use the DICOM receiver.')
+
+class DicomReceiver:
+    """DICOM storage SCP (C-STORE) that saves incoming images and reports complete series.
+
+    Instances are saved as storage_folder/<series instance uid>/<sop instance uid>.dcm and indexed by series.
+    A series is complete when nothing was received for it for inactivity_timeout_s. check_complete()
+    returns the complete series and forgets them.
+    """
+    def __init__(self, storage_folder, ae_title='IMAGEQA', address='', port=11112, inactivity_timeout_s=30, log_message=print):
+        _require_pynetdicom()
+
+        self.storage_folder = storage_folder
+        self.ae_title = ae_title
+        self.address = address
+        self.port = port
+        self.inactivity_timeout_s = inactivity_timeout_s
+        self.log_message = log_message
+
+        self.series = {}  # series uid -> {'files', 'last_received', 'calling_ae', 'modality'}
+        self.lock = threading.Lock()
+        self.server = None
+
+    def handle_store(self, event):
+        # called in the association thread of pynetdicom
+        try:
+            ds = event.dataset
+            ds.file_meta = event.file_meta
+            series_uid = f"{ds.get('SeriesInstanceUID', 'unknown')}"
+
+            folder = os.path.join(self.storage_folder, series_uid)
+            os.makedirs(folder, exist_ok=True)
+            file = os.path.join(folder, f'{ds.SOPInstanceUID}.dcm')
+            ds.save_as(file, write_like_original=False)
+        except Exception as e:
+            self.log_message(f'Error storing an instance: {e}')
+            return 0xC210  # cannot understand
+
+        calling_ae = f'{event.assoc.requestor.ae_title}'.strip()
+        with self.lock:
+            series = self.series.setdefault(series_uid, {'series_uid': series_uid, 'files': [], 'calling_ae': calling_ae,
+                                                         'modality': f"{ds.get('Modality', '')}"})
+            if file not in series['files']:
+                series['files'].append(file)
+            series['last_received'] = time.monotonic()
+
+        return 0x0000
+
+    def check_complete(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            complete = [uid for uid, s in self.series.items() if now - s['last_received'] >= self.inactivity_timeout_s]
+            return [self.series.pop(uid) for uid in complete]
+
+    def start(self):
+        ae = AE(ae_title=self.ae_title)
+        ae.supported_contexts = AllStoragePresentationContexts
+        ae.add_supported_context(Verification)
+
+        self.server = ae.start_server((self.address, self.port), block=False,
+                                      evt_handlers=[(evt.EVT_C_STORE, self.handle_store)])
+        # port 0 picks a free port
+        self.port = self.server.server_address[1]
+        self.log_message(f'DICOM receiver {self.ae_title} listening on port {self.port}')
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def send_files(files, address, port, ae_title='IMAGEQA', calling_ae_title='IMAGEQA_SCU', log_message=print):
+    """Sends DICOM files with C-STORE (storage SCU), e.g. to test the receiver. Returns the status of each file."""
+    _require_pynetdicom()
+    import pydicom
+
+    datasets = [pydicom.dcmread(file) for file in files]
+
+    ae = AE(ae_title=calling_ae_title)
+    for sop_class in sorted({f'{ds.SOPClassUID}' for ds in datasets}):
+        ae.add_requested_context(sop_class)
+
+    assoc = ae.associate(address, port, ae_title=ae_title)
+    if not assoc.is_established:
+        raise Exception(f'Association with {ae_title}@{address}:{port} failed.')
+
+    statuses = []
+    try:
+        for file, ds in zip(files, datasets):
+            status = assoc.send_c_store(ds)
+            statuses.append(status.Status if status else None)
+            if not status or status.Status != 0x0000:
+                log_message(f'C-STORE failed for {file}: {status}')
+    finally:
+        assoc.release()
+
+    return statuses
+
+def main():
+    import watcher
+
+    parser = argparse.ArgumentParser(description='Receive QC images over DICOM (C-STORE) and analyze complete series.')
+    parser.add_argument('--config', default='config.json', help='app config file (dicom_receiver, output_folder)')
+    parser.add_argument('--port', type=int, help='listening port')
+    parser.add_argument('--ae-title', help='AE title of the receiver')
+    parser.add_argument('--output-folder', help='case folder root (default: output_folder in the config)')
+    args = parser.parse_args()
+
+    config = helper.read_json_file(args.config)
+    options = config.get('dicom_receiver', {})
+    watcher_options = config.get('watcher', {})
+
+    def log_message(message):
+        logger.info(message)
+
+    # the watcher classifies the received series and runs the analyses on its warm worker pool
+    analyzer = watcher.Watcher(watch_folders=[],
+                               output_folder=args.output_folder or config['output_folder'],
+                               app_config=config,
+                               checkpoint=Checkpoint(options.get('checkpoint', '_receiver_checkpoint.txt')),
+                               max_workers=watcher_options.get('max_workers', 2),
+                               min_confidence=watcher_options.get('min_confidence', 0.6),
+                               performed_by=options.get('performed_by', 'dicom receiver'),
+                               metrics_dir=logs_dir,
+                               log_message=log_message)
+
+    # calling AE title -> {'site', 'device'} of the sender
+    calling_aes = options.get('calling_ae_titles', {})
+
+    receiver = DicomReceiver(storage_folder=options.get('storage_folder', '_received'),
+                             ae_title=args.ae_title or options.get('ae_title', 'IMAGEQA'),
+                             port=args.port or options.get('port', 11112),
+                             inactivity_timeout_s=options.get('inactivity_timeout_s', 30),
+                             log_message=log_message)
+
+    with receiver:
+        try:
+            while True:
+                for series in receiver.check_complete():
+                    log_message(f"series complete: {series['series_uid']} ({len(series['files'])} files from {series['calling_ae']})")
+                    analyzer.queue_files(series['files'], calling_aes.get(series['calling_ae'], {}))
+                analyzer.collect()
+                time.sleep(1)
+        finally:
+            analyzer.executor.shutdown(wait=True)
+
+if __name__ == '__main__':
+    main()
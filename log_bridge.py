@@ -0,0 +1,65 @@
+import queue
+import tkinter as tk
+
+from app_logger import logger
+
+class LogBridge:
+    """Thread-safe bridge from worker threads to a Tk Text log widget.
+
+    Workers call log() or call_in_main(), which only put items on a queue. The Tk main loop drains
+    the queue in batches on an after() timer, so widgets are only touched from the main thread.
+    The widget keeps the last max_lines lines; the full log goes to app_logger.
+    """
+    def __init__(self, root, text_widget=None, max_lines=5000, interval_ms=100, max_batch=1000):
+        self.root = root
+        self.text_widget = text_widget
+        self.max_lines = max_lines
+        self.interval_ms = interval_ms
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+
+    def set_text_widget(self, text_widget):
+        self.text_widget = text_widget
+
+    def start(self):
+        self.root.after(self.interval_ms, self.drain)
+
+    def log(self, message):
+        # app_logger's QueueHandler does not block on file I/O
+        logger.info(message)
+        self.queue.put(str(message))
+
+    def call_in_main(self, func, *args, **kwargs):
+        # run a widget update (e.g. progress_bar.stop) on the main thread
+        self.queue.put(lambda: func(*args, **kwargs))
+
+    def drain(self):
+        lines = []
+        try:
+            for _ in range(self.max_batch):
+                item = self.queue.get_nowait()
+                if callable(item):
+                    # keep the log order relative to the widget updates
+                    self._insert(lines)
+                    lines = []
+                    item()
+                else:
+                    lines.append(item)
+        except queue.Empty:
+            pass
+        finally:
+            self._insert(lines)
+            self.root.after(self.interval_ms, self.drain)
+
+    def _insert(self, lines):
+        if len(lines) == 0 or self.text_widget is None:
+            return
+
+        self.text_widget.insert(tk.END, '\n'.join(lines) + '\n')
+
+        # bounded ring of lines
+        num_lines = int(self.text_widget.index('end-1c').split('.')[0]) - 1
+        if num_lines > self.max_lines:
+            self.text_widget.delete('1.0', f'{num_lines - self.max_lines + 1}.0')
+
+        self.text_widget.see(tk.END)
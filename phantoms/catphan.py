@@ -1,6 +1,141 @@
 import os
+import numpy as np
+import pydicom
 from pylinac import CatPhan604, CatPhan600, CatPhan504, CatPhan503
-import phantoms.helper 
+from utils import timing
+import phantoms.helper
+import dicom_helper
+
+CATPHAN_CLASSES = {
+    '604': CatPhan604,
+    '600': CatPhan600,
+    '504': CatPhan504,
+    '503': CatPhan503
+}
+
+# pylinac does not load a CBCT with fewer slices than this
+MIN_NUM_SLICES = 39
+
+def hu_module_score(hu):
+    """Scores how much a slice looks like the HU linearity module (CTP404).
+
+    The HU module is the only module with both air (< -900 HU) and dense (> 700 HU, e.g. Teflon) inserts
+    inside the phantom body.
+    """
+    body = hu > -500
+    if body.sum() < 100:
+        return 0
+
+    # inside the phantom: within 90% of the radius of the body disc around its centroid
+    ys, xs = np.nonzero(body)
+    cy, cx = ys.mean(), xs.mean()
+    radius = np.sqrt(body.sum() / np.pi)
+    yy, xx = np.indices(hu.shape)
+    inside = (yy - cy) ** 2 + (xx - cx) ** 2 < (0.9 * radius) ** 2
+
+    num_air = np.count_nonzero(inside & (hu < -900))
+    num_dense = np.count_nonzero(inside & (hu > 700))
+    return num_air * num_dense
+
+def estimate_origin_z(headers, options, log_message):
+    """Returns the z position (mm) of the HU module, or None if it could not be found.
+
+    Uses slice_selection.origin_z of the config if set. Otherwise decodes one slice every
+    coarse_step_mm (downsampled) and picks the slice that looks most like the HU module.
+    Every slice is decoded if the slice spacing is unknown (all slices at the same z).
+    """
+    if options.get('origin_z') is not None:
+        return float(options['origin_z'])
+
+    # duplicate positions (e.g. two acquisitions) do not count in the spacing
+    dz = np.abs(np.diff([h['z'] for h in headers]))
+    dz = dz[dz > 1e-6]
+    step = max(1, int(round(options.get('coarse_step_mm', 5) / np.median(dz)))) if len(dz) > 0 else 1
+    downsample = options.get('coarse_downsample', 4)
+
+    candidates = headers[::step]
+    scores = []
+    for header in candidates:
+        ds = pydicom.dcmread(header['file'])
+        hu = ds.pixel_array[::downsample, ::downsample] * header['rescale_slope'] + header['rescale_intercept']
+        scores.append(hu_module_score(hu))
+
+    scores = np.array(scores)
+    if scores.max() <= 0:
+        return None
+
+    # like pylinac, take the median of the slices that look like the HU module
+    z = np.array([h['z'] for h in candidates])
+    origin_z = float(np.median(z[scores >= 0.5 * scores.max()]))
+    log_message(f'HU module estimated at z={origin_z:.1f} from {len(candidates)} of {len(headers)} slices')
+    return origin_z
+
+def select_input_files(files, config, log_message, headers=None):
+    """Returns the slices to stage for the analysis, sorted by z position.
+
+    Only the slices within window_mm of the phantom modules (estimated from the HU module position and
+    the module offsets of the CatPhan model) are kept. The selection is one contiguous range, because
+    pylinac locates the modules by slice index and assumes an evenly spaced stack.
+    All slices are returned if slice_selection is disabled or the HU module cannot be found.
+    headers are the slice headers of files if already read (see dicom_helper.read_slice_headers()).
+    """
+    options = config.get('slice_selection', {})
+    if not options.get('enabled', False):
+        return files
+
+    catphan_class = CATPHAN_CLASSES.get(config['catphan_model'])
+    if catphan_class is None:
+        return files
+
+    if headers is None:
+        with timing.span('read_headers'):
+            headers = dicom_helper.read_slice_headers(files, log_message=log_message)
+    if len(headers) <= MIN_NUM_SLICES:
+        return files
+
+    with timing.span('estimate_origin'):
+        origin_z = estimate_origin_z(headers, options, log_message)
+    if origin_z is None:
+        log_message('HU module not found. Using all slices.')
+        return files
+
+    window_mm = options.get('window_mm', 15)
+    offsets = [module['offset'] for module in catphan_class.modules.values()]
+    z_min = origin_z + min(offsets) - window_mm
+    z_max = origin_z + max(offsets) + window_mm
+
+    z = np.array([h['z'] for h in headers])
+    first = int(np.searchsorted(z, z_min, side='left'))
+    last = int(np.searchsorted(z, z_max, side='right'))
+
+    # grow the range evenly to the minimum number of slices pylinac accepts
+    while last - first < MIN_NUM_SLICES:
+        if first > 0:
+            first -= 1
+        if last < len(headers) and last - first < MIN_NUM_SLICES:
+            last += 1
+
+    selected = [h['file'] for h in headers[first:last]]
+    log_message(f'Selected {len(selected)} of {len(headers)} slices (z={z[first]:.1f} to {z[last - 1]:.1f} mm)')
+    return selected
+
+def load_phantom(input_dir, config):
+    return CATPHAN_CLASSES[config['catphan_model']](input_dir)
+
+def analyze_phantom(phantom, config):
+    params = config['analysis_params']
+    phantom.analyze(
+        hu_tolerance=params['hu_tolerance'],
+        scaling_tolerance=params['scaling_tolerance'],
+        thickness_tolerance=params['thickness_tolerance'],
+        low_contrast_tolerance=params['low_contrast_tolerance'],
+        cnr_threshold=params['cnr_threshold'],
+        zip_after=False,
+        contrast_method=params['contrast_method'],
+        visibility_threshold=params['visibility_threshold'],
+        thickness_slice_straddle=params['thickness_slice_straddle'],
+        expected_hu_values=params['expected_hu_values']
+    )
 
 def run_analysis(device_id, input_dir, output_dir, config, notes, metadata, log_message):
 
@@ -20,39 +155,21 @@ def run_analysis(device_id, input_dir, output_dir, config, notes, metadata, log_
     catphan_model = config['catphan_model']
     log_message(f'Phantom model: {catphan_model}')
     
-    if catphan_model == '604':
-        phantom = CatPhan604(input_dir)
-    elif catphan_model == '600':
-        phantom = CatPhan600(input_dir)
-    elif catphan_model == '504':
-        phantom = CatPhan504(input_dir)
-    elif catphan_model == '503':
-        phantom = CatPhan503(input_dir)
-    else:
+    catphan_class = CATPHAN_CLASSES.get(catphan_model)
+    if catphan_class is None:
         log_message(f'Error:Unknown CatPhan model: {catphan_model}!')
         return
-    
+
     log_message('Running analysis...')
-    params = config['analysis_params']
-    phantom.analyze(
-        hu_tolerance=params['hu_tolerance'],
-        scaling_tolerance=params['scaling_tolerance'],
-        thickness_tolerance=params['thickness_tolerance'],
-        low_contrast_tolerance=params['low_contrast_tolerance'],
-        cnr_threshold=params['cnr_threshold'],
-        zip_after=False,
-        contrast_method=params['contrast_method'],
-        visibility_threshold=params['visibility_threshold'],
-        thickness_slice_straddle=params['thickness_slice_straddle'],
-        expected_hu_values=params['expected_hu_values']
-    )
+    phantom = phantoms.helper.load_and_analyze(load_phantom, analyze_phantom, input_dir, config, log_message)
 
     # print results
     log_message(phantom.results())
 
     file = os.path.join(output_dir, 'analyzed_image.png')
     log_message(f'saving image: {file}')
-    phantom.save_analyzed_image(filename=file)
+    with timing.span('save_image'):
+        phantom.save_analyzed_image(filename=file)
     
     sub_image_header = os.path.join(output_dir, 'analyzed_subimage')
     #* ``hu`` draws the HU linearity image.
@@ -68,18 +185,22 @@ def run_analysis(device_id, input_dir, output_dir, config, notes, metadata, log_
         try:
             dst = f'{sub_image_header}.{sub}.png'
             log_message(f'saving sub image: {dst}')
-            phantom.save_analyzed_subimage(filename=dst, subimage=sub)
+            with timing.span('save_subimage'):
+                phantom.save_analyzed_subimage(filename=dst, subimage=sub)
         except:
             pass
 
+    # the baseline summary goes to the PDF notes and result.json
+    baseline, notes = phantoms.helper.compare_with_baseline(phantom, device_id, 'catphan', config, notes, log_message)
+
     phantoms.helper.copy_logo(config=config, output_dir=output_dir, log_message=log_message)
     
     phantoms.helper.save_result_as_pdf(phantom=phantom, output_dir=output_dir, config=config, notes=notes, metadata=metadata, log_message=log_message)
 
     phantoms.helper.save_result_as_txt(phantom=phantom, output_dir=output_dir, log_message=log_message)
     
-    phantoms.helper.save_result_as_json(phantom=phantom, output_dir=output_dir, device_id=device_id, notes=notes, config=config, metadata=metadata, log_message=log_message)
+    phantoms.helper.save_result_as_json(phantom=phantom, output_dir=output_dir, device_id=device_id, notes=notes, config=config, metadata=metadata, log_message=log_message, baseline=baseline)
     
-    phantoms.helper.append_result_to_phantom_csv(phantom=phantom, output_dir=output_dir, device_id=device_id, notes=notes, metadata=metadata, log_message=log_message)
+    phantoms.helper.append_result_to_phantom_csv(phantom=phantom, output_dir=output_dir, device_id=device_id, notes=notes, metadata=metadata, log_message=log_message, config=config)
 
     log_message('Analysis completed.')
@@ -0,0 +1,150 @@
+import re
+import pydicom
+from concurrent.futures import ThreadPoolExecutor
+import phantoms.preflight
+
+# Guesses the phantom (and the device) of a DICOM image, so that images can be routed to the
+# phantoms.<id> modules without an operator. Header tags are used first; the image is decoded
+# only when the header does not decide between the phantoms.
+
+HEADER_TAGS = ['Modality', 'StationName', 'RadiationMachineName', 'RTImageLabel', 'RTImageDescription',
+               'SeriesDescription', 'StudyDescription', 'ImageComments', 'PatientID', 'PatientName',
+               'KVP', 'ExposureSequence', 'SeriesInstanceUID']
+
+TEXT_TAGS = ['RTImageLabel', 'RTImageDescription', 'SeriesDescription', 'StudyDescription', 'ImageComments',
+             'PatientID', 'PatientName']
+
+# compared with the text tags after removing everything but letters and digits
+DEFAULT_KEYWORDS = {
+    'CatPhan': ['CATPHAN'],
+    'QCkV': ['QCKV'],
+    'QC3': ['QC3'],
+    'FC2': ['FC2'],
+    'LeedsTOR': ['LEEDS', 'TOR18'],
+    'LasVegas': ['LASVEGAS']
+}
+
+KV_PHANTOMS = ['QCkV', 'LeedsTOR']
+MV_PHANTOMS = ['QC3', 'FC2', 'LasVegas']
+SHAPES = {'QCkV': 'rectangle', 'QC3': 'rectangle', 'FC2': 'rectangle', 'LasVegas': 'rectangle', 'LeedsTOR': 'disc'}
+
+# a text match outweighs the energy and image features
+KEYWORD_SCORE = 3.0
+ENERGY_SCORE = 1.0
+SHAPE_SCORE = 1.0
+
+def _normalize(text):
+    return re.sub(r'[^A-Z0-9]', '', f'{text}'.upper())
+
+def get_kvp(ds):
+    kvp = ds.get('KVP', None)
+    if not kvp and 'ExposureSequence' in ds and len(ds.ExposureSequence) > 0:
+        kvp = ds.ExposureSequence[0].get('KVP', None)
+    return float(kvp) if kvp else None
+
+def get_energy(ds):
+    """Returns 'kV', 'MV' or None."""
+    modality = f"{ds.get('Modality', '')}"
+    if modality in ('DX', 'CR', 'RF', 'XA'):
+        return 'kV'
+    if modality != 'RTIMAGE':
+        return None
+
+    # EPID (MV) images have no kVp; some systems store the MV as kV (e.g. 6000)
+    kvp = get_kvp(ds)
+    return 'kV' if kvp is not None and kvp <= 150 else 'MV'
+
+def find_device(ds, sites):
+    """Returns 'site|device' of the device whose station_names (config.json) match StationName or RadiationMachineName."""
+    names = {_normalize(ds.get(tag, '')) for tag in ('StationName', 'RadiationMachineName')} - {''}
+    for site in sites:
+        for device in site['devices']:
+            if names & {_normalize(n) for n in device.get('station_names', [])}:
+                return f"{site['id']}|{device['id']}"
+    return None
+
+def score_header(ds, keywords):
+    scores = {phantom_id: 0.0 for phantom_id in keywords}
+
+    if f"{ds.get('Modality', '')}" == 'CT':
+        scores['CatPhan'] = scores.get('CatPhan', 0.0) + ENERGY_SCORE
+        return scores
+
+    energy = get_energy(ds)
+    for phantom_id in (KV_PHANTOMS if energy == 'kV' else MV_PHANTOMS if energy == 'MV' else []):
+        scores[phantom_id] += ENERGY_SCORE
+
+    text = _normalize(' '.join(f"{ds.get(tag, '')}" for tag in TEXT_TAGS))
+    for phantom_id, words in keywords.items():
+        if any(_normalize(w) in text for w in words):
+            scores[phantom_id] += KEYWORD_SCORE
+
+    return scores
+
+def score_image(ds, scores, size=128):
+    # disc (LeedsTOR) or rectangle (the other 2D phantoms)
+    image = phantoms.preflight.downsample(ds.pixel_array, size)
+    mask, _ = phantoms.preflight.get_phantom_mask(image)
+    shape_scores = {shape: phantoms.preflight.shape_score(mask, shape) for shape in ('disc', 'rectangle')}
+    shape = max(shape_scores, key=shape_scores.get)
+
+    for phantom_id, phantom_shape in SHAPES.items():
+        if phantom_shape == shape and phantom_id in scores:
+            scores[phantom_id] += SHAPE_SCORE * shape_scores[shape]
+    return shape
+
+def is_decided(scores):
+    ranked = sorted(scores.values(), reverse=True)
+    return ranked[0] > 0 and (len(ranked) == 1 or ranked[0] - ranked[1] >= KEYWORD_SCORE)
+
+def get_candidates(result):
+    """The phantom ids with the best score of a classifier result; more than one when the scores tie."""
+    scores = result.get('scores') or {}
+    best = max(scores.values(), default=0)
+    return [phantom_id for phantom_id, score in scores.items() if best > 0 and score == best]
+
+def classify_file(file, config, use_image=True):
+    """Guesses the phantom of a DICOM file.
+
+    config is the app config (config.json). Returns a dict with the phantom id (None if unknown), a
+    confidence between 0 and 1 (the share of the best score), the scores and the device ('site|device')
+    if a station name of the config matches.
+    """
+    options = config.get('classifier', {})
+    keywords = options.get('keywords', DEFAULT_KEYWORDS)
+
+    ds = pydicom.dcmread(file, stop_before_pixels=True, specific_tags=HEADER_TAGS)
+    scores = score_header(ds, keywords)
+
+    shape = None
+    if use_image and options.get('use_image', True) and not is_decided(scores) and f"{ds.get('Modality', '')}" != 'CT':
+        try:
+            shape = score_image(pydicom.dcmread(file), scores, size=options.get('image_size', 128))
+        except Exception:
+            pass
+
+    total = sum(scores.values())
+    phantom_id = max(scores, key=scores.get) if total > 0 else None
+    return {
+        'file': file,
+        'phantom': phantom_id,
+        'confidence': round(scores[phantom_id] / total, 3) if phantom_id else 0.0,
+        'scores': {k: round(v, 3) for k, v in scores.items()},
+        'device_id': find_device(ds, config.get('sites', [])),
+        'station_name': f"{ds.get('StationName', '') or ds.get('RadiationMachineName', '')}",
+        'modality': f"{ds.get('Modality', '')}",
+        'series_uid': f"{ds.get('SeriesInstanceUID', '')}",
+        'shape': shape
+    }
+
+def classify_files(files, config, use_image=True, max_workers=8, log_message=print):
+    """Classifies many files in a thread pool (reading and decoding release the GIL). Keeps the order of files."""
+    def classify(file):
+        try:
+            return classify_file(file, config, use_image=use_image)
+        except Exception as e:
+            log_message(f'Error classifying {file}: {e}')
+            return {'file': file, 'phantom': None, 'confidence': 0.0, 'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(classify, files))
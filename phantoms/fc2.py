@@ -1,7 +1,21 @@
 import os
 from pylinac import StandardImagingFC2
+from utils import timing
+import phantoms.preflight
+import phantoms.resample
 import phantoms.helper
 
+def load_phantom(input_file, config):
+    return StandardImagingFC2(input_file)
+
+def analyze_phantom(phantom, config):
+    params = config['analysis_params']
+    phantom.analyze(
+        invert=False,
+        fwxm=params['fwxm'],
+        bb_edge_threshold_mm=params['bb_edge_threshold_mm']
+    )
+
 def run_analysis(device_id, input_file, output_dir, config, notes, metadata, log_message):
 
     if not input_file:
@@ -18,23 +32,28 @@ def run_analysis(device_id, input_file, output_dir, config, notes, metadata, log
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
+    # reject a wrong, blank or saturated image before the analysis
+    with timing.span('preflight'):
+        phantoms.preflight.check_image(input_file, 'fc2', config, log_message)
+
+    # large images are analyzed at the target pixel size of the config
+    with timing.span('resample'):
+        input_file = phantoms.resample.resample_input(input_file, config, output_dir, log_message)
+
     # Catphan analysis logic
     log_message('Running analysis...')
-    phantom = StandardImagingFC2(input_file)
-    params = config['analysis_params']
-    
-    phantom.analyze(
-        invert=False,
-        fwxm=params['fwxm'],
-        bb_edge_threshold_mm=params['bb_edge_threshold_mm']
-    )
+    phantom = phantoms.helper.load_and_analyze(load_phantom, analyze_phantom, input_file, config, log_message)
 
     # print results
     log_message(phantom.results())
 
     file = os.path.join(output_dir, 'analyzed_image.png')
     log_message(f'saving image: {file}')
-    phantom.save_analyzed_image(filename=file)
+    with timing.span('save_image'):
+        phantom.save_analyzed_image(filename=file)
+
+    # the baseline summary goes to the PDF notes and result.json
+    baseline, notes = phantoms.helper.compare_with_baseline(phantom, device_id, 'fc2', config, notes, log_message)
 
     phantoms.helper.copy_logo(config=config, output_dir=output_dir, log_message=log_message)
     
@@ -42,9 +61,9 @@ def run_analysis(device_id, input_file, output_dir, config, notes, metadata, log
 
     phantoms.helper.save_result_as_txt(phantom=phantom, output_dir=output_dir, log_message=log_message)
     
-    phantoms.helper.save_result_as_json(phantom=phantom, output_dir=output_dir, device_id=device_id, notes=notes, config=config, metadata=metadata, log_message=log_message)
+    phantoms.helper.save_result_as_json(phantom=phantom, output_dir=output_dir, device_id=device_id, notes=notes, config=config, metadata=metadata, log_message=log_message, baseline=baseline)
     
-    phantoms.helper.append_result_to_phantom_csv(phantom=phantom, output_dir=output_dir, device_id=device_id, notes=notes, metadata=metadata, log_message=log_message)
+    phantoms.helper.append_result_to_phantom_csv(phantom=phantom, output_dir=output_dir, device_id=device_id, notes=notes, metadata=metadata, log_message=log_message, config=config)
 
 
     log_message('Analysis completed.')
@@ -1,8 +1,17 @@
 import os
-import shutil
+import copy
+import glob
 import json
-import utils 
-
+import shutil
+import threading
+import utils.helper
+import utils.object
+import utils.sidecar
+import utils.baseline
+import dicom_helper
+from utils import timing, phantom_cache
+
+@timing.timed('logo')
 def copy_logo(config, output_dir, log_message):
     # copy logo file
     logo_file = config['publish_pdf_params']['logo']
@@ -15,6 +24,7 @@ def copy_logo(config, output_dir, log_message):
     else:
         log_message('logo_file not found. using default logo image.')
 
+@timing.timed('pdf')
 def save_result_as_pdf(phantom, output_dir, config, notes, metadata, log_message ):
     # Save the results as PDF, TXT, and JSON
     result_pdf = os.path.join(output_dir, 'result.pdf')
@@ -31,37 +41,57 @@ def save_result_as_pdf(phantom, output_dir, config, notes, metadata, log_message
         logo=params['logo']
     )
 
+@timing.timed('txt')
 def save_result_as_txt(phantom, output_dir, log_message):
     result_txt = os.path.join(output_dir, 'result.txt')
     log_message(f'Saving result TXT: {result_txt}')
     with open(result_txt, 'w') as file:
         file.write(phantom.results())
 
-def save_result_as_json(phantom, output_dir, device_id, notes, config, metadata, log_message ):
+@timing.timed('json')
+def save_result_as_json(phantom, output_dir, device_id, notes, config, metadata, log_message, baseline=None):
     result = phantom.results_data()
     result_json = os.path.join(output_dir, 'result.json')
 
-    result_dict = json.loads(json.dumps(vars(result), default=utils.helper.obj_serializer))
+    # large arrays (MTF curves, profiles...) go to the result_arrays sidecar, the JSON keeps a reference
+    array_writer = utils.sidecar.ArrayWriter(min_size=config.get('result_arrays_min_size', 1000))
+    result_dict = utils.helper.to_serializable(vars(result), array_hook=array_writer)
     result_dict['device_id'] = device_id
     result_dict['performed_by'] = metadata['Performed By']
     result_dict['performed_on'] = metadata['Performed Date']
     result_dict['notes'] =notes 
     result_dict['config'] = config
+    if baseline is not None:
+        result_dict['baseline'] = baseline
 
+    # compact unless result_json_indent is set in the phantom config
     log_message(f'Saving result JSON: {result_json}')
-    with open(result_json, 'w') as json_file:
-        json.dump(result_dict, json_file, indent=4)
+    utils.helper.write_json_file(result_json, result_dict, indent=config.get('result_json_indent'))
+    array_writer.save(output_dir, log_message=log_message)
 
-def write_line(file, line):
-    with open(file, 'w') as file:
-        file.write(f'{line}\n')
+@timing.timed('baseline')
+def compare_with_baseline(phantom, device_id, phantom_id, config, notes, log_message):
+    """Compares the results with the baseline of the device (utils.baseline), if enabled in the config.
 
-def append_line(file, line):
-    with open(file, 'a') as file:
-        file.write(f'{line}\n')
+    Returns the summary (None without a baseline) and the notes with the summary added, for the PDF.
+    """
+    if not utils.baseline.get_options(config)['enabled']:
+        return None, notes
 
+    site, device = device_id.split('|')
+    result = utils.helper.to_serializable(vars(phantom.results_data()))
+    summary = utils.baseline.compare_result(result, site, device, phantom_id, config, log_message=log_message)
+    if summary is None:
+        return None, notes
+    return summary, f'{notes}\n{utils.baseline.format_summary(summary)}'
 
-def append_result_to_phantom_csv(phantom, output_dir, device_id, notes, metadata, log_message ):
+@timing.timed('csv')
+def append_result_to_phantom_csv(phantom, output_dir, device_id, notes, metadata, log_message, config=None):
+
+    # off for runs that do not belong to the phantom's history (e.g. reprocess)
+    if config is not None and not config.get('results_csv', True):
+        log_message('results.csv is off for this run. skipping...')
+        return
 
     # result
     result_json = os.path.join(output_dir, 'result.json')
@@ -90,9 +120,134 @@ def append_result_to_phantom_csv(phantom, output_dir, device_id, notes, metadata
 
     log_message(f'csv_file={csv_file}')
 
-    if not os.path.exists(csv_file):
-        log_message('csv file not found. creating and adding the header...')
-        write_line(csv_file, header)
-    
     log_message('appending a result line to csv file')
-    append_line(file=csv_file, line=line)
+    utils.helper.append_csv_lines(csv_file, header, [line], log_message=log_message)
+
+def save_timings(recorder, output_dir, metrics_dir, log_message, **run_info):
+    """Adds the stage timings to result.json and appends them to the rolling metrics file."""
+    timings = recorder.to_dict()
+
+    result_json = os.path.join(output_dir, 'result.json')
+    if os.path.exists(result_json):
+        result_dict = utils.helper.read_json_file(result_json)
+        result_dict['timings'] = timings
+        utils.helper.write_json_file(result_json, result_dict, indent=result_dict.get('config', {}).get('result_json_indent'))
+
+    try:
+        import pylinac
+        pylinac_version = pylinac.__version__
+    except Exception:
+        pylinac_version = None
+
+    entry = {**run_info, 'output_dir': output_dir, 'pylinac_version': pylinac_version, **timings}
+    metrics_file = timing.append_timings(metrics_dir, entry)
+
+    stages = ', '.join(f"{name}={stage['wall_s']:.2f}s" for name, stage in timings['stages'].items())
+    log_message(f"Timings: total={timings['total_s']:.2f}s ({stages}) -> {metrics_file}")
+    return timings
+
+def validate_input_slices(files, config, log_message):
+    """Checks the slice geometry of a 3D series from the headers only, before anything is copied or decoded.
+
+    Returns the slice headers sorted by z. Depending on slice_validation.on_error of the phantom config,
+    an inconsistent series is refused ('refuse', raises an Exception) or trimmed to its largest
+    evenly spaced run of slices ('trim').
+    """
+    options = config.get('slice_validation', {})
+    tolerance = options.get('spacing_tolerance_mm', 0.1)
+
+    with timing.span('validate_slices'):
+        headers = dicom_helper.read_slice_headers(files, log_message=log_message)
+        report = dicom_helper.check_slice_geometry(headers, spacing_tolerance=tolerance)
+
+    log_message(f"{report['num_slices']} slices, spacing={report['spacing']} mm")
+    if len(report['errors']) == 0 or not options.get('enabled', True):
+        return headers
+
+    for error in report['errors']:
+        log_message(f'Slice geometry: {error}')
+
+    if options.get('on_error', 'refuse') != 'trim':
+        raise Exception(f"Inconsistent slice geometry: {'; '.join(report['errors'])}")
+
+    trimmed = dicom_helper.find_consistent_slices(headers, report, spacing_tolerance=tolerance)
+    min_slices = options.get('min_slices', 2)
+    if len(trimmed) < min_slices:
+        raise Exception(f'Inconsistent slice geometry: the largest consistent run has {len(trimmed)} slices (minimum {min_slices}).')
+
+    log_message(f"Trimmed to {len(trimmed)} of {len(headers)} slices (z={trimmed[0]['z']:.1f} to {trimmed[-1]['z']:.1f} mm)")
+    return trimmed
+
+def get_images(phantom):
+    # the pylinac images that hold the pixel data of a loaded phantom
+    if hasattr(phantom, 'dicom_stack'):
+        return phantom.dicom_stack.images
+    return [phantom.image]
+
+def get_image_nbytes(img):
+    # the array, plus the pixels the DICOM dataset keeps (PixelData and the decoded pixel_array)
+    nbytes = img.array.nbytes if getattr(img, 'array', None) is not None else 0
+    metadata = getattr(img, 'metadata', None)
+    if metadata is not None:
+        if 'PixelData' in metadata:
+            nbytes += len(metadata.PixelData)
+        pixel_array = getattr(metadata, '_pixel_array', None)
+        if pixel_array is not None:
+            nbytes += pixel_array.nbytes
+    return nbytes
+
+def get_phantom_nbytes(phantom):
+    return sum(get_image_nbytes(img) for img in get_images(phantom))
+
+def copy_phantom(phantom):
+    # deepcopy cannot copy locks (e.g. of the pylinac warnings), the copy gets new ones
+    lock_type = type(threading.Lock())
+    memo = {id(value): threading.Lock() for value in vars(phantom).values() if isinstance(value, lock_type)}
+    return copy.deepcopy(phantom, memo)
+
+def get_input_files(input_path):
+    if os.path.isdir(input_path):
+        return glob.glob(os.path.join(input_path, '*.dcm'))
+    return [input_path]
+
+def load_and_analyze(load_phantom, analyze_phantom, input_path, config, log_message):
+    """Loads and analyzes a phantom, using the in-session cache (utils.phantom_cache) if it is configured.
+
+    The cache keys are the content hash of the input, the phantom module and, for analyzed phantoms,
+    the analysis_params. A re-run with the same parameters reuses the analyzed phantom, and a re-run with
+    new parameters analyzes a copy of the loaded phantom without reading the input again.
+    """
+    cache = phantom_cache.get_cache()
+    if cache is None:
+        with timing.span('load'):
+            phantom = load_phantom(input_path, config)
+        with timing.span('analyze'):
+            analyze_phantom(phantom, config)
+        return phantom
+
+    with timing.span('hash_input'):
+        input_hash = phantom_cache.hash_files(get_input_files(input_path))
+    loaded_key = ('loaded', load_phantom.__module__, input_hash)
+    analyzed_key = ('analyzed', load_phantom.__module__, input_hash, json.dumps(config['analysis_params'], sort_keys=True))
+
+    phantom = cache.get(analyzed_key)
+    if phantom is not None:
+        log_message('Using the cached analysis (same input and analysis parameters).')
+        return phantom
+
+    loaded = cache.get(loaded_key)
+    if loaded is None:
+        with timing.span('load'):
+            loaded = load_phantom(input_path, config)
+        cache.put(loaded_key, loaded, get_phantom_nbytes(loaded))
+    else:
+        log_message('Using the cached image.')
+
+    # analyze() changes the phantom, the cached one stays as loaded
+    with timing.span('copy_phantom'):
+        phantom = copy_phantom(loaded)
+    with timing.span('analyze'):
+        analyze_phantom(phantom, config)
+
+    cache.put(analyzed_key, phantom, get_phantom_nbytes(phantom))
+    return phantom
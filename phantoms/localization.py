@@ -0,0 +1,145 @@
+import os
+import time
+
+import numpy as np
+from scipy import ndimage
+
+import utils.helper
+from utils import timing
+
+# Warm start of the 2D phantom localization from the history of the device.
+# Successful full searches of pylinac are recorded per device and phantom: the center, angle and size,
+# and a small template of the phantom region. The next analysis first compares the image at the stored
+# position with the template. If they match, the stored localization is passed to analyze() as the
+# center, angle and size overrides and pylinac skips its search. Otherwise pylinac searches as usual.
+DEFAULT_OPTIONS = {
+    'enabled': False,
+    'store': '_localization',     # folder of the localization files, one per device and phantom
+    'history': 10,                # number of detections kept, the seed is their median
+    'template_size': 64,          # pixels per side of the template
+    'min_correlation': 0.95,      # correlation of the image at the seed with the template
+    'max_seeded_runs': 20         # full search after this many runs from the seed, to refresh the history
+}
+
+def get_options(config):
+    return {**DEFAULT_OPTIONS, **config.get('localization', {})}
+
+def get_store_file(options, device_id, phantom_id):
+    name = f"{device_id.replace('|', '_')}_{phantom_id}".lower()
+    return os.path.join(options['store'], f'{name}.json')
+
+def load_store(store_file):
+    if not os.path.exists(store_file):
+        return {'history': [], 'template': None, 'seeded_runs': 0}
+    return utils.helper.read_json_file(store_file)
+
+def save_store(store_file, store):
+    os.makedirs(os.path.dirname(store_file) or '.', exist_ok=True)
+    tmp_file = store_file + '.tmp'
+    utils.helper.write_json_file(tmp_file, store)
+    os.replace(tmp_file, store_file)
+
+def get_seed(store, image_shape):
+    """The median center, angle and size of the detections on images of this shape, or None."""
+    history = [h for h in store['history'] if tuple(h['image_shape']) == tuple(image_shape)]
+    if len(history) == 0 or store.get('template') is None:
+        return None
+
+    return {'center': [float(np.median([h['center'][0] for h in history])), float(np.median([h['center'][1] for h in history]))],
+            'angle': float(np.median([h['angle'] for h in history])),
+            'radius': float(np.median([h['radius'] for h in history]))}
+
+def crop_region(array, center, radius, size, offset=(0, 0)):
+    """The square of side radius around center (x, y), resampled to size x size, or None if it is outside the image.
+
+    offset (x, y) moves the square by whole template pixels.
+    """
+    step = radius / size
+    x0 = center[0] - radius / 2 + offset[0] * step
+    y0 = center[1] - radius / 2 + offset[1] * step
+    if x0 < 0 or y0 < 0 or x0 + radius > array.shape[1] or y0 + radius > array.shape[0]:
+        return None
+
+    region = array[int(y0):int(np.ceil(y0 + radius)), int(x0):int(np.ceil(x0 + radius))].astype(np.float32)
+    return ndimage.zoom(region, (size / region.shape[0], size / region.shape[1]), order=1)
+
+def correlation(a, b):
+    a = a - a.mean()
+    b = b - b.mean()
+    denominator = np.sqrt((a * a).sum() * (b * b).sum())
+    if denominator == 0:
+        return 0.0
+    # the sign does not matter, the image may be inverted by the analysis
+    return float(abs((a * b).sum()) / denominator)
+
+def verify_seed(array, seed, template, min_correlation):
+    """True if the image at the seed matches the template better than min_correlation and better than
+    at the positions one template pixel away (i.e. the phantom did not move)."""
+    template = np.asarray(template, dtype=np.float32)
+    size = template.shape[0]
+
+    region = crop_region(array, seed['center'], seed['radius'], size)
+    if region is None:
+        return False, 0.0
+
+    score = correlation(region, template)
+    if score < min_correlation:
+        return False, score
+
+    for offset in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+        neighbor = crop_region(array, seed['center'], seed['radius'], size, offset=offset)
+        if neighbor is not None and correlation(neighbor, template) > score:
+            return False, score
+
+    return True, score
+
+def get_detection(phantom):
+    center = phantom.phantom_center
+    return {'center': [float(center.x), float(center.y)], 'angle': float(phantom.phantom_angle),
+            'radius': float(phantom.phantom_radius), 'image_shape': list(phantom.image.array.shape), 'time': time.time()}
+
+def seeded(analyze_phantom, phantom_id, device_id, config, log_message):
+    """Wraps analyze_phantom(phantom, config, overrides=None) so it starts from the stored localization of the device.
+
+    Returns analyze_phantom itself if localization is not enabled in the config.
+    """
+    options = get_options(config)
+    if not options['enabled']:
+        return analyze_phantom
+
+    store_file = get_store_file(options, device_id, phantom_id)
+
+    def analyze(phantom, config):
+        store = load_store(store_file)
+
+        with timing.span('localize'):
+            seed = get_seed(store, phantom.image.array.shape)
+            ok, score = False, None
+            if seed is not None and store.get('seeded_runs', 0) < options['max_seeded_runs']:
+                ok, score = verify_seed(phantom.image.array, seed, store['template'], options['min_correlation'])
+
+        if ok:
+            log_message(f"Using the stored localization (correlation {score:.3f}): center={seed['center']}, "
+                        f"angle={seed['angle']:.2f}, size={seed['radius']:.1f}")
+            analyze_phantom(phantom, config, overrides={'center_override': tuple(seed['center']),
+                                                        'angle_override': seed['angle'],
+                                                        'size_override': seed['radius']})
+            store['seeded_runs'] = store.get('seeded_runs', 0) + 1
+            save_store(store_file, store)
+            return
+
+        if score is not None:
+            log_message(f'The stored localization does not match the image (correlation {score:.3f}). Searching the phantom.')
+        analyze_phantom(phantom, config)
+
+        # record the detection of the full search
+        detection = get_detection(phantom)
+        template = crop_region(phantom.image.array, detection['center'], detection['radius'], options['template_size'])
+        if template is None:
+            return
+        store['history'] = (store['history'] + [detection])[-options['history']:]
+        store['template'] = np.round(template, 4).tolist()
+        store['seeded_runs'] = 0
+        save_store(store_file, store)
+
+    return analyze
@@ -0,0 +1,140 @@
+import numpy as np
+import pydicom
+from scipy import ndimage
+
+# Quick sanity checks of a 2D phantom image before the (slow) pylinac analysis.
+# All statistics are computed on a block-averaged copy of at most 'size' pixels per side.
+DEFAULT_OPTIONS = {
+    'enabled': False,            # opt in per phantom config once validated on the site's images
+    'size': 256,
+    'min_contrast': 0.02,       # (p99 - p1) / p99, below this the image is blank
+    'max_saturation': 0.05,     # fraction of pixels at the maximum value
+    'min_edge_energy': 0.002,   # mean gradient magnitude of the normalized image
+    'min_shape_score': 0.6,     # overlap of the phantom with its expected shape
+    'polarity': None            # 'bright' or 'dark' phantom on the background, None to skip
+}
+
+# outline of the phantom (or of the field for FC2) in the image
+EXPECTED_SHAPES = {
+    'qc3': 'rectangle',
+    'qckv': 'rectangle',
+    'fc2': 'rectangle',
+    'lasvegas': 'rectangle',
+    'leedstor': 'disc'
+}
+
+def get_options(config):
+    return {**DEFAULT_OPTIONS, **config.get('preflight', {})}
+
+def downsample(array, size):
+    # block average, so noise does not dominate the statistics
+    factor = int(np.ceil(max(array.shape) / size))
+    if factor <= 1:
+        return array.astype(np.float32)
+
+    rows, cols = (array.shape[0] // factor) * factor, (array.shape[1] // factor) * factor
+    blocks = array[:rows, :cols].astype(np.float32).reshape(rows // factor, factor, cols // factor, factor)
+    return blocks.mean(axis=(1, 3))
+
+def otsu_threshold(image, bins=256):
+    hist, edges = np.histogram(image, bins=bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    w0 = np.cumsum(hist)
+    w1 = w0[-1] - w0
+    m0 = np.cumsum(hist * centers) / np.maximum(w0, 1)
+    m1 = ((hist * centers).sum() - np.cumsum(hist * centers)) / np.maximum(w1, 1)
+    return centers[np.argmax(w0 * w1 * (m0 - m1) ** 2)]
+
+def get_phantom_mask(image):
+    """Returns the mask of the object at the image center and whether it is brighter than the background."""
+    threshold = otsu_threshold(image)
+    rows, cols = image.shape
+    center = image[rows * 2 // 5:rows * 3 // 5, cols * 2 // 5:cols * 3 // 5]
+    bright = np.median(center) > threshold
+    mask = image > threshold if bright else image <= threshold
+
+    # the connected object that covers the most of the center
+    labels, num = ndimage.label(mask)
+    if num > 1:
+        center_labels = labels[rows * 2 // 5:rows * 3 // 5, cols * 2 // 5:cols * 3 // 5]
+        counts = np.bincount(center_labels.ravel(), minlength=num + 1)
+        counts[0] = 0
+        mask = labels == np.argmax(counts)
+    mask = ndimage.binary_fill_holes(mask)
+    return mask, bool(bright)
+
+def shape_score(mask, shape):
+    """Overlap (intersection over union) of the mask with a disc or rectangle of the same moments."""
+    ys, xs = np.nonzero(mask)
+    if len(xs) < 10:
+        return 0.0
+
+    cy, cx = ys.mean(), xs.mean()
+    eigenvalues, eigenvectors = np.linalg.eigh(np.cov(np.vstack([ys - cy, xs - cx])))
+
+    # coordinates along the principal axes
+    yy, xx = np.indices(mask.shape)
+    coords = np.stack([yy.ravel() - cy, xx.ravel() - cx])
+    u, v = (eigenvectors.T @ coords).reshape(2, *mask.shape)
+
+    if shape == 'disc':
+        a, b = 2 * np.sqrt(eigenvalues)
+        template = (u / a) ** 2 + (v / b) ** 2 <= 1
+    else:
+        a, b = np.sqrt(3 * eigenvalues)
+        template = (np.abs(u) <= a) & (np.abs(v) <= b)
+
+    return float(np.count_nonzero(mask & template) / np.count_nonzero(mask | template))
+
+def image_statistics(array, size=256, shape=None):
+    """Computes the preflight statistics of a raw image array."""
+    image = downsample(array, size)
+    p1, p99 = np.percentile(image, [1, 99])
+    value_range = max(abs(p99), abs(p1), 1e-6)
+
+    stats = {
+        'contrast': float((p99 - p1) / value_range),
+        'saturation': float(np.count_nonzero(array == array.max()) / array.size)
+    }
+
+    normalized = np.clip((image - p1) / max(p99 - p1, 1e-6), 0, 1)
+    gy, gx = np.gradient(normalized)
+    stats['edge_energy'] = float(np.hypot(gx, gy).mean())
+
+    mask, bright = get_phantom_mask(normalized)
+    stats['polarity'] = 'bright' if bright else 'dark'
+    stats['phantom_fraction'] = float(mask.mean())
+    stats['shape_score'] = shape_score(mask, shape) if shape else None
+    return stats
+
+def check_image(input_file, phantom_id, config, log_message):
+    """Rejects an image that cannot be a good image of the phantom, before loading it with pylinac.
+
+    Raises an Exception with the reasons. Returns the statistics.
+    """
+    options = get_options(config)
+    if not options['enabled']:
+        return None
+
+    ds = pydicom.dcmread(input_file)
+    stats = image_statistics(ds.pixel_array, size=options['size'], shape=EXPECTED_SHAPES.get(phantom_id))
+    log_message('Preflight: ' + ', '.join(f'{k}={v:.3f}' if isinstance(v, float) else f'{k}={v}' for k, v in stats.items()))
+
+    reasons = []
+    if stats['contrast'] < options['min_contrast']:
+        reasons.append(f"blank image (contrast {stats['contrast']:.3f} < {options['min_contrast']})")
+    else:
+        if stats['saturation'] > options['max_saturation']:
+            reasons.append(f"saturated image ({stats['saturation']:.1%} of pixels at the maximum value)")
+        if stats['edge_energy'] < options['min_edge_energy']:
+            reasons.append(f"no structure in the image (edge energy {stats['edge_energy']:.4f})")
+        if stats['shape_score'] is not None and stats['shape_score'] < options['min_shape_score']:
+            reasons.append(f"the image does not look like a {phantom_id} phantom "
+                           f"({EXPECTED_SHAPES[phantom_id]} score {stats['shape_score']:.2f} < {options['min_shape_score']})")
+        if options['polarity'] and stats['polarity'] != options['polarity']:
+            reasons.append(f"inverted image (phantom is {stats['polarity']}, expected {options['polarity']})")
+
+    if len(reasons) > 0:
+        raise Exception(f"Preflight check failed for {input_file}: {'; '.join(reasons)}")
+
+    return stats
@@ -1,6 +1,30 @@
 import os
 from pylinac import StandardImagingQC3
-import phantoms
+from utils import timing
+import phantoms.preflight
+import phantoms.resample
+import phantoms.localization
+import phantoms.helper
+
+def load_phantom(input_file, config):
+    return StandardImagingQC3(input_file)
+
+def analyze_phantom(phantom, config, overrides=None):
+    params = config['analysis_params']
+    phantom.analyze(low_contrast_threshold=params['low_contrast_threshold'],
+                high_contrast_threshold=params['high_contrast_threshold'],
+                #invert=False,
+                ssd=params['ssd'],
+                low_contrast_method=params['low_contrast_method'],
+                visibility_threshold=params['visibility_threshold'],
+                #x_adjustment=params['x_adjustment'],
+                #y_adjustment=params['y_adjustment'],
+                #angle_adjustment=params['angle_adjustment'],
+                #roi_size_factor=params['roi_size_factor'],
+                #scaling_factor=params['scaling_factor'],
+                # center_override, angle_override and size_override (phantoms.localization)
+                **(overrides or {})
+    )
 
 def run_analysis(device_id, input_file, output_dir, config, notes, metadata, log_message):
 
@@ -18,33 +42,29 @@ def run_analysis(device_id, input_file, output_dir, config, notes, metadata, log
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
+    # reject a wrong, blank or saturated image before the analysis
+    with timing.span('preflight'):
+        phantoms.preflight.check_image(input_file, 'qc3', config, log_message)
+
+    # large images are analyzed at the target pixel size of the config
+    with timing.span('resample'):
+        input_file = phantoms.resample.resample_input(input_file, config, output_dir, log_message)
+
     # Catphan analysis logic
     log_message('Running analysis...')
-    phantom = StandardImagingQC3(input_file)
-    params = config['analysis_params']
-    
-    phantom.analyze(low_contrast_threshold=params['low_contrast_threshold'],
-                high_contrast_threshold=params['high_contrast_threshold'],
-                #invert=False,
-                #angle_override=False,
-                #center_override=False,
-                #size_override=False,
-                ssd=params['ssd'],
-                low_contrast_method=params['low_contrast_method'],
-                visibility_threshold=params['visibility_threshold'],
-                #x_adjustment=params['x_adjustment'],
-                #y_adjustment=params['y_adjustment'],
-                #angle_adjustment=params['angle_adjustment'],
-                #roi_size_factor=params['roi_size_factor'],
-                #scaling_factor=params['scaling_factor']
-    )
+    analyze = phantoms.localization.seeded(analyze_phantom, 'qc3', device_id, config, log_message)
+    phantom = phantoms.helper.load_and_analyze(load_phantom, analyze, input_file, config, log_message)
 
     # print results
     log_message(phantom.results())
 
     file = os.path.join(output_dir, 'analyzed_image.png')
     log_message(f'saving image: {file}')
-    phantom.save_analyzed_image(filename=file)
+    with timing.span('save_image'):
+        phantom.save_analyzed_image(filename=file)
+
+    # the baseline summary goes to the PDF notes and result.json
+    baseline, notes = phantoms.helper.compare_with_baseline(phantom, device_id, 'qc3', config, notes, log_message)
 
     phantoms.helper.copy_logo(config=config, output_dir=output_dir, log_message=log_message)
     
@@ -52,9 +72,9 @@ def run_analysis(device_id, input_file, output_dir, config, notes, metadata, log
 
     phantoms.helper.save_result_as_txt(phantom=phantom, output_dir=output_dir, log_message=log_message)
     
-    phantoms.helper.save_result_as_json(phantom=phantom, output_dir=output_dir, device_id=device_id, notes=notes, config=config, metadata=metadata, log_message=log_message)
+    phantoms.helper.save_result_as_json(phantom=phantom, output_dir=output_dir, device_id=device_id, notes=notes, config=config, metadata=metadata, log_message=log_message, baseline=baseline)
     
-    phantoms.helper.append_result_to_phantom_csv(phantom=phantom, output_dir=output_dir, device_id=device_id, notes=notes, metadata=metadata, log_message=log_message)
+    phantoms.helper.append_result_to_phantom_csv(phantom=phantom, output_dir=output_dir, device_id=device_id, notes=notes, metadata=metadata, log_message=log_message, config=config)
 
 
     log_message('Analysis completed.')
@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+import pydicom
+from pydicom.uid import ExplicitVRLittleEndian
+from scipy import ndimage
+
+# Optional downsampling of large 2D (EPID) images before the analysis.
+# The pixel spacing tags are scaled with the image, so pylinac computes the same mm (and dpmm at
+# isocenter, which also uses RTImageSID) on the smaller image. The SID is the same and is not changed.
+DEFAULT_OPTIONS = {
+    'enabled': False,
+    'target_pixel_mm': 0.4,   # pixel size at the detector (PixelSpacing/ImagePlanePixelSpacing) after downsampling
+    'method': 'bin',          # 'bin' (integer block mean) or 'antialias' (gaussian filter and linear resampling)
+    'min_factor': 1.5         # smaller reductions are not worth it
+}
+
+SPACING_TAGS = ('PixelSpacing', 'ImagePlanePixelSpacing')
+
+def get_options(config):
+    return {**DEFAULT_OPTIONS, **config.get('resample', {})}
+
+def get_pixel_spacing(ds):
+    for tag in SPACING_TAGS:
+        if tag in ds:
+            return [float(v) for v in ds.data_element(tag).value]
+    return None
+
+def get_factor(spacing, options):
+    """The reduction factor to reach the target pixel size (an integer for 'bin'), or None if it is too small."""
+    factor = options['target_pixel_mm'] / min(spacing)
+    if options['method'] == 'bin':
+        factor = np.floor(factor)
+    if factor < options['min_factor']:
+        return None
+    return float(factor)
+
+def bin_array(array, factor):
+    factor = int(factor)
+    rows, cols = (array.shape[0] // factor) * factor, (array.shape[1] // factor) * factor
+    blocks = array[:rows, :cols].astype(np.float64).reshape(rows // factor, factor, cols // factor, factor)
+    return blocks.mean(axis=(1, 3))
+
+def antialias_array(array, factor):
+    # gaussian low pass so the resampling does not alias fine patterns (line pairs) into lower frequencies
+    smoothed = ndimage.gaussian_filter(array.astype(np.float64), sigma=(factor - 1) / 2)
+    return ndimage.zoom(smoothed, 1 / factor, order=1)
+
+def downsample_array(array, factor, method='bin'):
+    if method == 'bin':
+        return bin_array(array, factor)
+    if method == 'antialias':
+        return antialias_array(array, factor)
+    raise Exception(f'Unknown resample method: {method}')
+
+def resample_dataset(ds, factor, method='bin'):
+    """Downsamples the pixel data of ds in place and scales the pixel spacing tags to match."""
+    array = ds.pixel_array
+    dtype = array.dtype
+    reduced = downsample_array(array, factor, method)
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        reduced = np.clip(np.round(reduced), info.min, info.max)
+    reduced = reduced.astype(dtype)
+
+    # the actual ratio (the edges may be cropped by binning)
+    scale_row = array.shape[0] / reduced.shape[0] if method == 'antialias' else factor
+    scale_col = array.shape[1] / reduced.shape[1] if method == 'antialias' else factor
+    for tag in SPACING_TAGS:
+        if tag in ds:
+            row_spacing, col_spacing = [float(v) for v in ds.data_element(tag).value]
+            ds.data_element(tag).value = [round(row_spacing * scale_row, 6), round(col_spacing * scale_col, 6)]
+
+    # written uncompressed
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+    ds.Rows, ds.Columns = reduced.shape
+    ds.PixelData = reduced.tobytes()
+    return ds
+
+def resample_input(input_file, config, output_dir, log_message):
+    """Writes a downsampled copy of input_file to output_dir and returns it, if resampling is enabled in
+    the config and the image is finer than the target pixel size. Otherwise returns input_file."""
+    options = get_options(config)
+    if not options['enabled']:
+        return input_file
+
+    ds = pydicom.dcmread(input_file)
+    spacing = get_pixel_spacing(ds)
+    if spacing is None:
+        log_message('Resample: no pixel spacing in the image, analyzing it at full resolution.')
+        return input_file
+
+    factor = get_factor(spacing, options)
+    if factor is None:
+        return input_file
+
+    rows, cols = ds.Rows, ds.Columns
+    resample_dataset(ds, factor, options['method'])
+    output_file = os.path.join(output_dir, 'input_resampled.dcm')
+    ds.save_as(output_file, write_like_original=False)
+
+    log_message(f"Resample ({options['method']}): {cols}x{rows} -> {ds.Columns}x{ds.Rows}, "
+                f"pixel {min(spacing):.3f} -> {min(get_pixel_spacing(ds)):.3f} mm")
+    return output_file
@@ -0,0 +1,238 @@
+import os
+import time
+import fnmatch
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_pdf import PdfPages
+import matplotlib.image
+
+from utils import helper, cases, baseline
+from utils.object import flatten
+
+from app_logger import logger
+
+# Summary report of the runs of a device (all or some phantoms) over a date range, in one PDF:
+# a table of the runs, trend plots of the metrics and the analyzed images of the runs.
+# Everything comes from the case folders (result.json and analyzed_image.png); nothing is re-analyzed
+# or re-rendered by pylinac.
+
+DEFAULT_OPTIONS = {
+    'metrics': {},          # phantom id -> metric key patterns to plot; default: the metrics that vary
+    'max_metrics': 24,      # per phantom, when no patterns are given
+    'ignore': ['config_*', 'timings_*', 'baseline_*'],
+    'table_rows_per_page': 45,
+    'plots_per_page': 6,
+    'thumbnails_per_page': 12,
+    'thumbnail_size': 400   # longest side in pixels
+}
+
+def get_options(config):
+    return {**DEFAULT_OPTIONS, **config.get('report', {})}
+
+def load_runs(case_list, log_message=print):
+    """The runs of the cases: {'case', 'datetime', 'result', 'numbers'}; cases without a result.json are left out."""
+    runs = []
+    for case in case_list:
+        result = cases.read_case_result(case['case_dir'])
+        if result is None:
+            log_message(f"result.json not found. skipping... {case['case_dir']}")
+            continue
+        numbers = {item['key']: item['value'] for item in flatten(result)
+                   if isinstance(item['value'], (int, float)) and not isinstance(item['value'], bool)}
+        runs.append({'case': case, 'datetime': case['datetime'], 'result': result, 'numbers': numbers})
+    return runs
+
+def select_metrics(runs, patterns=None, ignore=(), max_metrics=24):
+    """The metric keys to plot: the keys matching patterns, or the keys in at least half of the runs that vary."""
+    counts = {}
+    for run in runs:
+        for key in run['numbers']:
+            counts[key] = counts.get(key, 0) + 1
+    keys = sorted(k for k in counts if not any(fnmatch.fnmatch(k, p) for p in ignore))
+
+    if patterns:
+        return [k for k in keys if any(fnmatch.fnmatch(k, p) for p in patterns)]
+
+    keys = [k for k in keys if counts[k] * 2 >= len(runs)]
+    matrix = to_matrix(runs, keys)
+    varying = [k for k, column in zip(keys, matrix.T) if np.nanmax(column) > np.nanmin(column)]
+    return varying[:max_metrics]
+
+def to_matrix(runs, keys):
+    # runs x keys, NaN where a run has no value
+    matrix = np.full((len(runs), len(keys)), np.nan)
+    for row, run in enumerate(runs):
+        numbers = run['numbers']
+        matrix[row] = [numbers.get(key, np.nan) for key in keys]
+    return matrix
+
+def summary_pages(title, runs, baseline_statuses, per_page=45):
+    """Figures of the table of the runs, per_page rows per page."""
+    num_pages = max(1, int(np.ceil(len(runs) / per_page)))
+    figures = []
+    for page in range(num_pages):
+        fig = Figure(figsize=(8.5, 11))
+        fig.text(0.5, 0.95, title, ha='center', fontsize=16)
+        subtitle = f'{len(runs)} runs, generated {datetime.now().strftime("%Y-%m-%d %H:%M")}'
+        if num_pages > 1:
+            subtitle += f', page {page + 1} of {num_pages}'
+        fig.text(0.5, 0.92, subtitle, ha='center', fontsize=10)
+
+        ax = fig.add_axes([0.05, 0.05, 0.9, 0.85])
+        ax.axis('off')
+        rows = [[run['datetime'].strftime('%Y-%m-%d %H:%M'), run['case']['phantom'], run['result'].get('performed_by', ''),
+                 baseline_statuses.get(run['case']['case_dir'], '')] for run in runs[page * per_page:(page + 1) * per_page]]
+        if rows:
+            table = ax.table(cellText=rows, colLabels=['Date', 'Phantom', 'Performed by', 'Baseline'], loc='upper center', cellLoc='left')
+            table.auto_set_font_size(False)
+            table.set_fontsize(8)
+        figures.append(fig)
+    return figures
+
+def trend_pages(phantom, runs, keys, reference=None, per_page=6):
+    """Figures of the trend plots of a phantom. reference is a baseline.Comparator (reference values and limits)."""
+    dates = [run['datetime'] for run in runs]
+    matrix = to_matrix(runs, keys)
+
+    rows = int(np.ceil(per_page / 2))
+
+    figures = []
+    for start in range(0, len(keys), per_page):
+        fig = Figure(figsize=(8.5, 11))
+        fig.suptitle(f'{phantom} trends', fontsize=14)
+        for i, key in enumerate(keys[start:start + per_page]):
+            column = start + i
+            ax = fig.add_subplot(rows, 2, i + 1)
+            ax.plot(dates, matrix[:, column], 'o-', markersize=3)
+            if reference is not None and key in reference.index:
+                j = reference.index[key]
+                value, limit = reference.references[j], reference.limits[j]
+                ax.axhline(value, color='green', linewidth=0.8)
+                ax.axhspan(value - limit, value + limit, color='green', alpha=0.1)
+            ax.set_title(key, fontsize=8)
+            ax.tick_params(labelsize=6)
+            for label in ax.get_xticklabels():
+                label.set_rotation(30)
+        fig.tight_layout(rect=[0, 0, 1, 0.96])
+        figures.append(fig)
+    return figures
+
+def load_thumbnail(image_file, size=400):
+    # the stored analyzed_image.png, decimated to about size pixels (no interpolation)
+    image = matplotlib.image.imread(image_file)
+    step = max(1, int(np.ceil(max(image.shape[:2]) / size)))
+    return image[::step, ::step]
+
+def thumbnail_pages(runs, per_page=12, size=400):
+    runs = [run for run in runs if os.path.exists(os.path.join(run['case']['case_dir'], 'analyzed_image.png'))]
+    columns = 3
+    rows = int(np.ceil(per_page / columns))
+
+    figures = []
+    for start in range(0, len(runs), per_page):
+        fig = Figure(figsize=(8.5, 11))
+        fig.suptitle('Analyzed images', fontsize=14)
+        for i, run in enumerate(runs[start:start + per_page]):
+            ax = fig.add_subplot(rows, columns, i + 1)
+            ax.imshow(load_thumbnail(os.path.join(run['case']['case_dir'], 'analyzed_image.png'), size))
+            ax.set_title(f"{run['case']['phantom']} {run['datetime'].strftime('%Y-%m-%d %H:%M')}", fontsize=7)
+            ax.axis('off')
+        fig.tight_layout(rect=[0, 0, 1, 0.96])
+        figures.append(fig)
+    return figures
+
+def get_comparator(site, device, phantom, get_phantom_config):
+    # the baseline of the phantom, if there is one
+    try:
+        options = baseline.get_options(get_phantom_config(site, device, phantom))
+    except Exception:
+        return None
+    data = baseline.load_baseline(baseline.get_baseline_file(options['folder'], site, device, phantom))
+    if data is None:
+        return None
+    return baseline.Comparator(data, options['tolerances'], options['warn_fraction'], options['ignore'])
+
+def build_report(case_list, report_file, title, options=None, get_phantom_config=None, log_message=print):
+    """Writes the report of the cases to report_file. Returns the number of runs.
+
+    get_phantom_config(site, device, phantom) returns the phantom config, for the baselines (optional).
+    """
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    t0 = time.perf_counter()
+    runs = sorted(load_runs(case_list, log_message=log_message), key=lambda run: run['datetime'])
+    if len(runs) == 0:
+        raise Exception('No runs with results found.')
+
+    groups = {}
+    for run in runs:
+        case = run['case']
+        groups.setdefault((case['site'], case['device'], case['phantom']), []).append(run)
+
+    baseline_statuses = {}
+    trends = []
+    for (site, device, phantom), group in groups.items():
+        comparator = get_comparator(site, device, phantom, get_phantom_config) if get_phantom_config else None
+        if comparator is not None:
+            for run, summary in zip(group, comparator.compare([run['result'] for run in group])):
+                baseline_statuses[run['case']['case_dir']] = summary['status']
+
+        keys = select_metrics(group, patterns=options['metrics'].get(phantom.lower()), ignore=options['ignore'],
+                              max_metrics=options['max_metrics'])
+        trends.append((phantom, group, keys, comparator))
+
+    os.makedirs(os.path.dirname(os.path.abspath(report_file)), exist_ok=True)
+    with PdfPages(report_file) as pdf:
+        for fig in summary_pages(title, runs, baseline_statuses, per_page=options['table_rows_per_page']):
+            pdf.savefig(fig)
+        for phantom, group, keys, comparator in trends:
+            for fig in trend_pages(phantom, group, keys, reference=comparator, per_page=options['plots_per_page']):
+                pdf.savefig(fig)
+        for fig in thumbnail_pages(runs, per_page=options['thumbnails_per_page'], size=options['thumbnail_size']):
+            pdf.savefig(fig)
+
+    log_message(f'report saved: {report_file} ({len(runs)} runs, {time.perf_counter() - t0:.1f}s)')
+    return len(runs)
+
+def get_month_range(month):
+    start = datetime.strptime(month, '%Y-%m')
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(seconds=1)
+    return start, end
+
+def main():
+    import analysis_runner
+
+    parser = argparse.ArgumentParser(description='One PDF report of the runs of a device over a date range.')
+    parser.add_argument('--config', default='config.json', help='app config file (output_folder, report)')
+    parser.add_argument('--output-folder', help='case folder root (default: output_folder in the config)')
+    parser.add_argument('--site', required=True)
+    parser.add_argument('--device', required=True)
+    parser.add_argument('--phantom', help='one phantom (default: all)')
+    parser.add_argument('--month', help='yyyy-mm (default: the previous month)')
+    parser.add_argument('--start', help='first date (yyyy-mm-dd), instead of --month')
+    parser.add_argument('--end', help='last date (yyyy-mm-dd), instead of --month')
+    parser.add_argument('--output', help='PDF file (default: <output folder>/reports/<site>_<device>_<period>.pdf)')
+    args = parser.parse_args()
+
+    config = helper.read_json_file(args.config)
+    output_folder = args.output_folder or config['output_folder']
+
+    if args.start or args.end:
+        start = datetime.strptime(args.start, '%Y-%m-%d') if args.start else None
+        end = datetime.strptime(args.end + ' 23:59:59', '%Y-%m-%d %H:%M:%S') if args.end else None
+        period = f"{args.start or ''}_{args.end or ''}"
+    else:
+        month = args.month or (datetime.now().replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+        start, end = get_month_range(month)
+        period = month
+
+    case_list = cases.find_case_folders(output_folder, site=args.site, device=args.device, phantom=args.phantom, start=start, end=end)
+    report_file = args.output or os.path.join(output_folder, 'reports', f'{args.site.lower()}_{args.device.lower()}_{period}.pdf')
+
+    build_report(case_list, report_file, title=f'{args.site} {args.device} QC report {period}', options=get_options(config),
+                 get_phantom_config=analysis_runner.load_phantom_config, log_message=logger.info)
+
+if __name__ == '__main__':
+    main()
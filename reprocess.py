@@ -0,0 +1,211 @@
+import os
+import csv
+import fnmatch
+import argparse
+import multiprocessing
+from datetime import datetime
+
+from utils import helper, cases, timing
+from utils.checkpoint import Checkpoint
+from utils.object import flatten
+import phantoms.helper
+import analysis_runner
+
+from app_logger import logger, logs_dir
+
+APP_VERSION = '0.1.1'
+
+# Re-analyzes archived cases (e.g. after a pylinac upgrade or a tolerance change) from their stored input files.
+# The results of a version go to <case>/reprocess/<version>/, the original results are not changed.
+# Cases are handed to a process pool whose workers are replaced after maxtasksperchild cases, so memory
+# held by pylinac and matplotlib does not grow over thousands of cases. Finished cases are recorded in a
+# checkpoint file, so an interrupted run resumes where it stopped.
+
+REPROCESS_FOLDER = 'reprocess'
+
+# result keys that change on every analysis
+DEFAULT_IGNORE = ['config_*', 'timings_*', 'notes', 'performed_by', 'performed_on', 'device_id', 'date_of_analysis',
+                  'pylinac_version', '*filename*', '*_file']
+
+def get_default_version():
+    import pylinac
+    return f'pylinac_{pylinac.__version__}'
+
+def get_version_dir(case_dir, version):
+    # version None is the original analysis in the case folder
+    return case_dir if version is None else os.path.join(case_dir, REPROCESS_FOLDER, version)
+
+def reprocess_case(task):
+    """Analyzes one archived case into its version folder. Runs in a worker process."""
+    case, version, config_dir, app_config, metrics_dir = task
+    case_dir = case['case_dir']
+    output_dir = get_version_dir(case_dir, version)
+    lines = []
+
+    def log_message(message):
+        lines.append(f'{message}')
+
+    with timing.record() as recorder:
+        try:
+            input_files = cases.get_case_input_files(case_dir)
+            if len(input_files) == 0:
+                raise Exception('No input files in the case folder.')
+
+            dim = analysis_runner.get_phantom_dim(app_config, case['phantom'])
+            module = analysis_runner.get_phantom_module(case['phantom'])
+            config = analysis_runner.load_phantom_config(case['site'], case['device'], case['phantom'], config_dir=config_dir)
+            config['publish_pdf_params']['open_file'] = False
+            # the stored localization belongs to the current images of the device
+            config['localization'] = {'enabled': False}
+            # the phantom's results.csv is the history of the original runs
+            config['results_csv'] = False
+
+            original = cases.read_case_result(case_dir) or {}
+            metadata = config['publish_pdf_params']['metadata']
+            metadata['Performed By'] = original.get('performed_by', '')
+            metadata['Performed Date'] = original.get('performed_on', '')
+            notes = f"{original.get('notes', '')}\nReprocessed ({version})"
+            device_id = original.get('device_id', f"{case['site']}|{case['device']}")
+
+            os.makedirs(output_dir, exist_ok=True)
+            input_path = input_files[0] if dim == 2 else case_dir
+            with timing.span('run_analysis'):
+                analysis_runner.run_module(module, dim, device_id, input_path, output_dir, config, notes, metadata,
+                                           log_message=log_message)
+        except Exception as e:
+            return {'case_dir': case_dir, 'status': 'error', 'error': str(e), 'total_s': round(recorder.total_s(), 3), 'log': lines}
+
+    if metrics_dir:
+        phantoms.helper.save_timings(recorder, output_dir=output_dir, metrics_dir=metrics_dir, log_message=log_message,
+                                     stage='reprocess', device_id=device_id, phantom=case['phantom'], app_version=APP_VERSION)
+    return {'case_dir': case_dir, 'status': 'ok', 'error': None, 'total_s': round(recorder.total_s(), 3), 'log': lines}
+
+def reprocess(case_list, version, checkpoint, processes=None, maxtasksperchild=20, config_dir=None, app_config=None,
+              metrics_dir=None, log_message=print):
+    """Re-analyzes the cases that are not in the checkpoint. Returns the results of this run.
+
+    Cases that fail are not checkpointed, so the next run tries them again.
+    If metrics_dir is given, the stage timings are appended to the metrics file.
+    """
+    app_config = app_config or analysis_runner.load_app_config()
+    tasks = [(case, version, config_dir, app_config, metrics_dir) for case in case_list if not checkpoint.is_done(case['case_dir'])]
+    log_message(f'{len(case_list) - len(tasks)} of {len(case_list)} cases already reprocessed ({version})')
+    if len(tasks) == 0:
+        return []
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes=processes, initializer=analysis_runner.warm_up, maxtasksperchild=maxtasksperchild) as pool:
+        for i, result in enumerate(pool.imap_unordered(reprocess_case, tasks)):
+            if result['status'] == 'ok':
+                checkpoint.mark_done(result['case_dir'])
+            else:
+                log_message(f"error: {result['case_dir']} - {result['error']}")
+            log_message(f"[{i + 1}/{len(tasks)}] {result['status']} {result['case_dir']} ({result['total_s']}s)")
+            results.append(result)
+
+    return results
+
+def get_metrics(result, ignore):
+    return {item['key']: item['value'] for item in flatten(result)
+            if not any(fnmatch.fnmatch(item['key'], pattern) for pattern in ignore)}
+
+def diff_results(old, new, rel_tol=1e-6, abs_tol=1e-9, ignore=DEFAULT_IGNORE):
+    """The metrics of two result dicts that changed: [{'key', 'old', 'new', 'change'}].
+
+    Numbers change when they differ by more than abs_tol + rel_tol * |old|. Added and removed keys are included.
+    """
+    old_metrics = get_metrics(old, ignore)
+    new_metrics = get_metrics(new, ignore)
+
+    rows = []
+    for key in sorted(set(old_metrics) | set(new_metrics)):
+        a, b = old_metrics.get(key), new_metrics.get(key)
+        numbers = isinstance(a, (int, float)) and isinstance(b, (int, float))
+        if numbers:
+            if abs(b - a) <= abs_tol + rel_tol * abs(a):
+                continue
+            change = b - a
+        elif a == b:
+            continue
+        else:
+            change = None
+        rows.append({'key': key, 'old': a, 'new': b, 'change': change})
+    return rows
+
+def diff_report(case_list, version, from_version=None, report_file=None, rel_tol=1e-6, abs_tol=1e-9, ignore=DEFAULT_IGNORE,
+                log_message=print):
+    """Writes the metrics that changed between two versions of the cases to a CSV file. Returns the rows.
+
+    from_version None compares with the original results in the case folders.
+    """
+    rows = []
+    num_compared = 0
+    for case in case_list:
+        old = cases.read_case_result(get_version_dir(case['case_dir'], from_version))
+        new = cases.read_case_result(get_version_dir(case['case_dir'], version))
+        if old is None or new is None:
+            continue
+
+        num_compared += 1
+        for row in diff_results(old, new, rel_tol=rel_tol, abs_tol=abs_tol, ignore=ignore):
+            rows.append({'case_dir': case['case_dir'], 'site': case['site'], 'device': case['device'],
+                         'phantom': case['phantom'], **row})
+
+    if report_file:
+        with open(report_file, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=['case_dir', 'site', 'device', 'phantom', 'key', 'old', 'new', 'change'])
+            writer.writeheader()
+            writer.writerows(rows)
+        log_message(f'diff report saved: {report_file}')
+
+    changed_cases = len({row['case_dir'] for row in rows})
+    log_message(f"{changed_cases} of {num_compared} cases changed between {from_version or 'original'} and {version}")
+    counts = {}
+    for row in rows:
+        counts[row['key']] = counts.get(row['key'], 0) + 1
+    for key, count in sorted(counts.items(), key=lambda kv: -kv[1])[:20]:
+        log_message(f'  {key}: {count} cases')
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-analyze archived cases into a versioned subfolder and report the changed metrics.')
+    parser.add_argument('--config', default='config.json', help='app config file (output_folder)')
+    parser.add_argument('--output-folder', help='case folder root (default: output_folder in the config)')
+    parser.add_argument('--site')
+    parser.add_argument('--device')
+    parser.add_argument('--phantom')
+    parser.add_argument('--start', help='first case date (yyyy-mm-dd)')
+    parser.add_argument('--end', help='last case date (yyyy-mm-dd)')
+    parser.add_argument('--version', help='name of the result subfolder (default: pylinac_<version>)')
+    parser.add_argument('--config-dir', help='folder of the phantom configs to use (e.g. new tolerances)')
+    parser.add_argument('--processes', type=int, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--maxtasksperchild', type=int, default=20, help='cases per worker process before it is replaced')
+    parser.add_argument('--diff-from', help='version to compare with (default: the original results)')
+    parser.add_argument('--diff-only', action='store_true', help='only write the diff report')
+    parser.add_argument('--rel-tol', type=float, default=1e-6, help='relative change of a number that is reported')
+    args = parser.parse_args()
+
+    config = helper.read_json_file(args.config)
+    output_folder = args.output_folder or config['output_folder']
+    version = args.version or get_default_version()
+
+    def log_message(message):
+        logger.info(message)
+
+    start = datetime.strptime(args.start, '%Y-%m-%d') if args.start else None
+    end = datetime.strptime(args.end + ' 23:59:59', '%Y-%m-%d %H:%M:%S') if args.end else None
+    case_list = cases.find_case_folders(output_folder, site=args.site, device=args.device, phantom=args.phantom, start=start, end=end)
+    log_message(f'{len(case_list)} case folders found in {output_folder}')
+
+    if not args.diff_only:
+        checkpoint = Checkpoint(os.path.join(output_folder, f'_reprocess_{version}_checkpoint.txt'))
+        reprocess(case_list, version, checkpoint, processes=args.processes, maxtasksperchild=args.maxtasksperchild,
+                  config_dir=args.config_dir, app_config=config, metrics_dir=logs_dir, log_message=log_message)
+
+    report_file = os.path.join(output_folder, f"reprocess_{version}_diff_from_{args.diff_from or 'original'}.csv")
+    diff_report(case_list, version, from_version=args.diff_from, report_file=report_file, rel_tol=args.rel_tol,
+                log_message=log_message)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+import os
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from utils import helper, webservice
+import phantoms.classifier
+import analysis_runner
+import backfill
+
+from app_logger import logger, logs_dir
+
+APP_VERSION = '0.1.1'
+
+# A QC session: the images of one device (e.g. the morning QCkV, QC3, FC2 and CatPhan) are assigned to
+# phantoms (by the classifier or by the user), analyzed at the same time on a pool of worker processes,
+# summarized in one session folder and pushed to the server together.
+
+def find_session_files(paths):
+    """The files of the paths; folders are searched recursively."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names))
+        else:
+            files.append(path)
+    return files
+
+def make_session_cases(classified, app_config, site, device, assignments=None, min_confidence=0.6):
+    """Groups classified files into cases: one per 2D image, one per CT series.
+
+    assignments ({file: phantom id, or None to leave the file out}) override the classifier.
+    Returns (cases, unassigned files).
+    """
+    assignments = assignments or {}
+    cases = {}
+    unassigned = []
+    for result in classified:
+        file = result['file']
+        if file in assignments:
+            phantom = assignments[file]
+            if phantom is None:
+                continue
+        elif result['phantom'] is not None and result['confidence'] >= min_confidence:
+            phantom = result['phantom']
+        else:
+            unassigned.append(file)
+            continue
+
+        key = file if analysis_runner.get_phantom_dim(app_config, phantom) == 2 else (phantom, result.get('series_uid'))
+        case = cases.setdefault(key, {'site': site, 'device': device, 'phantom': phantom, 'files': []})
+        case['files'].append(file)
+
+    return list(cases.values()), unassigned
+
+def make_unassigned_cases(classified, unassigned, site, device):
+    """Cases without a phantom (None) for the unassigned files, for the user to pick one: one per CT series,
+    one per other file. 'candidates' are the phantoms the classifier could not decide between."""
+    unassigned = set(unassigned)
+    cases = {}
+    for result in classified:
+        file = result['file']
+        if file not in unassigned:
+            continue
+        key = ('CT', result.get('series_uid')) if result.get('modality') == 'CT' and result.get('series_uid') else file
+        case = cases.setdefault(key, {'site': site, 'device': device, 'phantom': None, 'files': [],
+                                      'candidates': phantoms.classifier.get_candidates(result)})
+        case['files'].append(file)
+    return list(cases.values())
+
+def classify_session(paths, app_config, site, device, min_confidence=0.6, log_message=print):
+    """Returns (cases, unassigned cases); the unassigned cases have no phantom (see make_unassigned_cases)."""
+    files = find_session_files(paths)
+    log_message(f'classifying {len(files)} files...')
+    classified = phantoms.classifier.classify_files(files, app_config, log_message=log_message)
+    cases, unassigned = make_session_cases(classified, app_config, site, device, min_confidence=min_confidence)
+    return cases, make_unassigned_cases(classified, unassigned, site, device)
+
+def create_executor(max_workers):
+    # spawned workers import pylinac and parse the configs once (analysis_runner.warm_up)
+    context = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=analysis_runner.warm_up)
+
+def run_session(cases, output_folder, performed_by='', performed_date=None, notes='', max_workers=None,
+                metrics_dir=None, executor=None, log_message=print):
+    """Analyzes the cases at the same time. Returns the session summary, also saved in the session folder."""
+    performed_date = performed_date or datetime.now().strftime('%Y-%m-%d')
+    started = datetime.now()
+
+    own_executor = executor is None
+    if own_executor:
+        executor = create_executor(max_workers or min(len(cases), os.cpu_count() or 1))
+
+    results = [None] * len(cases)
+    try:
+        futures = {}
+        for i, case in enumerate(cases):
+            job = {**case, 'output_folder': output_folder, 'performed_by': performed_by, 'performed_date': performed_date,
+                   'notes': notes, 'metrics_dir': metrics_dir, 'app_version': APP_VERSION}
+            log_message(f"queueing {case['phantom']} ({len(case['files'])} files)")
+            futures[executor.submit(analysis_runner.run_job, job)] = i
+
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'status': 'error', 'case_dir': None, 'error': str(e), 'log': []}
+
+            for line in result.get('log', []):
+                log_message(f"[{cases[i]['phantom']}] {line}")
+            log_message(f"{cases[i]['phantom']} {result['status']} ({result.get('total_s')}s)")
+            results[i] = result
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
+
+    summary = make_session_summary(cases, results, performed_by, performed_date, started, datetime.now())
+    save_session_summary(summary, output_folder, log_message=log_message)
+    return summary
+
+def make_session_summary(cases, results, performed_by, performed_date, started, finished):
+    site, device = (cases[0]['site'], cases[0]['device']) if cases else ('', '')
+    return {
+        'site': site,
+        'device': device,
+        'performed_by': performed_by,
+        'performed_date': performed_date,
+        'started': started.isoformat(),
+        'wall_s': round((finished - started).total_seconds(), 3),
+        'cases': [{'phantom': case['phantom'], 'num_files': len(case['files']), 'status': result['status'],
+                   'case_dir': result.get('case_dir'), 'error': result.get('error'), 'total_s': result.get('total_s')}
+                  for case, result in zip(cases, results)]
+    }
+
+def format_session_summary(summary):
+    lines = [f"Session {summary['site']}|{summary['device']} {summary['performed_date']} by {summary['performed_by']}",
+             f"wall time {summary['wall_s']}s, sum of analysis times {round(sum(c['total_s'] or 0 for c in summary['cases']), 3)}s",
+             '']
+    for case in summary['cases']:
+        lines.append(f"{case['phantom']:<10} {case['status']:<6} {case['total_s'] or '':>8} {case['case_dir'] or case['error'] or ''}")
+    return '\n'.join(lines)
+
+def save_session_summary(summary, output_folder, log_message=print):
+    # output_folder/sessions/<site>_<device>_<yyyyMMdd_HHmmss>/
+    started = datetime.fromisoformat(summary['started'])
+    session_dir = os.path.join(output_folder, 'sessions',
+                               f"{summary['site'].lower()}_{summary['device'].lower()}_{started.strftime('%Y%m%d_%H%M%S')}")
+    os.makedirs(session_dir, exist_ok=True)
+    summary['session_dir'] = session_dir
+
+    helper.write_json_file(os.path.join(session_dir, 'session.json'), summary, indent=4)
+    with open(os.path.join(session_dir, 'session.txt'), 'w') as file:
+        file.write(format_session_summary(summary) + '\n')
+    log_message(f'session summary saved: {session_dir}')
+    return session_dir
+
+def push_session(summary, config, app, log_message=print):
+    """Pushes the successful cases of a session.
+
+    The result document (and zipped case folder) of each case goes to its phantom endpoint, as a single push
+    does. The metrics of all the cases are combined into one number1ds and one string1ds POST.
+    """
+    number1ds, string1ds = [], []
+    for case in summary['cases']:
+        if case['status'] != 'ok':
+            continue
+
+        url = config['webservice_url'] + f"/{case['phantom'].lower()}results"
+        webservice.post_analysis_result(result_folder=case['case_dir'], config=config, url=url, log_message=log_message)
+
+        numbers, strings = backfill.build_case_records({'case_dir': case['case_dir'], 'site': summary['site'],
+                                                        'device': summary['device'], 'phantom': case['phantom']},
+                                                       app, log_message)
+        number1ds.extend(numbers)
+        string1ds.extend(strings)
+
+    for kind, records in (('number1ds', number1ds), ('string1ds', string1ds)):
+        if len(records) > 0:
+            log_message(f'posting {len(records)} {kind} of the session...')
+            webservice.post(records, config['webservice_url'] + f'/{kind}')
+
+    return len(number1ds), len(string1ds)
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze the QC images of a session (one device) at the same time.')
+    parser.add_argument('paths', nargs='+', help='folders and files of the session')
+    parser.add_argument('--site', required=True)
+    parser.add_argument('--device', required=True)
+    parser.add_argument('--config', default='config.json', help='app config file')
+    parser.add_argument('--output-folder', help='case folder root (default: output_folder in the config)')
+    parser.add_argument('--assign', action='append', default=[], metavar='FILE=PHANTOM',
+                        help='phantom of a file, overrides the classifier (repeat for more files)')
+    parser.add_argument('--performed-by', default='')
+    parser.add_argument('--notes', default='')
+    parser.add_argument('--max-workers', type=int)
+    parser.add_argument('--push', action='store_true', help='push the results to the server')
+    args = parser.parse_args()
+
+    config = helper.read_json_file(args.config)
+    options = config.get('session', {})
+
+    def log_message(message):
+        logger.info(message)
+
+    files = find_session_files(args.paths)
+    assignments = dict(a.split('=', 1) for a in args.assign)
+    classified = phantoms.classifier.classify_files(files, config, log_message=log_message)
+    cases, unassigned = make_session_cases(classified, config, args.site, args.device, assignments=assignments,
+                                           min_confidence=options.get('min_confidence', 0.6))
+    for file in unassigned:
+        log_message(f'phantom not recognized, not analyzed: {file}')
+    if len(cases) == 0:
+        raise Exception('No phantom images found.')
+
+    summary = run_session(cases, args.output_folder or config['output_folder'], performed_by=args.performed_by,
+                          notes=args.notes, max_workers=args.max_workers or options.get('max_workers'),
+                          metrics_dir=logs_dir, log_message=log_message)
+    print(format_session_summary(summary))
+
+    if args.push:
+        push_session(summary, config, f'{helper.get_app_name()} {APP_VERSION}', log_message=log_message)
+
+if __name__ == '__main__':
+    main()
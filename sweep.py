@@ -0,0 +1,209 @@
+import os
+import csv
+import json
+import time
+import pickle
+import threading
+import fnmatch
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from utils import helper
+from utils.object import flatten
+import analysis_runner
+from phantoms.helper import get_images
+
+# Runs analyze() of one loaded phantom over a grid of analysis_params.
+# The image (or series) is decoded once. Its pixel arrays are put in one shared memory block, and the
+# phantom object without the pixel data is pickled as a template. Each worker rebuilds the phantom
+# from the template and a copy of the shared arrays, so no worker reads or decodes the input again.
+
+def make_grid(grid):
+    """{'name': [values], ...} -> list of {'name': value, ...}, one per combination."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+class SharedPhantom:
+    """A loaded phantom with its pixel arrays in shared memory."""
+    def __init__(self, phantom):
+        images = get_images(phantom)
+        arrays = np.stack([img.array for img in images])
+
+        self.shm = shared_memory.SharedMemory(create=True, size=arrays.nbytes)
+        shared = np.ndarray(arrays.shape, dtype=arrays.dtype, buffer=self.shm.buf)
+        shared[:] = arrays
+        self.shape = arrays.shape
+        self.dtype = str(arrays.dtype)
+
+        # pickle the phantom without the pixel data (the arrays and the decoded pixels cached by pydicom)
+        stash = []
+        for img in images:
+            metadata = getattr(img, 'metadata', None)
+            stash.append((img.array, metadata, metadata.get('PixelData') if metadata is not None else None,
+                          getattr(metadata, '_pixel_array', None)))
+            img.array = None
+            if metadata is not None:
+                if 'PixelData' in metadata:
+                    del metadata.PixelData
+                metadata._pixel_array = None
+        # locks (e.g. of the pylinac warnings) cannot be pickled, the workers make new ones
+        lock_type = type(threading.Lock())
+        self.locks = [name for name, value in vars(phantom).items() if isinstance(value, lock_type)]
+        locks = {name: vars(phantom).pop(name) for name in self.locks}
+        try:
+            self.template = pickle.dumps(phantom)
+        finally:
+            vars(phantom).update(locks)
+            for img, (array, metadata, pixel_data, pixel_array) in zip(images, stash):
+                img.array = array
+                if metadata is not None:
+                    if pixel_data is not None:
+                        metadata.PixelData = pixel_data
+                    metadata._pixel_array = pixel_array
+
+    def spec(self):
+        return {'name': self.shm.name, 'shape': self.shape, 'dtype': self.dtype, 'template': self.template, 'locks': self.locks}
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+# worker process state
+_worker = {}
+
+def _init_worker(spec, phantom_id, config):
+    # spawned workers share the parent's resource tracker, so the block stays registered once and
+    # is unregistered when the parent unlinks it
+    shm = shared_memory.SharedMemory(name=spec['name'])
+    _worker.update(shm=shm, spec=spec, module=analysis_runner.get_phantom_module(phantom_id), config=config)
+
+def _rebuild_phantom():
+    spec = _worker['spec']
+    phantom = pickle.loads(spec['template'])
+    for name in spec['locks']:
+        setattr(phantom, name, threading.Lock())
+    arrays = np.ndarray(spec['shape'], dtype=spec['dtype'], buffer=_worker['shm'].buf)
+    for img, array in zip(get_images(phantom), arrays):
+        # analyze() may change the arrays
+        img.array = array.copy()
+    return phantom
+
+def select_metrics(results, patterns):
+    return {item['key']: item['value'] for item in flatten(results)
+            if not isinstance(item['value'], str) and any(fnmatch.fnmatch(item['key'], p) for p in patterns)}
+
+def run_combination(index, params, metric_patterns, artifacts_dir=None):
+    """Analyzes one combination in a worker. Returns a table row."""
+    config = _worker['config']
+    config = {**config, 'analysis_params': {**config['analysis_params'], **params}}
+    row = {'index': index, **params, 'status': 'ok', 'error': None}
+
+    t0 = time.perf_counter()
+    try:
+        phantom = _rebuild_phantom()
+        _worker['module'].analyze_phantom(phantom, config)
+        row['analyze_s'] = round(time.perf_counter() - t0, 3)
+        row.update(select_metrics(phantom.results_data(as_dict=True), metric_patterns))
+
+        if artifacts_dir:
+            os.makedirs(artifacts_dir, exist_ok=True)
+            phantom.save_analyzed_image(filename=os.path.join(artifacts_dir, 'analyzed_image.png'))
+            helper.write_json_file(os.path.join(artifacts_dir, 'params.json'), config['analysis_params'], indent=4)
+            with open(os.path.join(artifacts_dir, 'result.txt'), 'w') as file:
+                file.write(phantom.results())
+    except Exception as e:
+        row.update(status='error', error=f'{type(e).__name__}: {e}', analyze_s=round(time.perf_counter() - t0, 3))
+
+    return row
+
+def write_table(rows, csv_file):
+    columns = []
+    for row in rows:
+        columns.extend(key for key in row if key not in columns)
+
+    with open(csv_file, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def run_sweep(phantom_id, input_path, config, grid, output_dir, metric_patterns=('*',), artifacts=(), max_workers=None,
+              log_message=print):
+    """Loads the phantom once and analyzes every combination of grid on a process pool.
+
+    artifacts are the indexes of the combinations that also save their image and results
+    (output_dir/combination_<index>/). Returns the rows of the table, also written to output_dir/sweep.csv.
+    """
+    module = analysis_runner.get_phantom_module(phantom_id)
+    combinations = make_grid(grid)
+    os.makedirs(output_dir, exist_ok=True)
+
+    log_message(f'loading {input_path}...')
+    phantom = module.load_phantom(input_path, config)
+    shared = SharedPhantom(phantom)
+    del phantom
+
+    log_message(f'{len(combinations)} combinations of {", ".join(grid)}')
+    rows = []
+    try:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(shared.spec(), phantom_id, config)) as executor:
+            futures = [executor.submit(run_combination, i, params, list(metric_patterns),
+                                       os.path.join(output_dir, f'combination_{i}') if i in artifacts else None)
+                       for i, params in enumerate(combinations)]
+            for future in as_completed(futures):
+                row = future.result()
+                log_message(f"[{row['index']}] {row['status']} {row['error'] or ''}")
+                rows.append(row)
+    finally:
+        shared.close()
+
+    rows.sort(key=lambda row: row['index'])
+    csv_file = os.path.join(output_dir, 'sweep.csv')
+    write_table(rows, csv_file)
+    log_message(f'table saved: {csv_file}')
+    return rows
+
+def parse_param(text):
+    # name=v1,v2,... values are JSON (numbers, true/false) or strings
+    name, values = text.split('=', 1)
+    parsed = []
+    for value in values.split(','):
+        try:
+            parsed.append(json.loads(value))
+        except ValueError:
+            parsed.append(value)
+    return name, parsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze one phantom image or series over a grid of analysis_params.')
+    parser.add_argument('input', help='DICOM file (2D) or folder (3D)')
+    parser.add_argument('--site', required=True)
+    parser.add_argument('--device', required=True)
+    parser.add_argument('--phantom', required=True)
+    parser.add_argument('--param', action='append', default=[], help='name=v1,v2,... (repeat for more parameters)')
+    parser.add_argument('--grid', help='JSON file of {"name": [values]}')
+    parser.add_argument('--metrics', nargs='*', default=['*'], help='metric key patterns for the table (default: all numbers)')
+    parser.add_argument('--artifacts', default='', help='indexes of combinations that save image and results, e.g. 0,5')
+    parser.add_argument('--output', default='_sweep', help='output folder')
+    parser.add_argument('--max-workers', type=int)
+    args = parser.parse_args()
+
+    grid = helper.read_json_file(args.grid) if args.grid else {}
+    grid.update(parse_param(p) for p in args.param)
+    if len(grid) == 0:
+        raise Exception('No parameters to sweep. Use --param or --grid.')
+
+    config = analysis_runner.load_phantom_config(args.site, args.device, args.phantom)
+    artifacts = {int(i) for i in args.artifacts.split(',') if i.strip()}
+
+    run_sweep(args.phantom, args.input, config, grid, args.output, metric_patterns=args.metrics,
+              artifacts=artifacts, max_workers=args.max_workers)
+
+if __name__ == '__main__':
+    main()
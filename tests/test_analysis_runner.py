@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('pylinac')
+
+from benchmarks.synthetic import write_dicom
+from utils import helper
+import analysis_runner
+
+def write_phantom_config(config_dir, **options):
+    # the repo config of SBUH Truebeam QC3 with the given top-level options
+    config = analysis_runner.load_phantom_config('SBUH', 'Truebeam', 'QC3')
+    config.update(options)
+    config_dir.mkdir()
+    helper.write_json_file(str(config_dir / 'config.sbuh.truebeam.qc3.json'), config)
+    return str(config_dir)
+
+def test_run_case_stages_input_and_reports_errors(tmp_path):
+    file = write_dicom(str(tmp_path / 'blank.dcm'), np.full((64, 64), 1000), modality='RTIMAGE')
+    job = {'site': 'SBUH', 'device': 'Truebeam', 'phantom': 'QC3', 'files': [file],
+           'output_folder': str(tmp_path / 'out'), 'performed_by': 'test', 'performed_date': '2024-01-01',
+           'config_dir': write_phantom_config(tmp_path / 'config', preflight={'enabled': True})}
+
+    result = analysis_runner.run_case(job, log_message=lambda m: None)
+
+    # the blank image is staged, then rejected by the preflight check
+    assert result['status'] == 'error'
+    assert 'blank image' in result['error']
+    assert result['case_dir'] == str(tmp_path / 'out' / 'sbuh_truebeam_qc3' / '20240101_080000')
+    assert os.path.exists(os.path.join(result['case_dir'], 'input.dcm'))
@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('pylinac')
+
+from benchmarks.synthetic import write_dicom
+from utils import helper
+import analysis_runner
+import analysis_server
+
+def write_phantom_config(config_dir, **options):
+    # the repo config of SBUH Truebeam QC3 with the given top-level options
+    config = analysis_runner.load_phantom_config('SBUH', 'Truebeam', 'QC3')
+    config.update(options)
+    config_dir.mkdir()
+    helper.write_json_file(str(config_dir / 'config.sbuh.truebeam.qc3.json'), config)
+    return str(config_dir)
+
+@pytest.fixture(scope='module')
+def server():
+    server = analysis_server.create_server(port=0, max_workers=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.queue.shutdown()
+
+@pytest.fixture
+def server_url(server):
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+def test_job_runs_on_a_warm_worker(server_url, tmp_path):
+    file = write_dicom(str(tmp_path / 'blank.dcm'), np.full((64, 64), 1000), modality='RTIMAGE')
+    job = {'site': 'SBUH', 'device': 'Truebeam', 'phantom': 'QC3', 'files': [file],
+           'output_folder': str(tmp_path / 'out'), 'performed_by': 'test', 'performed_date': '2024-01-01',
+           'config_dir': write_phantom_config(tmp_path / 'config', preflight={'enabled': True})}
+
+    lines = []
+    job_id = analysis_server.submit_job(server_url, job)
+    status = analysis_server.wait_for_job(server_url, job_id, log_message=lines.append, poll_s=5)
+
+    # rejected by the preflight check, without importing pylinac in the job
+    assert status['status'] == 'error'
+    assert 'blank image' in status['error']
+    assert status['total_s'] < 2
+    assert any('Preflight' in line for line in lines)
+
+def test_invalid_job(server_url):
+    with pytest.raises(Exception, match='site is required'):
+        analysis_server.submit_job(server_url, {'phantom': 'QC3'})
+
+def test_finished_jobs_are_capped(server, server_url, tmp_path, monkeypatch):
+    monkeypatch.setattr(server.queue, 'max_finished_jobs', 1)
+    job = {'site': 'SBUH', 'device': 'Truebeam', 'phantom': 'QC3', 'files': [str(tmp_path / 'missing.dcm')],
+           'output_folder': str(tmp_path / 'out')}
+
+    job_ids = []
+    for _ in range(2):
+        job_ids.append(analysis_server.submit_job(server_url, job))
+        analysis_server.wait_for_job(server_url, job_ids[-1], log_message=lambda m: None, poll_s=5)
+
+    assert server.queue.status(job_ids[0]) is None
+    assert server.queue.status(job_ids[1])['status'] == 'error'
@@ -0,0 +1,90 @@
+import os
+import time
+import subprocess
+import sys
+
+from utils import helper
+from utils.artifact_store import ArtifactStore, PUBLISH_FILE
+
+def write_case(stage_dir, value):
+    helper.write_json_file(os.path.join(stage_dir, 'result.json'), {'value': value})
+    helper.append_csv_lines(os.path.join(os.path.dirname(stage_dir), 'results.csv'), 'value', [str(value)])
+
+def read_lines(file):
+    with open(file) as f:
+        return f.read().splitlines()
+
+def test_publish(tmp_path):
+    phantom_dir = str(tmp_path / 'output' / 'sbuh_truebeam_qc3')
+    store = ArtifactStore(str(tmp_path / 'scratch'))
+
+    for i, name in enumerate(['20240101_080000', '20240102_080000', '20240101_080000']):
+        case_dir = os.path.join(phantom_dir, name)
+        stage_dir = store.stage(case_dir)
+        assert not os.path.exists(case_dir) or i == 2
+        write_case(stage_dir, i)
+        store.publish(stage_dir, case_dir)
+
+    assert store.flush(timeout=30)
+    assert store.published == 3 and store.failed == 0
+
+    # the re-run replaced the first case, the hidden copies are gone
+    assert sorted(os.listdir(phantom_dir)) == ['20240101_080000', '20240102_080000', 'results.csv']
+    assert helper.read_json_file(os.path.join(phantom_dir, '20240101_080000', 'result.json')) == {'value': 2}
+    assert read_lines(os.path.join(phantom_dir, 'results.csv')) == ['value', '0', '1', '2']
+    assert os.listdir(store.scratch_folder) == []
+
+def get_dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+def test_failed_and_left_over_cases(tmp_path):
+    output_folder = tmp_path / 'output'
+    output_folder.write_text('not a folder')
+    case_dir = str(output_folder / 'sbuh_truebeam_qc3' / '20240101_080000')
+
+    store = ArtifactStore(str(tmp_path / 'scratch'), retry_delays_s=[])
+    stage_dir = store.stage(case_dir)
+    write_case(stage_dir, 1)
+    store.publish(stage_dir, case_dir)
+    incomplete_dir = store.stage(case_dir)  # an analysis that did not finish
+    assert store.flush(timeout=30)
+    assert store.failed == 1
+
+    # another instance that is still running keeps its cases
+    other = ArtifactStore(str(tmp_path / 'scratch'), log_message=print)
+    assert other.flush(timeout=30)
+    assert other.published == 0 and os.path.exists(incomplete_dir)
+
+    # after the process ended, the next start publishes the complete case and removes the incomplete one
+    old_folder = os.path.join(str(tmp_path / 'scratch'), f'{get_dead_pid()}_old')
+    os.rename(store.scratch_folder, old_folder)
+    output_folder.unlink()
+    store = ArtifactStore(str(tmp_path / 'scratch'), log_message=print)
+    assert store.flush(timeout=30)
+    assert store.published == 1
+    assert helper.read_json_file(os.path.join(case_dir, 'result.json')) == {'value': 1}
+    assert not os.path.exists(old_folder)
+    assert os.listdir(store.scratch_folder) == []
+
+def test_failed_publish_is_retried(tmp_path):
+    output_folder = tmp_path / 'output'
+    output_folder.write_text('not a folder')
+    case_dir = str(output_folder / 'sbuh_truebeam_qc3' / '20240101_080000')
+
+    store = ArtifactStore(str(tmp_path / 'scratch'), log_message=print, retry_delays_s=[0.5, 0.5])
+    stage_dir = store.stage(case_dir)
+    write_case(stage_dir, 1)
+    store.publish(stage_dir, case_dir)
+    assert store.flush(timeout=30)
+    assert store.published == 0 and store.failed == 0 and store.pending() == 1
+
+    # the share is back before the retry
+    output_folder.unlink()
+    deadline = time.time() + 30
+    while store.pending() > 0 and time.time() < deadline:
+        time.sleep(0.1)
+    assert store.flush(timeout=30)
+    assert store.published == 1 and store.failed == 0
+    assert helper.read_json_file(os.path.join(case_dir, 'result.json')) == {'value': 1}
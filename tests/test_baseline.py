@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from utils import baseline
+
+BASELINE = {'created': '2024-01-01T00:00:00', 'metrics': {'mtf_50': 0.5, 'hu_air': -1000.0, 'uniformity': 0.0,
+                                                          'config_ssd': 1000.0}}
+TOLERANCES = [{'pattern': 'hu_*', 'abs': 40}, {'pattern': 'mtf_*', 'rel': 0.1}, {'pattern': '*', 'abs': 1.0}]
+
+def test_comparator():
+    comparator = baseline.Comparator(BASELINE, TOLERANCES, warn_fraction=0.8, ignore=['config_*'])
+    assert comparator.keys == ['mtf_50', 'hu_air', 'uniformity']
+    assert comparator.limits.tolist() == pytest.approx([0.05, 40, 1.0])
+
+    results = [{'mtf': {'50': 0.5}, 'hu': {'air': -990.0}, 'uniformity': 0.1},   # pass
+               {'mtf': {'50': 0.455}, 'hu': {'air': -1000.0}, 'uniformity': 0.0}, # mtf warns (0.045 > 0.8 * 0.05)
+               {'mtf': {'50': 0.5}, 'hu': {'air': -950.0}},                       # hu fails, uniformity missing
+               {}]
+    summaries = comparator.compare(results)
+
+    assert [s['status'] for s in summaries] == ['pass', 'warn', 'fail', 'missing']
+    assert summaries[1]['warned'][0]['key'] == 'mtf_50'
+    assert summaries[2]['failed'] == [{'key': 'hu_air', 'reference': -1000.0, 'deviation': 50.0, 'limit': 40.0}]
+    assert summaries[2]['counts'] == {'pass': 1, 'warn': 0, 'fail': 1, 'missing': 1}
+    assert summaries[3]['counts']['missing'] == 3
+
+def test_compare_result(tmp_path):
+    config = {'baseline': {'enabled': True, 'folder': str(tmp_path), 'tolerances': TOLERANCES}}
+    result = {'mtf': {'50': 0.5}, 'hu': {'air': -1000.0}, 'uniformity': 0.0, 'passed': True, 'name': 'x'}
+
+    assert baseline.compare_result(result, 'SBUH', 'Truebeam', 'catphan', config, log_message=print) is None
+
+    baseline_file = baseline.get_baseline_file(str(tmp_path), 'SBUH', 'Truebeam', 'catphan')
+    saved = baseline.save_baseline(baseline_file, result, source='case')
+    assert os.path.basename(baseline_file) == 'sbuh_truebeam_catphan.json'
+    assert saved['metrics'] == {'hu_air': -1000.0, 'mtf_50': 0.5, 'uniformity': 0.0}
+
+    summary = baseline.compare_result({**result, 'uniformity': 2.0}, 'SBUH', 'Truebeam', 'catphan', config, log_message=print)
+    assert summary['status'] == 'fail' and summary['baseline']['source'] == 'case'
+    assert 'FAIL' in baseline.format_summary(summary)
+
+    assert baseline.compare_result(result, 'SBUH', 'Truebeam', 'catphan', {}, log_message=print) is None
+
+def test_shipped_catphan_tolerances():
+    # a normal run: small drifts of near-zero metrics, another origin slice and number of images
+    from utils.helper import read_json_file
+    config_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.sbuh.truebeam.catphan.json')
+    options = baseline.get_options(read_json_file(config_file))
+    reference = {'catphan_roll_deg': 0.1, 'origin_slice': 40, 'num_images': 80,
+                 'ctp404': {'hu_rois': {'Poly': {'value': -35.0, 'nominal_value': -35.0}, 'Air': {'value': -1000.0}}},
+                 'ctp486': {'uniformity_index': 0.4, 'integral_non_uniformity': 0.003, 'rois': {'Top': {'value': 1.0}}}}
+    run = {'catphan_roll_deg': 0.4, 'origin_slice': 43, 'num_images': 81,
+           'ctp404': {'hu_rois': {'Poly': {'value': -20.0, 'nominal_value': -35.0}, 'Air': {'value': -990.0}}},
+           'ctp486': {'uniformity_index': 1.2, 'integral_non_uniformity': 0.008, 'rois': {'Top': {'value': 4.0}}}}
+
+    comparator = baseline.Comparator({'metrics': baseline.get_numbers(reference)}, options['tolerances'],
+                                     options['warn_fraction'], options['ignore'])
+    assert 'origin_slice' not in comparator.keys and 'num_images' not in comparator.keys
+    assert comparator.compare([run])[0]['status'] == 'pass'
+
+    run['ctp404']['hu_rois']['Poly']['value'] = 10.0
+    assert comparator.compare([run])[0]['failed'][0]['key'] == 'ctp404_hu_rois_Poly_value'
@@ -0,0 +1,24 @@
+from benchmarks.compare import compare
+
+def make_report(mean_s, analyze_s, status='ok', peak_rss_mb=100.0):
+    return {'benchmarks': {'phantom_catphan': {'status': status, 'mean_s': mean_s, 'peak_rss_mb': peak_rss_mb,
+                                               'stages': {'analyze': analyze_s, 'json': 0.001}}}}
+
+def test_compare_flags_slower_stages():
+    regressions = compare(make_report(13.0, 10.0), make_report(10.0, 7.0), threshold=0.2)
+    assert [(r['benchmark'], r['stage']) for r in regressions] == [('phantom_catphan', 'total'), ('phantom_catphan', 'analyze')]
+
+def test_compare_ignores_noise():
+    # json is below min_seconds, the total is within the threshold
+    assert compare(make_report(11.0, 7.0), make_report(10.0, 7.0), threshold=0.2) == []
+    assert compare(make_report(20.0, 20.0, status='skipped'), make_report(10.0, 7.0, status='skipped')) == []
+
+def test_compare_flags_broken_benchmarks():
+    for current in (make_report(None, None, status='error'), make_report(20.0, 20.0, status='skipped'), {'benchmarks': {}}):
+        regressions = compare(current, make_report(10.0, 7.0))
+        assert [(r['stage'], r['baseline']) for r in regressions] == [('status', 'ok')]
+    assert compare(make_report(10.0, 7.0), make_report(None, None, status='error')) == []
+
+def test_compare_memory():
+    regressions = compare(make_report(10.0, 7.0, peak_rss_mb=200.0), make_report(10.0, 7.0), memory_threshold=0.5)
+    assert [r['stage'] for r in regressions] == ['peak_rss_mb']
@@ -0,0 +1,70 @@
+import os
+from datetime import datetime
+
+from utils.cases import find_case_folders, parse_case_datetime, get_case_input_files
+from utils.checkpoint import Checkpoint
+from utils.model import convert_kvps_to_number1d_or_stirng1d_list
+
+def make_case(root, phantom_folder, dt_str):
+    case_dir = os.path.join(root, phantom_folder, dt_str)
+    os.makedirs(case_dir)
+    return case_dir
+
+def test_find_case_folders(tmp_path):
+    make_case(tmp_path, 'sbuh_truebeam_qc3', '20240101_080000')
+    make_case(tmp_path, 'sbuh_truebeam_qc3', '20240201_080000')
+    make_case(tmp_path, 'sbuh_truebeam_catphan', '20240101_090000')
+    make_case(tmp_path, 'sbuh_truebeam_qc3', 'not_a_case')
+
+    cases = find_case_folders(str(tmp_path), phantom='QC3')
+    assert [c['datetime'] for c in cases] == [datetime(2024, 1, 1, 8), datetime(2024, 2, 1, 8)]
+
+    cases = find_case_folders(str(tmp_path), start=datetime(2024, 1, 15))
+    assert len(cases) == 1 and cases[0]['phantom'] == 'qc3'
+
+def test_parse_case_datetime():
+    assert parse_case_datetime('/out/sbuh_truebeam_qc3/20240101_080000') == datetime(2024, 1, 1, 8)
+    assert parse_case_datetime('/out/sbuh_truebeam_qc3/temp') is None
+
+def test_get_case_input_files(tmp_path):
+    case_dir = make_case(tmp_path, 'sbuh_truebeam_qc3', '20240101_080000')
+    for name in ['input.dcm', 'input_resampled.dcm', 'analyzed_image.png']:
+        (tmp_path / 'sbuh_truebeam_qc3' / '20240101_080000' / name).write_bytes(b'')
+    assert get_case_input_files(case_dir) == [os.path.join(case_dir, 'input.dcm')]
+
+def test_checkpoint_resumes(tmp_path):
+    file = str(tmp_path / 'checkpoint.txt')
+    checkpoint = Checkpoint(file)
+    checkpoint.mark_done('case1')
+    checkpoint.mark_done('case1')
+
+    checkpoint = Checkpoint(file)
+    assert checkpoint.is_done('case1')
+    assert not checkpoint.is_done('case2')
+    assert len(checkpoint) == 1
+
+def test_number1d_time():
+    kvps = [{'key': 'a', 'value': 1.0}]
+    objs = convert_kvps_to_number1d_or_stirng1d_list(kvps, 'qc3_', 'SBUH|Truebeam', 'app', time=datetime(2024, 1, 1, 8))
+    assert objs[0]['time'] == '2024-01-01T08:00:00'
+    assert objs[0]['series_id'] == 'qc3_a'
+
+def test_backfill_continues_after_a_bad_case(tmp_path):
+    from benchmarks.stub_server import StubServer
+    from backfill import backfill
+
+    cases = []
+    for dt_str, result in (('20240101_080000', '{"a": 1.0}'), ('20240201_080000', '{not json'), ('20240301_080000', '{"a": 2.0}')):
+        case_dir = make_case(tmp_path, 'sbuh_truebeam_qc3', dt_str)
+        with open(os.path.join(case_dir, 'result.json'), 'w') as file:
+            file.write(result)
+        cases.append({'case_dir': case_dir, 'site': 'sbuh', 'device': 'truebeam', 'phantom': 'qc3'})
+
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint.txt'))
+    messages = []
+    with StubServer() as server:
+        failed = backfill(cases, server.url, checkpoint, app='test', log_message=messages.append)
+
+    assert failed == {cases[1]['case_dir']}
+    assert any(cases[1]['case_dir'] in m for m in messages if m.startswith('Error'))
+    assert [checkpoint.is_done(c['case_dir']) for c in cases] == [True, False, True]
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('pylinac')
+
+from benchmarks.synthetic import write_dicom
+import phantoms.catphan
+
+def write_catphan_series(folder, z_positions, origin_z):
+    yy, xx = np.indices((64, 64))
+    body = (yy - 32) ** 2 + (xx - 32) ** 2 < 25 ** 2
+    files = []
+    for i, z in enumerate(z_positions):
+        pixels = np.where(body, 1024, 0)
+        if abs(z - origin_z) <= 2:
+            # air and Teflon inserts of the HU module
+            pixels[(yy - 32) ** 2 + (xx - 20) ** 2 < 4 ** 2] = 0
+            pixels[(yy - 32) ** 2 + (xx - 44) ** 2 < 4 ** 2] = 2014
+        file = os.path.join(folder, f'CT_{i:04d}.dcm')
+        write_dicom(file, pixels, modality='CT', ImagePositionPatient=[0.0, 0.0, float(z)],
+                    PixelSpacing=[1.0, 1.0], SliceThickness=1.0, RescaleSlope=1, RescaleIntercept=-1024)
+        files.append(file)
+    return files
+
+def test_select_input_files_keeps_module_range(tmp_path):
+    z_positions = np.arange(-100, 100, 1.0)
+    files = write_catphan_series(str(tmp_path), z_positions[::-1], origin_z=0.0)
+    config = {'catphan_model': '504', 'slice_selection': {'enabled': True, 'window_mm': 5, 'coarse_step_mm': 2}}
+
+    selected = phantoms.catphan.select_input_files(files, config, log_message=lambda m: None)
+
+    # CatPhan504 modules are at -65...+30 mm from the HU module, z = 99 - file index
+    z_selected = [99 - int(f[-8:-4]) for f in selected]
+    assert len(selected) == 106
+    assert z_selected == sorted(z_selected)
+    assert z_selected[0] <= -65 - 3 and z_selected[-1] >= 30 + 3
+
+def test_select_input_files_disabled(tmp_path):
+    config = {'catphan_model': '504', 'slice_selection': {'enabled': False}}
+    assert phantoms.catphan.select_input_files(['a', 'b'], config, log_message=lambda m: None) == ['a', 'b']
+
+def test_estimate_origin_with_duplicate_positions(tmp_path):
+    z_positions = np.repeat(np.arange(-20, 20, 1.0), 2)
+    files = write_catphan_series(str(tmp_path), z_positions, origin_z=0.0)
+    headers = [{'file': f, 'z': z, 'rescale_slope': 1.0, 'rescale_intercept': -1024.0} for f, z in zip(files, z_positions)]
+
+    assert abs(phantoms.catphan.estimate_origin_z(headers, {'coarse_step_mm': 2}, log_message=lambda m: None)) <= 1
+
+    # no spacing at all: every slice is searched
+    same_z = [{**h, 'z': 0.0} for h in headers[38:42]]
+    assert phantoms.catphan.estimate_origin_z(same_z, {}, log_message=lambda m: None) == 0.0
@@ -0,0 +1,35 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+pytest.importorskip('pydicom')
+
+from benchmarks.synthetic import write_dicom, write_ct_series, make_phantom_image as make_image
+import phantoms.classifier
+
+CONFIG = {'sites': [{'id': 'SBUH', 'devices': [{'id': 'Truebeam', 'station_names': ['TB-1']}]}]}
+
+def test_classify_from_header(tmp_path):
+    file = write_dicom(str(tmp_path / 'qc3.dcm'), np.zeros((64, 64)), modality='RTIMAGE',
+                       RTImageLabel='QC-3 6X', RadiationMachineName='TB1')
+    result = phantoms.classifier.classify_file(file, CONFIG)
+    assert result['phantom'] == 'QC3'
+    assert result['confidence'] > 0.5
+    assert result['device_id'] == 'SBUH|Truebeam'
+    assert result['shape'] is None
+
+    ct_file = write_ct_series(str(tmp_path / 'ct'), 1)[0]
+    assert phantoms.classifier.classify_file(ct_file, CONFIG)['phantom'] == 'CatPhan'
+
+def test_classify_from_image(tmp_path):
+    file = write_dicom(str(tmp_path / 'tor.dcm'), make_image('disc'), modality='RTIMAGE', KVP=70)
+    result = phantoms.classifier.classify_file(file, CONFIG)
+    assert result['phantom'] == 'LeedsTOR'
+    assert result['shape'] == 'disc'
+    assert result['device_id'] is None
+
+def test_classify_files(tmp_path):
+    files = [write_dicom(str(tmp_path / f'{i}.dcm'), make_image('rectangle'), modality='RTIMAGE', KVP=100) for i in range(4)]
+    files.append(str(tmp_path / 'missing.dcm'))
+    results = phantoms.classifier.classify_files(files, CONFIG, log_message=lambda m: None)
+    assert [r['phantom'] for r in results] == ['QCkV'] * 4 + [None]
@@ -0,0 +1,29 @@
+import os
+import time
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('pynetdicom')
+
+from benchmarks.synthetic import write_ct_series, write_dicom
+import dicom_receiver
+
+def test_receive_series(tmp_path):
+    ct_files = write_ct_series(str(tmp_path / 'ct'), 5, size=8)
+    rt_file = write_dicom(str(tmp_path / 'qc3.dcm'), np.zeros((8, 8)), modality='RTIMAGE')
+
+    receiver = dicom_receiver.DicomReceiver(str(tmp_path / 'received'), port=0, inactivity_timeout_s=5, log_message=lambda m: None)
+    with receiver:
+        statuses = dicom_receiver.send_files(ct_files + [rt_file], 'localhost', receiver.port, log_message=lambda m: None)
+        assert statuses == [0x0000] * 6
+
+        # not complete before the inactivity timeout
+        assert receiver.check_complete() == []
+        complete = receiver.check_complete(now=time.monotonic() + 5)
+
+    assert sorted(len(s['files']) for s in complete) == [1, 5]
+    ct_series = next(s for s in complete if s['modality'] == 'CT')
+    assert ct_series['calling_ae'] == 'IMAGEQA_SCU'
+    assert all(os.path.exists(f) for f in ct_series['files'])
+    assert receiver.series == {}
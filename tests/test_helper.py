@@ -0,0 +1,56 @@
+import os
+import json
+import dataclasses
+from datetime import datetime
+
+import pytest
+
+from utils.helper import to_serializable, write_json_file, append_csv_lines
+
+@dataclasses.dataclass
+class ROIResult:
+    value: float
+    passed: bool
+
+class Result:
+    def __init__(self):
+        self.date = datetime(2024, 1, 2, 3, 4, 5)
+        self.rois = {'Air': ROIResult(-1000.0, True)}
+        self.offsets = (1, 2)
+
+def test_to_serializable_objects():
+    result = to_serializable(vars(Result()))
+    assert result == {
+        'date': '2024-01-02T03:04:05',
+        'rois': {'Air': {'value': -1000.0, 'passed': True}},
+        'offsets': [1, 2],
+    }
+
+def test_to_serializable_cycle():
+    a = Result()
+    a.parent = a
+    assert isinstance(to_serializable(a)['parent'], str)
+
+def test_to_serializable_numpy():
+    np = pytest.importorskip('numpy')
+    result = to_serializable({'mtf': np.array([0.5, 0.25]), 'n': np.int64(3), 'ok': np.bool_(True)})
+    assert result == {'mtf': [0.5, 0.25], 'n': 3, 'ok': True}
+
+def test_write_json_file_compact(tmp_path):
+    file = tmp_path / 'result.json'
+    write_json_file(str(file), {'a': [1, 2]})
+    assert file.read_text() == '{"a":[1,2]}'
+
+    write_json_file(str(file), {'a': 1}, indent=4)
+    assert json.loads(file.read_text()) == {'a': 1}
+
+def test_append_csv_lines_new_header(tmp_path):
+    csv_file = str(tmp_path / 'results.csv')
+    append_csv_lines(csv_file, 'a,b', ['1,2'])
+    append_csv_lines(csv_file, 'a,b', ['3,4'])
+    append_csv_lines(csv_file, 'a,b,c', ['5,6,7'])
+
+    with open(csv_file) as file:
+        assert file.read().splitlines() == ['a,b,c', '5,6,7']
+    old_files = [f for f in os.listdir(tmp_path) if f.startswith('results_')]
+    assert len(old_files) == 1
@@ -0,0 +1,78 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+
+from benchmarks.synthetic import make_phantom_image
+import phantoms.localization as localization
+
+class Point:
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+
+class FakeImage:
+    def __init__(self, array):
+        self.array = array
+
+class FakePhantom:
+    # detects the phantom at the center of the image
+    def __init__(self, array):
+        self.image = FakeImage(array)
+        self.phantom_center = Point(array.shape[1] / 2, array.shape[0] / 2)
+        self.phantom_angle = 45.0
+        self.phantom_radius = array.shape[0] * 0.5
+
+def shift(array, dx):
+    return np.roll(array, dx, axis=1)
+
+@pytest.fixture
+def config(tmp_path):
+    return {'localization': {'enabled': True, 'store': str(tmp_path / 'store'), 'template_size': 32}}
+
+def run(config, array, calls):
+    def analyze_phantom(phantom, config, overrides=None):
+        calls.append(overrides)
+
+    analyze = localization.seeded(analyze_phantom, 'qc3', 'SBUH|Truebeam', config, log_message=print)
+    phantom = FakePhantom(array)
+    analyze(phantom, config)
+    return phantom
+
+def test_disabled():
+    def analyze_phantom(phantom, config, overrides=None):
+        pass
+    assert localization.seeded(analyze_phantom, 'qc3', 'SBUH|Truebeam', {}, log_message=print) is analyze_phantom
+
+def test_seeded_run(config):
+    image = make_phantom_image(size=200)
+    calls = []
+
+    # first run: full search, recorded
+    run(config, image, calls)
+    assert calls == [None]
+    store = localization.load_store(localization.get_store_file(localization.get_options(config), 'SBUH|Truebeam', 'qc3'))
+    assert len(store['history']) == 1 and np.asarray(store['template']).shape == (32, 32)
+
+    # same position (new noise): the stored localization is used
+    run(config, make_phantom_image(size=200, seed=1), calls)
+    assert calls[-1] == {'center_override': (100.0, 100.0), 'angle_override': 45.0, 'size_override': 100.0}
+
+    # moved phantom: full search
+    run(config, shift(make_phantom_image(size=200, seed=2), 15), calls)
+    assert calls[-1] is None
+
+def test_verify_seed_rejects_moved_phantom():
+    image = make_phantom_image(size=200)
+    seed = {'center': [100.0, 100.0], 'radius': 100.0}
+    template = localization.crop_region(image, seed['center'], seed['radius'], 32)
+
+    assert localization.verify_seed(make_phantom_image(size=200, seed=1), seed, template, 0.95)[0]
+    assert not localization.verify_seed(shift(image, 8), seed, template, 0.95)[0]
+    assert not localization.verify_seed(np.random.default_rng(0).normal(size=(200, 200)), seed, template, 0.95)[0]
+
+def test_max_seeded_runs(config):
+    config['localization']['max_seeded_runs'] = 1
+    calls = []
+    for seed in range(3):
+        run(config, make_phantom_image(size=200, seed=seed), calls)
+    assert calls[0] is None and calls[1] is not None and calls[2] is None
@@ -0,0 +1,28 @@
+from utils.object import flatten, traverse_and_collect_numbers, traverse_and_collect_strings, python_compatible_key
+
+RESULT = {
+    'hu': {'Air': {'value': -1001.5, 'passed': 'True'}},
+    'mtf lp/mm': [0.9, 0.5],
+    'rois': [{'angle': 10}, {'angle': 20}],
+    'notes': 'ok',
+}
+
+def test_flatten_sorted_numbers_and_strings():
+    kvps = flatten(RESULT)
+    assert [item['key'] for item in kvps] == sorted(item['key'] for item in kvps)
+    assert {'key': 'hu_Air_value', 'value': -1001.5} in kvps
+    assert {'key': 'hu_Air_passed', 'value': 'True'} in kvps
+
+def test_flatten_indexes_lists():
+    kvps = {item['key']: item['value'] for item in flatten(RESULT)}
+    assert kvps['mtf_lp_mm_0'] == 0.9
+    assert kvps['mtf_lp_mm_1'] == 0.5
+    assert kvps['rois_1_angle'] == 20
+
+def test_numbers_and_strings_split():
+    assert all(not isinstance(item['value'], str) for item in traverse_and_collect_numbers(RESULT))
+    assert [item['key'] for item in traverse_and_collect_strings(RESULT)] == ['hu_Air_passed', 'notes']
+
+def test_python_compatible_key():
+    assert python_compatible_key('value 2!') == 'value_2_'
+    assert python_compatible_key(3) == '3'
@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from utils import phantom_cache
+import phantoms.helper
+
+class FakeImage:
+    def __init__(self, size):
+        self.array = np.zeros(size, dtype=np.uint8)
+
+class FakePhantom:
+    def __init__(self, size):
+        self.image = FakeImage(size)
+        self._warnings_lock = threading.Lock()
+        self.analyzed_with = None
+
+@pytest.fixture
+def cache():
+    yield phantom_cache.configure(max_mb=1)
+    phantom_cache.configure(enabled=False)
+
+def test_lru_eviction():
+    cache = phantom_cache.LRUCache(max_bytes=100)
+    cache.put('a', 'A', 40)
+    cache.put('b', 'B', 40)
+    assert cache.get('a') == 'A'  # b is now the least recently used
+    cache.put('c', 'C', 40)
+    assert cache.get('b') is None
+    assert cache.get('a') == 'A' and cache.get('c') == 'C'
+    assert cache.total_bytes == 80
+
+    # too large for the budget
+    assert not cache.put('d', 'D', 101)
+    assert cache.get('d') is None and len(cache) == 2
+
+def test_hash_files(tmp_path):
+    a, b = tmp_path / 'a.dcm', tmp_path / 'b.dcm'
+    a.write_bytes(b'1')
+    b.write_bytes(b'2')
+    h = phantom_cache.hash_files([str(a), str(b)])
+    assert h == phantom_cache.hash_files([str(b), str(a)])
+    b.write_bytes(b'3')
+    assert h != phantom_cache.hash_files([str(a), str(b)])
+
+def test_load_and_analyze(cache, tmp_path):
+    input_file = tmp_path / 'input.dcm'
+    input_file.write_bytes(b'image')
+    loads = []
+
+    def load_phantom(input_path, config):
+        loads.append(input_path)
+        return FakePhantom(1000)
+
+    def analyze_phantom(phantom, config):
+        assert phantom.analyzed_with is None
+        phantom.analyzed_with = config['analysis_params']['tolerance']
+
+    config = {'analysis_params': {'tolerance': 1}}
+    first = phantoms.helper.load_and_analyze(load_phantom, analyze_phantom, str(input_file), config, log_message=print)
+    # same parameters: the analyzed phantom
+    assert phantoms.helper.load_and_analyze(load_phantom, analyze_phantom, str(input_file), config, log_message=print) is first
+
+    # new parameters: a copy of the loaded phantom is analyzed, the input is not loaded again
+    second = phantoms.helper.load_and_analyze(load_phantom, analyze_phantom, str(input_file),
+                                              {'analysis_params': {'tolerance': 2}}, log_message=print)
+    assert second is not first and second.analyzed_with == 2 and first.analyzed_with == 1
+    assert len(loads) == 1
+
+    # changed input
+    input_file.write_bytes(b'other image')
+    phantoms.helper.load_and_analyze(load_phantom, analyze_phantom, str(input_file), config, log_message=print)
+    assert len(loads) == 2
+
+def test_no_cache(tmp_path):
+    phantom_cache.configure(enabled=False)
+    loads = []
+    for _ in range(2):
+        phantoms.helper.load_and_analyze(lambda path, config: loads.append(path) or FakePhantom(10), lambda p, c: None,
+                                         str(tmp_path), {'analysis_params': {}}, log_message=print)
+    assert len(loads) == 2
+
+def test_phantom_nbytes_includes_the_dicom_pixels(tmp_path):
+    pytest.importorskip('pylinac')
+    from pylinac.core import image
+    from benchmarks.synthetic import write_dicom
+
+    file = write_dicom(str(tmp_path / 'image.dcm'), np.zeros((256, 256)), modality='RTIMAGE')
+    phantom = FakePhantom(1)
+    phantom.image = image.load(file)
+    assert phantoms.helper.get_phantom_nbytes(phantom) >= phantom.image.array.nbytes + len(phantom.image.metadata.PixelData)
+    assert phantoms.helper.get_phantom_nbytes(FakePhantom(1000)) == 1000
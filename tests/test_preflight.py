@@ -0,0 +1,41 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+pytest.importorskip('pydicom')
+
+from benchmarks.synthetic import write_dicom, make_phantom_image as make_image
+import phantoms.preflight
+
+def check(tmp_path, pixels, phantom_id, config=None):
+    file = write_dicom(str(tmp_path / 'image.dcm'), pixels, modality='RTIMAGE')
+    config = {'preflight': {'enabled': True, **(config or {}).get('preflight', {})}}
+    return phantoms.preflight.check_image(file, phantom_id, config, log_message=lambda m: None)
+
+def test_phantom_images_pass(tmp_path):
+    stats = check(tmp_path, make_image('rectangle'), 'qc3')
+    assert stats['shape_score'] > 0.9
+    assert stats['polarity'] == 'dark'
+    assert check(tmp_path, make_image('disc'), 'leedstor')['shape_score'] > 0.9
+
+def test_bad_images_are_rejected(tmp_path):
+    with pytest.raises(Exception, match='blank image'):
+        check(tmp_path, np.full((400, 400), 1000), 'qc3')
+
+    saturated = make_image('rectangle')
+    saturated[:, :200] = 65535
+    with pytest.raises(Exception, match='saturated'):
+        check(tmp_path, saturated, 'qc3')
+
+    with pytest.raises(Exception, match='does not look like'):
+        check(tmp_path, np.random.default_rng(1).integers(0, 60000, (400, 400)), 'leedstor')
+
+    with pytest.raises(Exception, match='inverted'):
+        check(tmp_path, make_image('rectangle'), 'qc3', config={'preflight': {'polarity': 'bright'}})
+
+def test_disabled(tmp_path):
+    assert check(tmp_path, np.zeros((10, 10)), 'qc3', config={'preflight': {'enabled': False}}) is None
+
+    # off unless the phantom config enables it
+    file = write_dicom(str(tmp_path / 'blank.dcm'), np.zeros((10, 10)), modality='RTIMAGE')
+    assert phantoms.preflight.check_image(file, 'qc3', {}, log_message=lambda m: None) is None
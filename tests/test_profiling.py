@@ -0,0 +1,25 @@
+import json
+import os
+
+from utils import profiling, timing
+
+def test_profiler_saves_reports(tmp_path):
+    profiler = profiling.Profiler(trace_malloc=True, top=5)
+    with timing.record() as recorder:
+        profiler.start()
+        with timing.span('analyze'):
+            data = [list(range(100)) for _ in range(100)]
+        profiler.stop()
+
+    profiler.save(str(tmp_path), recorder=recorder, log_message=lambda m: None)
+
+    assert {'profile.prof', 'profile.txt', 'tracemalloc.txt', 'trace.json'} <= set(os.listdir(tmp_path))
+    trace = json.loads((tmp_path / 'trace.json').read_text())
+    assert trace['traceEvents'][0]['name'] == 'analyze'
+    assert trace['traceEvents'][0]['ph'] == 'X'
+
+def test_profiling_options():
+    config = {'profiling': {'enabled': False, 'top': 10}}
+    assert profiling.get_profiling_options(config)['enabled'] is False
+    options = profiling.get_profiling_options(config, trace_malloc=True)
+    assert options['enabled'] and options['tracemalloc'] and options['top'] == 10
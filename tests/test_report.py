@@ -0,0 +1,69 @@
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import matplotlib.image
+
+from utils import helper, cases, baseline
+import report
+
+def make_case(output_folder, phantom, name, result, image=True):
+    case_dir = os.path.join(output_folder, f'sbuh_truebeam_{phantom}', name)
+    os.makedirs(case_dir)
+    helper.write_json_file(os.path.join(case_dir, 'result.json'), result)
+    if image:
+        matplotlib.image.imsave(os.path.join(case_dir, 'analyzed_image.png'), np.random.rand(900, 600))
+    return case_dir
+
+def test_select_metrics():
+    runs = [{'numbers': {'mtf_50': 0.5 + i * 0.01, 'constant': 1.0, 'config_x': float(i), 'rare': 1.0 if i == 0 else None}}
+            for i in range(4)]
+    for run in runs:
+        run['numbers'] = {k: v for k, v in run['numbers'].items() if v is not None}
+
+    assert report.select_metrics(runs, ignore=['config_*']) == ['mtf_50']
+    assert report.select_metrics(runs, patterns=['con*', 'rare'], ignore=['config_*']) == ['constant', 'rare']
+
+def test_load_thumbnail(tmp_path):
+    image_file = str(tmp_path / 'image.png')
+    matplotlib.image.imsave(image_file, np.random.rand(1000, 500))
+    assert report.load_thumbnail(image_file, size=250).shape[:2] == (250, 125)
+
+def make_runs(num_runs, keys):
+    runs = []
+    for i in range(num_runs):
+        case = {'phantom': 'QC3', 'case_dir': f'case{i}'}
+        runs.append({'case': case, 'datetime': datetime(2024, 1, 1) + timedelta(hours=i), 'result': {},
+                     'numbers': {key: float(i + j) for j, key in enumerate(keys)}})
+    return runs
+
+def test_summary_pages():
+    assert len(report.summary_pages('title', make_runs(100, []), {}, per_page=45)) == 3
+    assert len(report.summary_pages('title', make_runs(10, []), {}, per_page=45)) == 1
+
+def test_trend_pages_odd_per_page():
+    keys = ['a', 'b', 'c', 'd', 'e']
+    runs = make_runs(5, keys)
+    assert len(report.trend_pages('QC3', runs, keys, per_page=1)) == 5
+    assert len(report.trend_pages('QC3', runs, keys, per_page=3)) == 2
+
+def test_build_report(tmp_path):
+    output_folder = str(tmp_path / 'output')
+    for day in range(1, 11):
+        make_case(output_folder, 'qc3', f'202401{day:02d}_080000', {'mtf': {'50': 0.5 + day * 0.001}, 'passed': 'True'})
+        make_case(output_folder, 'fc2', f'202401{day:02d}_081000', {'offset': 0.1 * day}, image=day % 2 == 0)
+    make_case(output_folder, 'qc3', '20240201_080000', {'mtf': {'50': 0.6}})  # next month
+
+    os.makedirs(str(tmp_path / 'baselines'))
+    baseline.save_baseline(baseline.get_baseline_file(str(tmp_path / 'baselines'), 'sbuh', 'truebeam', 'qc3'), {'mtf': {'50': 0.5}})
+
+    def get_phantom_config(site, device, phantom):
+        return {'baseline': {'enabled': True, 'folder': str(tmp_path / 'baselines')}}
+
+    start, end = report.get_month_range('2024-01')
+    case_list = cases.find_case_folders(output_folder, site='sbuh', device='truebeam', start=start, end=end)
+    report_file = str(tmp_path / 'reports' / 'report.pdf')
+    assert report.build_report(case_list, report_file, 'test report', get_phantom_config=get_phantom_config, log_message=print) == 20
+
+    with open(report_file, 'rb') as file:
+        assert file.read(5) == b'%PDF-'
@@ -0,0 +1,80 @@
+import os
+import csv
+
+import pytest
+
+from utils import helper
+from utils.checkpoint import Checkpoint
+import reprocess
+
+APP_CONFIG = {'phantoms': [{'id': 'QC3', 'dim': 2}]}
+
+def make_case(tmp_path, name, result, versions=None):
+    case_dir = str(tmp_path / 'sbuh_truebeam_qc3' / name)
+    os.makedirs(case_dir)
+    helper.write_json_file(os.path.join(case_dir, 'result.json'), result)
+    for version, version_result in (versions or {}).items():
+        version_dir = reprocess.get_version_dir(case_dir, version)
+        os.makedirs(version_dir)
+        helper.write_json_file(os.path.join(version_dir, 'result.json'), version_result)
+    return {'case_dir': case_dir, 'site': 'sbuh', 'device': 'truebeam', 'phantom': 'qc3'}
+
+def test_diff_results():
+    old = {'mtf': {'50': 0.5, '80': 0.3}, 'passed': 'True', 'notes': 'a', 'removed': 1.0}
+    new = {'mtf': {'50': 0.5 + 1e-9, '80': 0.35}, 'passed': 'False', 'notes': 'b', 'added': 2.0}
+
+    rows = reprocess.diff_results(old, new)
+    assert [(r['key'], r['change']) for r in rows] == [('added', None), ('mtf_80', 0.35 - 0.3), ('passed', None), ('removed', None)]
+
+def test_diff_report(tmp_path):
+    case_list = [make_case(tmp_path, '20240101_080000', {'value': 1.0}, {'v2': {'value': 1.0}}),
+                 make_case(tmp_path, '20240102_080000', {'value': 1.0}, {'v2': {'value': 1.1}}),
+                 make_case(tmp_path, '20240103_080000', {'value': 1.0})]  # not reprocessed
+
+    report_file = str(tmp_path / 'diff.csv')
+    rows = reprocess.diff_report(case_list, 'v2', report_file=report_file, log_message=print)
+    assert len(rows) == 1 and rows[0]['case_dir'] == case_list[1]['case_dir']
+
+    with open(report_file) as file:
+        lines = list(csv.DictReader(file))
+    assert lines[0]['key'] == 'value' and float(lines[0]['new']) == 1.1
+
+def test_reprocess_skips_checkpointed_cases(tmp_path):
+    case = make_case(tmp_path, '20240101_080000', {'value': 1.0})
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint.txt'))
+    checkpoint.mark_done(case['case_dir'])
+
+    assert reprocess.reprocess([case], 'v2', checkpoint, app_config=APP_CONFIG, log_message=print) == []
+
+def test_reprocess_case_without_input(tmp_path):
+    case = make_case(tmp_path, '20240101_080000', {'value': 1.0})
+    result = reprocess.reprocess_case((case, 'v2', None, APP_CONFIG, None))
+    assert result['status'] == 'error' and 'No input files' in result['error']
+
+def test_reprocess_case_leaves_the_results_csv(tmp_path):
+    pytest.importorskip('pylinac')
+    from pylinac.core.image_generator.utils import generate_lightrad
+    from pylinac.core.image_generator import AS1000Image, FilteredFieldLayer
+
+    case = make_case(tmp_path, '20240101_080000', {'value': 1.0})
+    case['phantom'] = 'fc2'
+    generate_lightrad(os.path.join(case['case_dir'], 'input.dcm'), AS1000Image(sid=1000), FilteredFieldLayer,
+                      field_size_mm=(100, 100), bb_positions=((-40, -40), (-40, 40), (40, -40), (40, 40)))
+
+    # the shipped config with a logo that exists here
+    import numpy as np
+    import matplotlib.image
+    logo = str(tmp_path / 'logo.png')
+    matplotlib.image.imsave(logo, np.zeros((10, 10)))
+    config = helper.read_json_file(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.sbuh.truebeam.fc2.json'))
+    config['publish_pdf_params']['logo'] = logo
+    helper.write_json_file(str(tmp_path / 'config.sbuh.truebeam.fc2.json'), config)
+
+    app_config = {'phantoms': [{'id': 'FC2', 'dim': 2}]}
+    result = reprocess.reprocess_case((case, 'v2', str(tmp_path), app_config, str(tmp_path / 'metrics')))
+    assert result['status'] == 'ok', result['error']
+
+    version_dir = reprocess.get_version_dir(case['case_dir'], 'v2')
+    assert os.path.exists(os.path.join(version_dir, 'result.json'))
+    assert not os.path.exists(os.path.join(os.path.dirname(version_dir), 'results.csv'))
+    assert len(os.listdir(str(tmp_path / 'metrics'))) == 1
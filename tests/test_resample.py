@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pydicom = pytest.importorskip('pydicom')
+pytest.importorskip('scipy')
+
+from benchmarks.synthetic import write_dicom, make_phantom_image
+from benchmarks.validate_resample import compare_metrics
+import phantoms.resample as resample
+
+@pytest.fixture
+def image_file(tmp_path):
+    return write_dicom(str(tmp_path / 'epid.dcm'), make_phantom_image(size=400), modality='RTIMAGE',
+                       ImagePlanePixelSpacing=[0.1, 0.1], RTImageSID=1500)
+
+def test_bin_array():
+    array = np.arange(36, dtype=np.uint16).reshape(6, 6)
+    binned = resample.bin_array(array, 2)
+    assert binned.shape == (3, 3)
+    assert binned[0, 0] == np.mean([0, 1, 6, 7])
+
+    # the edges that do not fill a block are dropped
+    assert resample.bin_array(np.ones((7, 5)), 2).shape == (3, 2)
+
+@pytest.mark.parametrize('method', ['bin', 'antialias'])
+def test_resample_input(image_file, tmp_path, method):
+    config = {'resample': {'enabled': True, 'target_pixel_mm': 0.4, 'method': method}}
+    output_file = resample.resample_input(image_file, config, str(tmp_path), log_message=print)
+    assert output_file == os.path.join(str(tmp_path), 'input_resampled.dcm')
+
+    ds = pydicom.dcmread(output_file)
+    assert (ds.Rows, ds.Columns) == (100, 100)
+    assert [float(v) for v in ds.ImagePlanePixelSpacing] == pytest.approx([0.4, 0.4])
+    assert ds.pixel_array.dtype == np.uint16
+    # same physical field, same mean signal
+    assert ds.pixel_array.mean() == pytest.approx(pydicom.dcmread(image_file).pixel_array.mean(), rel=0.01)
+    assert float(ds.RTImageSID) == 1500
+
+def test_resample_not_needed(image_file, tmp_path):
+    assert resample.resample_input(image_file, {}, str(tmp_path), log_message=print) == image_file
+
+    config = {'resample': {'enabled': True, 'target_pixel_mm': 0.12}}
+    assert resample.resample_input(image_file, config, str(tmp_path), log_message=print) == image_file
+
+def test_compare_metrics():
+    changes, missing = compare_metrics({'a': 10.0, 'b': 0.0, 'c': 1.0}, {'a': 11.0, 'b': 0.0})
+    assert changes == {'a': pytest.approx(0.1), 'b': 0.0}
+    assert missing == ['c']
@@ -0,0 +1,79 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip('pydicom')
+
+from utils import helper
+from benchmarks.stub_server import StubServer
+import analysis_runner
+import session_runner
+
+APP_CONFIG = {'phantoms': [{'id': 'CatPhan', 'dim': 3}, {'id': 'QC3', 'dim': 2}, {'id': 'FC2', 'dim': 2}]}
+
+def classified(file, phantom, confidence=1.0, series_uid=''):
+    return {'file': file, 'phantom': phantom, 'confidence': confidence, 'series_uid': series_uid}
+
+def test_make_session_cases():
+    results = [classified('qc3.dcm', 'QC3'),
+               classified('fc2.dcm', 'FC2'),
+               classified('ct1.dcm', 'CatPhan', series_uid='1.2'),
+               classified('ct2.dcm', 'CatPhan', series_uid='1.2'),
+               classified('unknown.dcm', 'FC2', confidence=0.4),
+               classified('other.dcm', None, confidence=0.0)]
+
+    cases, unassigned = session_runner.make_session_cases(results, APP_CONFIG, 'SBUH', 'Truebeam',
+                                                          assignments={'other.dcm': 'QC3', 'fc2.dcm': None})
+    assert [(c['phantom'], c['files']) for c in cases] == [('QC3', ['qc3.dcm']), ('CatPhan', ['ct1.dcm', 'ct2.dcm']),
+                                                           ('QC3', ['other.dcm'])]
+    assert all(c['site'] == 'SBUH' and c['device'] == 'Truebeam' for c in cases)
+    assert unassigned == ['unknown.dcm']
+
+def test_make_unassigned_cases():
+    results = [{**classified('mv.dcm', 'QC3', confidence=0.33), 'scores': {'QC3': 1.0, 'FC2': 1.0, 'LasVegas': 1.0}},
+               {**classified('ct1.dcm', None, series_uid='1.2'), 'modality': 'CT'},
+               {**classified('ct2.dcm', None, series_uid='1.2'), 'modality': 'CT'},
+               classified('qc3.dcm', 'QC3')]
+
+    cases = session_runner.make_unassigned_cases(results, ['mv.dcm', 'ct1.dcm', 'ct2.dcm'], 'SBUH', 'Truebeam')
+    assert [(c['phantom'], c['files'], c['candidates']) for c in cases] == [(None, ['mv.dcm'], ['QC3', 'FC2', 'LasVegas']),
+                                                                           (None, ['ct1.dcm', 'ct2.dcm'], [])]
+
+def write_case(output_folder, phantom):
+    case_dir = os.path.join(output_folder, f'sbuh_truebeam_{phantom.lower()}', '20240101_080000')
+    os.makedirs(case_dir)
+    helper.write_json_file(os.path.join(case_dir, 'result.json'), {'value': 1.5, 'passed': 'True'})
+    return case_dir
+
+def test_run_and_push_session(tmp_path, monkeypatch):
+    output_folder = str(tmp_path / 'output')
+
+    def run_job(job, progress_queue=None):
+        if job['phantom'] == 'FC2':
+            return {'status': 'error', 'case_dir': None, 'error': 'failed', 'total_s': 0.1, 'log': ['Error: failed']}
+        return {'status': 'ok', 'case_dir': write_case(job['output_folder'], job['phantom']), 'error': None,
+                'total_s': 1.0, 'log': ['done']}
+
+    monkeypatch.setattr(analysis_runner, 'run_job', run_job)
+    cases = [{'site': 'SBUH', 'device': 'Truebeam', 'phantom': p, 'files': [f'{p}.dcm']} for p in ('QC3', 'FC2', 'CatPhan')]
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        summary = session_runner.run_session(cases, output_folder, performed_by='tester', executor=executor, log_message=print)
+
+    assert [c['status'] for c in summary['cases']] == ['ok', 'error', 'ok']
+    with open(os.path.join(summary['session_dir'], 'session.json')) as file:
+        assert json.load(file)['cases'][1]['error'] == 'failed'
+    assert os.path.exists(os.path.join(summary['session_dir'], 'session.txt'))
+
+    with StubServer() as server:
+        config = {'webservice_url': server.url, 'temp_folder': str(tmp_path)}
+        numbers, strings = session_runner.push_session(summary, config, app='test', log_message=print)
+
+        paths = [path for path, _ in server.requests]
+        # one upload and result per analyzed case, one post of the metrics of all the cases
+        assert paths.count('/api/upload') == 2
+        assert paths.count('/api/qc3results') == 1 and paths.count('/api/catphanresults') == 1
+        assert paths.count('/api/number1ds') == 1 and paths.count('/api/string1ds') == 1
+        assert numbers == 2 and strings == 2
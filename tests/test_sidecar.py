@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from utils.helper import to_serializable
+from utils.object import flatten
+from utils.sidecar import ArrayWriter, ResultArrays, is_array_ref
+
+def test_large_arrays_go_to_sidecar(tmp_path):
+    writer = ArrayWriter(min_size=10)
+    result = to_serializable({'mtf': {'curve': np.arange(100.0)}, 'small': np.arange(3)}, array_hook=writer)
+
+    assert result['small'] == [0, 1, 2]
+    assert is_array_ref(result['mtf']['curve'])
+    assert result['mtf']['curve']['shape'] == [100]
+
+    writer.save(str(tmp_path))
+    (tmp_path / 'result.json').write_text(json.dumps(result))
+
+    arrays = ResultArrays(str(tmp_path))
+    assert arrays.keys() == ['mtf_curve']
+    curve = arrays.resolve(result['mtf']['curve'])
+    assert isinstance(curve, np.memmap)
+    assert curve[99] == 99.0
+
+    # the summary flattens without the array data
+    assert [item['key'] for item in flatten(result)] == ['small_0', 'small_1', 'small_2']
+
+def test_result_json_is_compact_by_default(tmp_path):
+    from types import SimpleNamespace
+    from utils import timing
+    import phantoms.helper
+
+    phantom = SimpleNamespace(results_data=lambda: SimpleNamespace(mtf={'curve': np.arange(3.0)}))
+    metadata = {'Performed By': 'test', 'Performed Date': '2024-01-01'}
+    for config, indented in (({}, False), ({'result_json_indent': 4}, True)):
+        phantoms.helper.save_result_as_json(phantom, str(tmp_path), 'SITE|Device', '', config, metadata, log_message=lambda m: None)
+        with timing.record() as recorder:
+            pass
+        phantoms.helper.save_timings(recorder, str(tmp_path), metrics_dir=str(tmp_path / 'metrics'), log_message=lambda m: None)
+
+        text = (tmp_path / 'result.json').read_text()
+        assert ('\n' in text) == indented
+        assert 'stages' in json.loads(text)['timings']
@@ -0,0 +1,48 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('pydicom')
+
+import dicom_helper
+import phantoms.helper
+from benchmarks.synthetic import write_ct_series
+
+def make_headers(z_positions, overrides=None):
+    headers = []
+    for i, z in enumerate(z_positions):
+        header = {'file': f'CT_{i:04d}.dcm', 'position': [0.0, 0.0, z], 'z': z, 'orientation': [1, 0, 0, 0, 1, 0],
+                  'pixel_spacing': [0.5, 0.5], 'slice_thickness': 2.0, 'series_uid': '1.2.3', 'acquisition_number': 1,
+                  'shape': (512, 512), 'rescale_slope': 1.0, 'rescale_intercept': -1024.0}
+        header.update((overrides or {}).get(i, {}))
+        headers.append(header)
+    return headers
+
+def test_consistent_series():
+    report = dicom_helper.check_slice_geometry(make_headers(list(np.arange(0, 100, 2.0))))
+    assert report['errors'] == []
+    assert report['spacing'] == 2.0
+
+def test_gaps_duplicates_and_outliers():
+    z = [0.0, 2.0, 4.0, 4.0, 6.0, 12.0, 14.0, 16.0, 18.0, 20.0]
+    headers = make_headers(z, {8: {'orientation': [0, 1, 0, 0, 0, -1]}, 9: {'acquisition_number': 2}})
+    report = dicom_helper.check_slice_geometry(headers)
+
+    assert report['duplicates'] == [4.0]
+    assert report['gaps'] == [[6.0, 12.0]]
+    assert report['outliers'] == [18.0, 20.0]
+    assert len(report['errors']) == 4
+
+    trimmed = dicom_helper.find_consistent_slices(headers, report)
+    assert [h['z'] for h in trimmed] == [0.0, 2.0, 4.0, 6.0]
+
+def test_validate_input_slices(tmp_path):
+    files = write_ct_series(str(tmp_path), 20, slice_thickness=1.0)
+    files = files[:5] + files[8:]
+
+    config = {'slice_validation': {'on_error': 'refuse'}}
+    with pytest.raises(Exception, match='Inconsistent slice geometry'):
+        phantoms.helper.validate_input_slices(files, config, log_message=lambda m: None)
+
+    config = {'slice_validation': {'on_error': 'trim', 'min_slices': 10}}
+    headers = phantoms.helper.validate_input_slices(files, config, log_message=lambda m: None)
+    assert [h['z'] for h in headers] == list(np.arange(8.0, 20.0))
@@ -0,0 +1,65 @@
+import os
+import csv
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('pylinac')
+
+from benchmarks.synthetic import write_dicom, make_phantom_image
+import phantoms.qc3
+import sweep
+
+@pytest.fixture
+def image_file(tmp_path):
+    return write_dicom(str(tmp_path / 'qc3.dcm'), make_phantom_image(size=256), modality='RTIMAGE',
+                       ImagePlanePixelSpacing=[0.392, 0.392], RTImageSID=1500)
+
+def test_make_grid():
+    grid = sweep.make_grid({'a': [1, 2], 'b': ['x', 'y', 'z']})
+    assert len(grid) == 6
+    assert grid[0] == {'a': 1, 'b': 'x'} and grid[-1] == {'a': 2, 'b': 'z'}
+
+def test_shared_phantom_rebuild(image_file):
+    phantom = phantoms.qc3.load_phantom(image_file, {})
+    shared = sweep.SharedPhantom(phantom)
+    try:
+        # the template has no pixel data, the original phantom is unchanged
+        assert len(shared.template) < phantom.image.array.nbytes / 4
+        assert phantom.image.array is not None and 'PixelData' in phantom.image.metadata
+
+        sweep._worker.update(shm=shared.shm, spec=shared.spec())
+        rebuilt = sweep._rebuild_phantom()
+        assert np.array_equal(rebuilt.image.array, phantom.image.array)
+        assert rebuilt.image.dpmm == phantom.image.dpmm
+    finally:
+        sweep._worker.clear()
+        shared.close()
+
+@pytest.fixture
+def fc2_file(tmp_path):
+    # a simulated FC-2 image (10x10 field, 4 BBs) that pylinac analyzes
+    from pylinac.core.image_generator import AS1000Image, FilteredFieldLayer
+    from pylinac.core.image_generator.utils import generate_lightrad
+
+    file = str(tmp_path / 'fc2.dcm')
+    generate_lightrad(file, AS1000Image(sid=1000), FilteredFieldLayer, field_size_mm=(100, 100),
+                      bb_positions=((-40, -40), (-40, 40), (40, -40), (40, 40)))
+    return file
+
+def test_run_sweep(fc2_file, tmp_path):
+    config = {'analysis_params': {'fwxm': 50, 'bb_edge_threshold_mm': 10}}
+    grid = {'fwxm': [40, 50], 'bb_edge_threshold_mm': [5, 10]}
+    output_dir = str(tmp_path / 'sweep')
+
+    rows = sweep.run_sweep('FC2', fc2_file, config, grid, output_dir, metric_patterns=['field_*'], max_workers=2,
+                           log_message=lambda m: None)
+
+    assert [row['index'] for row in rows] == [0, 1, 2, 3]
+    assert [row['bb_edge_threshold_mm'] for row in rows] == [5, 10, 5, 10]
+    assert [row['status'] for row in rows] == ['ok'] * 4, [row['error'] for row in rows]
+    with open(os.path.join(output_dir, 'sweep.csv')) as file:
+        table = list(csv.DictReader(file))
+    assert len(table) == 4
+    for row in table:
+        assert abs(float(row['field_size_x_mm']) - 100) < 2 and 'field_bb_offset_y_mm' in row
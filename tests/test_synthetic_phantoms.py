@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip('numpy')
+pylinac = pytest.importorskip('pylinac')
+
+from benchmarks.synthetic import write_catphan_series, write_phantom_input
+
+@pytest.mark.parametrize('phantom_id, phantom_class', [
+    ('QC3', 'StandardImagingQC3'),
+    ('QCkV', 'StandardImagingQCkV'),
+    ('LasVegas', 'LasVegas'),
+    ('LeedsTOR', 'LeedsTOR'),
+])
+def test_planar_phantom_is_localized(tmp_path, phantom_id, phantom_class):
+    file = write_phantom_input(str(tmp_path), phantom_id, {'analysis_params': {'ssd': 1400.0}})
+
+    phantom = getattr(pylinac, phantom_class)(file)
+    phantom.analyze(ssd=1400.0)
+
+def test_fc2_bbs_are_found(tmp_path):
+    file = write_phantom_input(str(tmp_path), 'FC2', {'analysis_params': {}})
+
+    fc2 = pylinac.StandardImagingFC2(file)
+    fc2.analyze()
+    assert fc2.results_data().field_size_x_mm == pytest.approx(100, abs=2)
+
+def test_catphan_hu_values(tmp_path):
+    write_catphan_series(str(tmp_path), model='504')
+
+    catphan = pylinac.CatPhan504(str(tmp_path))
+    catphan.analyze()
+    assert abs(catphan.catphan_roll) < 1
+    assert all(roi.passed for roi in catphan.ctp404.rois.values())
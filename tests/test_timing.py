@@ -0,0 +1,37 @@
+import pytest
+
+from utils import timing
+
+def test_span_without_recorder_is_noop():
+    with timing.span('load'):
+        pass
+    assert timing.get_recorder() is None
+
+def test_spans_are_aggregated_by_name():
+    @timing.timed('save_subimage')
+    def save():
+        pass
+
+    with timing.record() as recorder:
+        with timing.span('analyze'):
+            save()
+            save()
+
+    timings = recorder.to_dict()
+    assert set(timings['stages']) == {'analyze', 'save_subimage'}
+    assert timings['stages']['save_subimage']['count'] == 2
+    assert [s['depth'] for s in recorder.spans] == [1, 1, 0]
+    assert timing.get_recorder() is None
+
+def test_span_records_the_rss_change():
+    if timing.get_rss_mb() is None:
+        pytest.skip('RSS not available on this platform')
+
+    with timing.record() as recorder:
+        with timing.span('allocate'):
+            block = bytearray(64 * 1024 * 1024)
+            block[::4096] = b'x' * len(block[::4096])
+
+    stage = recorder.to_dict()['stages']['allocate']
+    assert stage['rss_delta_mb'] > 50
+    assert stage['rss_mb'] >= stage['rss_delta_mb']
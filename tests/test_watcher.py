@@ -0,0 +1,169 @@
+import os
+import time
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+pytest.importorskip('pydicom')
+
+from benchmarks.synthetic import write_dicom, write_ct_series
+from utils import helper
+from utils.checkpoint import Checkpoint
+import analysis_runner
+import watcher
+
+def make_watcher(tmp_path, jobs, settle_time_s=30):
+    def run_job(job):
+        jobs.append(job)
+        return {'status': 'ok', 'case_dir': 'case', 'error': None}
+
+    folder = {'path': str(tmp_path / 'export'), 'site': 'SBUH', 'device': 'Truebeam'}
+    return watcher.Watcher(watch_folders=[folder], output_folder=str(tmp_path / 'out'),
+                           app_config=analysis_runner.load_app_config(),
+                           checkpoint=Checkpoint(str(tmp_path / 'checkpoint.txt')),
+                           settle_time_s=settle_time_s, executor=ThreadPoolExecutor(max_workers=1),
+                           run_job=run_job, log_message=lambda m: None)
+
+def test_watcher_groups_and_debounces(tmp_path):
+    export = tmp_path / 'export'
+    ct_files = write_ct_series(str(export / 'cbct'), 40)
+    qc3_file = write_dicom(str(export / 'qc3.dcm'), np.zeros((64, 64)), modality='RTIMAGE', RTImageLabel='QC3 6X')
+    with open(export / 'notes.txt', 'w') as file:
+        file.write('not a DICOM file')
+
+    jobs = []
+    w = make_watcher(tmp_path, jobs)
+    now = time.time()
+
+    # written just now - not settled yet
+    w.poll(now)
+    assert jobs == []
+
+    w.poll(now + 31)
+    w.wait()
+    assert sorted(job['phantom'] for job in jobs) == ['CatPhan', 'QC3']
+    ct_job = next(job for job in jobs if job['phantom'] == 'CatPhan')
+    assert sorted(ct_job['files']) == sorted(ct_files)
+    assert ct_job['site'] == 'SBUH' and ct_job['device'] == 'Truebeam'
+
+    # the analyzed files are in the checkpoint, a restarted watcher does nothing
+    assert w.checkpoint.is_done(qc3_file) and not w.checkpoint.is_done(str(export / 'notes.txt'))
+    jobs.clear()
+    w2 = make_watcher(tmp_path, jobs)
+    w2.poll(now + 100)
+    w2.wait()
+    assert jobs == []
+
+def test_watcher_retries_skipped_files(tmp_path):
+    from benchmarks.synthetic import make_phantom_image
+    export = tmp_path / 'export'
+    export.mkdir()
+    file = write_dicom(str(export / 'mv.dcm'), make_phantom_image('rectangle'), modality='RTIMAGE')
+
+    jobs, messages = [], []
+    w = make_watcher(tmp_path, jobs)
+    w.log_message = messages.append
+    now = time.time()
+    w.poll(now + 31)
+    w.poll(now + 62)
+    w.wait()
+
+    # the MV phantoms tie: logged once with the candidates, not checkpointed
+    skips = [m for m in messages if m.startswith('skipping')]
+    assert jobs == [] and len(skips) == 1
+    assert 'QC3' in skips[0] and 'FC2' in skips[0]
+    assert not w.checkpoint.is_done(file)
+
+    # the config is fixed: the watch folder names the phantom, the next start analyzes it
+    w2 = make_watcher(tmp_path, jobs)
+    w2.watch_folders[0]['phantom'] = 'QC3'
+    w2.poll(now + 93)
+    w2.wait()
+    assert [job['phantom'] for job in jobs] == ['QC3']
+
+def test_watcher_waits_for_a_busy_series(tmp_path):
+    export = tmp_path / 'export'
+    now = time.time()
+    for file in write_ct_series(str(export / 'cbct'), 40):
+        os.utime(file, (now - 60, now - 60))
+
+    # one more file is still being written
+    with open(export / 'cbct' / 'CT_0040.dcm', 'wb') as file:
+        file.write(b'partial')
+
+    jobs = []
+    w = make_watcher(tmp_path, jobs, settle_time_s=5)
+    w.poll(now)
+    assert jobs == []
+
+    w.poll(now + 6)
+    w.wait()
+    assert len(jobs) == 1 and len(jobs[0]['files']) == 40
+
+def test_queue_files(tmp_path):
+    files = write_ct_series(str(tmp_path / 'received'), 40)
+
+    jobs = []
+    w = make_watcher(tmp_path, jobs)
+    cases = w.queue_files(files, {'site': 'PFCC', 'device': 'TruebeamSH'})
+    w.wait()
+
+    assert len(cases) == 1
+    assert jobs[0]['phantom'] == 'CatPhan' and jobs[0]['device'] == 'TruebeamSH'
+    assert all(w.checkpoint.is_done(f) for f in files)
+
+def test_watcher_retries_failed_jobs(tmp_path):
+    export = tmp_path / 'export'
+    export.mkdir()
+    file = write_dicom(str(export / 'qc3.dcm'), np.zeros((64, 64)), modality='RTIMAGE', RTImageLabel='QC3 6X')
+
+    jobs = []
+    w = make_watcher(tmp_path, jobs)
+    w.max_attempts = 2
+
+    def run_job(job):
+        jobs.append(job)
+        if len(jobs) == 1:
+            raise Exception('analysis failed')
+        return {'status': 'ok', 'case_dir': 'case', 'error': None}
+
+    w.run_job = run_job
+    now = time.time()
+    results = w.poll(now + 31)
+    futures.wait(list(w.in_flight))
+    results += w.collect()
+
+    # the first run failed: not checkpointed
+    assert [r['status'] for r in results] == ['error']
+    assert not w.checkpoint.is_done(file)
+
+    # queued again on the next poll
+    w.poll(now + 32)
+    w.wait()
+    assert len(jobs) == 2 and w.checkpoint.is_done(file)
+
+def test_watcher_gives_up_after_max_attempts(tmp_path):
+    export = tmp_path / 'export'
+    export.mkdir()
+    file = write_dicom(str(export / 'qc3.dcm'), np.zeros((64, 64)), modality='RTIMAGE', RTImageLabel='QC3 6X')
+
+    jobs = []
+    w = make_watcher(tmp_path, jobs)
+
+    def run_job(job):
+        jobs.append(job)
+        return {'status': 'error', 'case_dir': None, 'error': 'analysis failed'}
+
+    w.run_job = run_job
+    now = time.time()
+    w.poll(now + 31)
+    w.wait()
+    assert len(jobs) == 3 and not w.checkpoint.is_done(file)
+
+    # left like a skipped file: not tried again until it changes
+    w.poll(now + 62)
+    w.wait()
+    assert len(jobs) == 3
@@ -0,0 +1,214 @@
+import os
+import sys
+import uuid
+import queue
+import shutil
+import tempfile
+import threading
+
+from utils import helper
+
+# Write-behind storage of the case folders. The analysis writes the case (PNGs, PDF, TXT, JSON, results.csv)
+# to a staging folder on local disk and publish() hands it to a background thread that moves it to the
+# output folder (often a network share):
+#   <scratch>/<pid>_<tag>/                                         the folder of one store (app instance)
+#   <scratch>/<pid>_<tag>/<id>/publish.json                        destination case folder, written when the case is complete
+#   <scratch>/<pid>_<tag>/<id>/<site>_<device>_<phantom>/<date time>/  the case, as written by the phantom module
+#   <scratch>/<pid>_<tag>/<id>/<site>_<device>_<phantom>/results.csv   the result line(s), merged into the phantom's results.csv
+# The case is copied next to its destination under a hidden name and renamed into place, so a half-written
+# case folder is never visible. A publish that fails is retried after each of retry_delays_s; a case that
+# still fails stays in the scratch folder and is published again by the next store created after this
+# process has ended. The folders of stores in running processes (another app instance) are left alone.
+# It is off until configure() is called (by the GUI); services and workers write to the output folder directly.
+
+PUBLISH_FILE = 'publish.json'
+
+DEFAULT_OPTIONS = {
+    'enabled': False,
+    'scratch_folder': None,  # default: <temp>/image_qa_staging
+    'close_timeout_s': 10,   # wait for the publishing on exit; the rest is published on the next start
+    'retry_delays_s': [5, 15, 60, 300]
+}
+
+def get_options(config):
+    return {**DEFAULT_OPTIONS, **config.get('artifact_store', {})}
+
+def read_csv_lines(csv_file):
+    with open(csv_file, 'r') as file:
+        lines = file.read().splitlines()
+    return lines[0], [line for line in lines[1:] if line]
+
+def replace_dir(src_dir, dst_dir):
+    """Copies src_dir to dst_dir: the copy is made under a hidden name in the destination folder and renamed.
+    An existing dst_dir (a re-run of the same images) is renamed away first and removed after."""
+    parent, name = os.path.split(dst_dir)
+    os.makedirs(parent, exist_ok=True)
+    tag = uuid.uuid4().hex[:8]
+    partial_dir = os.path.join(parent, f'.{name}.partial_{tag}')
+    old_dir = os.path.join(parent, f'.{name}.old_{tag}')
+
+    try:
+        shutil.copytree(src_dir, partial_dir)
+    except Exception:
+        shutil.rmtree(partial_dir, ignore_errors=True)
+        raise
+    if os.path.exists(dst_dir):
+        os.rename(dst_dir, old_dir)
+    os.rename(partial_dir, dst_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def is_process_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            PROCESS_QUERY_LIMITED_INFORMATION, STILL_ACTIVE = 0x1000, 259
+            handle = ctypes.windll.kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+            if not handle:
+                return False
+            try:
+                exit_code = ctypes.c_ulong()
+                ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+                return exit_code.value == STILL_ACTIVE
+            finally:
+                ctypes.windll.kernel32.CloseHandle(handle)
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+def get_owner_pid(folder_name):
+    # <pid>_<tag>, or None for other folders
+    pid, _, tag = folder_name.partition('_')
+    return int(pid) if pid.isdigit() and tag else None
+
+class ArtifactStore:
+    def __init__(self, scratch_folder=None, log_message=print, retry_delays_s=DEFAULT_OPTIONS['retry_delays_s']):
+        self.scratch_root = scratch_folder or os.path.join(tempfile.gettempdir(), 'image_qa_staging')
+        self.scratch_folder = os.path.join(self.scratch_root, f'{os.getpid()}_{uuid.uuid4().hex[:8]}')
+        self.log_message = log_message
+        self.retry_delays_s = list(retry_delays_s)
+        self.queue = queue.Queue()
+        self.attempts = {}     # stage root -> failed attempts
+        self.retrying = set()  # stage roots waiting for a retry
+        self.lock = threading.Lock()
+        self.published = 0
+        self.failed = 0
+        os.makedirs(self.scratch_folder)
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+        # cases left by stores of processes that have ended: complete ones (share not reachable) are moved to
+        # this store and published, incomplete ones (the analysis failed or the app was closed) are removed
+        for entry in sorted(os.scandir(self.scratch_root), key=lambda e: e.name):
+            pid = get_owner_pid(entry.name) if entry.is_dir() else None
+            if pid is None or is_process_alive(pid):
+                continue
+            for case in sorted(os.scandir(entry.path), key=lambda e: e.name):
+                if not os.path.exists(os.path.join(case.path, PUBLISH_FILE)):
+                    shutil.rmtree(case.path, ignore_errors=True)
+                    continue
+                stage_root = os.path.join(self.scratch_folder, case.name)
+                try:
+                    os.rename(case.path, stage_root)
+                except OSError:
+                    continue  # taken by another store starting at the same time
+                self.log_message(f'publishing a case staged earlier: {stage_root}')
+                self.queue.put(stage_root)
+            try:
+                os.rmdir(entry.path)
+            except OSError:
+                pass
+
+    def stage(self, case_dir):
+        """Returns the local folder to write the case to, instead of case_dir (the destination)."""
+        phantom_dir, name = os.path.split(os.path.normpath(case_dir))
+        stage_dir = os.path.join(self.scratch_folder, uuid.uuid4().hex, os.path.basename(phantom_dir), name)
+        os.makedirs(stage_dir)
+        return stage_dir
+
+    def publish(self, stage_dir, case_dir):
+        """Queues a complete staged case for the move to case_dir. Returns immediately."""
+        stage_root = os.path.dirname(os.path.dirname(stage_dir))
+        helper.write_json_file(os.path.join(stage_root, PUBLISH_FILE), {'case_dir': case_dir})
+        self.queue.put(stage_root)
+
+    def discard(self, stage_dir):
+        # a case that failed is not published
+        shutil.rmtree(os.path.dirname(os.path.dirname(stage_dir)), ignore_errors=True)
+
+    def flush(self, timeout=None):
+        """Waits until the queued cases are published (or failed). Returns False on timeout.
+        Cases waiting for a retry are not waited for (see pending())."""
+        if timeout is None:
+            self.queue.join()
+            return True
+
+        done = threading.Event()
+        threading.Thread(target=lambda: (self.queue.join(), done.set()), daemon=True).start()
+        return done.wait(timeout)
+
+    def pending(self):
+        with self.lock:
+            return self.queue.unfinished_tasks + len(self.retrying)
+
+    def retry(self, stage_root):
+        with self.lock:
+            self.retrying.discard(stage_root)
+            self.queue.put(stage_root)
+
+    def run(self):
+        while True:
+            stage_root = self.queue.get()
+            try:
+                self.publish_now(stage_root)
+                self.published += 1
+                self.attempts.pop(stage_root, None)
+            except Exception as e:
+                attempt = self.attempts.get(stage_root, 0)
+                self.attempts[stage_root] = attempt + 1
+                if attempt < len(self.retry_delays_s):
+                    delay = self.retry_delays_s[attempt]
+                    self.log_message(f'Error: publishing {stage_root} failed, retrying in {delay}s. {e}')
+                    with self.lock:
+                        self.retrying.add(stage_root)
+                    timer = threading.Timer(delay, self.retry, args=(stage_root,))
+                    timer.daemon = True
+                    timer.start()
+                else:
+                    self.failed += 1
+                    self.log_message(f'Error: publishing {stage_root} failed, kept for the next start. {e}')
+            finally:
+                self.queue.task_done()
+
+    def publish_now(self, stage_root):
+        case_dir = helper.read_json_file(os.path.join(stage_root, PUBLISH_FILE))['case_dir']
+        phantom_dir, name = os.path.split(os.path.normpath(case_dir))
+        stage_phantom_dir = os.path.join(stage_root, os.path.basename(phantom_dir))
+
+        replace_dir(os.path.join(stage_phantom_dir, name), case_dir)
+
+        # the results.csv lines go after the case, so a line never points to a missing case folder
+        stage_csv = os.path.join(stage_phantom_dir, 'results.csv')
+        if os.path.exists(stage_csv):
+            header, lines = read_csv_lines(stage_csv)
+            helper.append_csv_lines(os.path.join(phantom_dir, 'results.csv'), header, lines, log_message=self.log_message)
+
+        # the marker goes first: files still open (e.g. the PDF in a viewer) may keep the folder
+        os.remove(os.path.join(stage_root, PUBLISH_FILE))
+        shutil.rmtree(stage_root, ignore_errors=True)
+        self.log_message(f'published: {case_dir}')
+
+_store = None
+
+def configure(enabled=False, scratch_folder=None, log_message=print, retry_delays_s=DEFAULT_OPTIONS['retry_delays_s']):
+    global _store
+    _store = ArtifactStore(scratch_folder, log_message=log_message, retry_delays_s=retry_delays_s) if enabled else None
+    return _store
+
+def get_store():
+    return _store
@@ -0,0 +1,194 @@
+import os
+import csv
+import fnmatch
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+from utils import helper, cases
+from utils.object import flatten
+
+# Reference (commissioning) values of the metrics of a device and phantom, and the comparison of results with them.
+# A baseline file holds the numbers of one result, flattened (utils.object.flatten keys).
+# Tolerances are a list of {'pattern', 'abs', 'rel'}: the first pattern (fnmatch) that matches a key applies,
+# and the limit of the key is abs + rel * |reference|. Keys without a matching pattern are not compared.
+# A metric warns above warn_fraction of its limit and fails above the limit.
+
+PASS, WARN, FAIL, MISSING = 0, 1, 2, 3
+STATUS_NAMES = ['pass', 'warn', 'fail', 'missing']
+
+DEFAULT_OPTIONS = {
+    'enabled': False,
+    'folder': '_baselines',
+    'warn_fraction': 0.8,
+    'tolerances': [{'pattern': '*', 'rel': 0.05}],
+    'ignore': ['config_*', 'timings_*', 'baseline_*', 'warnings_*', '*passed*']  # keys that are never compared
+}
+
+def get_options(config):
+    return {**DEFAULT_OPTIONS, **config.get('baseline', {})}
+
+def get_baseline_file(folder, site, device, phantom):
+    return os.path.join(folder, f'{cases.phantom_folder_name(site, device, phantom)}.json')
+
+def get_numbers(result):
+    return {item['key']: float(item['value']) for item in flatten(result)
+            if isinstance(item['value'], (int, float)) and not isinstance(item['value'], bool)}
+
+def save_baseline(baseline_file, result, source=None):
+    baseline = {'created': datetime.now().isoformat(), 'source': source, 'metrics': get_numbers(result)}
+    os.makedirs(os.path.dirname(baseline_file) or '.', exist_ok=True)
+    helper.write_json_file(baseline_file, baseline, indent=4)
+    return baseline
+
+def load_baseline(baseline_file):
+    if not os.path.exists(baseline_file):
+        return None
+    return helper.read_json_file(baseline_file)
+
+class Comparator:
+    """The reference values and limits of a baseline as arrays, to compare many results at once."""
+    def __init__(self, baseline, tolerances, warn_fraction=0.8, ignore=()):
+        keys, references, limits = [], [], []
+        for key, reference in baseline['metrics'].items():
+            if any(fnmatch.fnmatch(key, pattern) for pattern in ignore):
+                continue
+            tolerance = next((t for t in tolerances if fnmatch.fnmatch(key, t['pattern'])), None)
+            if tolerance is None:
+                continue
+            keys.append(key)
+            references.append(reference)
+            limits.append((tolerance.get('abs') or 0.0) + (tolerance.get('rel') or 0.0) * abs(reference))
+
+        self.keys = keys
+        self.index = {key: i for i, key in enumerate(keys)}
+        self.references = np.array(references, dtype=np.float64)
+        self.limits = np.array(limits, dtype=np.float64)
+        self.warn_fraction = warn_fraction
+
+    def to_matrix(self, results):
+        """Metric values of the results (one row per result, NaN if missing) in the order of the keys."""
+        matrix = np.full((len(results), len(self.keys)), np.nan)
+        for row, result in enumerate(results):
+            for item in flatten(result):
+                column = self.index.get(item['key'])
+                if column is not None and isinstance(item['value'], (int, float)) and not isinstance(item['value'], bool):
+                    matrix[row, column] = item['value']
+        return matrix
+
+    def compare_matrix(self, matrix):
+        """Status (PASS, WARN, FAIL, MISSING) and deviation of each value."""
+        deviations = np.abs(matrix - self.references)
+        status = np.full(matrix.shape, PASS, dtype=np.int8)
+        status[deviations > self.warn_fraction * self.limits] = WARN
+        status[deviations > self.limits] = FAIL
+        status[np.isnan(matrix)] = MISSING
+        return status, deviations
+
+    def compare(self, results, max_keys=20):
+        """Summaries of the comparison of the results: overall status, counts and the failed and warned keys."""
+        status, deviations = self.compare_matrix(self.to_matrix(results))
+        counts = np.stack([(status == s).sum(axis=1) for s in range(len(STATUS_NAMES))], axis=1)
+
+        summaries = []
+        for row in range(len(results)):
+            overall = FAIL if counts[row, FAIL] else WARN if counts[row, WARN] else PASS if counts[row, PASS] else MISSING
+            summaries.append({
+                'status': STATUS_NAMES[overall],
+                'counts': {name: int(counts[row, s]) for s, name in enumerate(STATUS_NAMES)},
+                'failed': [self.describe(c, deviations[row, c]) for c in np.flatnonzero(status[row] == FAIL)[:max_keys]],
+                'warned': [self.describe(c, deviations[row, c]) for c in np.flatnonzero(status[row] == WARN)[:max_keys]]
+            })
+        return summaries
+
+    def describe(self, column, deviation):
+        return {'key': self.keys[column], 'reference': float(self.references[column]),
+                'deviation': round(float(deviation), 6), 'limit': round(float(self.limits[column]), 6)}
+
+def format_summary(summary):
+    counts = summary['counts']
+    lines = [f"Baseline: {summary['status'].upper()} ({counts['pass']} pass, {counts['warn']} warn, {counts['fail']} fail, "
+             f"{counts['missing']} missing)"]
+    for name in ('failed', 'warned'):
+        for item in summary[name]:
+            lines.append(f"  {name} {item['key']}: {item['reference']:g} +- {item['limit']:g}, deviation {item['deviation']:g}")
+    return '\n'.join(lines)
+
+def compare_result(result, site, device, phantom, config, log_message=print):
+    """Compares one result with the baseline of the device. Returns the summary, or None without a baseline."""
+    options = get_options(config)
+    if not options['enabled']:
+        return None
+
+    baseline_file = get_baseline_file(options['folder'], site, device, phantom)
+    baseline = load_baseline(baseline_file)
+    if baseline is None:
+        log_message(f'No baseline for {site}|{device}|{phantom} ({baseline_file}).')
+        return None
+
+    summary = Comparator(baseline, options['tolerances'], options['warn_fraction'], options['ignore']).compare([result])[0]
+    summary['baseline'] = {'created': baseline['created'], 'source': baseline.get('source')}
+    log_message(format_summary(summary))
+    return summary
+
+def main():
+    import analysis_runner
+
+    parser = argparse.ArgumentParser(description='Set the baseline of a device and phantom, or compare archived cases with it.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    set_parser = subparsers.add_parser('set', help='make the result of a case folder the baseline')
+    set_parser.add_argument('case_dir')
+    compare_parser = subparsers.add_parser('compare', help='compare the archived cases with their baseline')
+    compare_parser.add_argument('--output-folder', help='case folder root (default: output_folder in the config)')
+    compare_parser.add_argument('--site')
+    compare_parser.add_argument('--device')
+    compare_parser.add_argument('--phantom')
+    compare_parser.add_argument('--report', default='baseline_report.csv', help='CSV file of the case summaries')
+    parser.add_argument('--config', default='config.json', help='app config file')
+    args = parser.parse_args()
+
+    if args.command == 'set':
+        case_dir = os.path.normpath(args.case_dir)
+        site, device, phantom = os.path.basename(os.path.dirname(case_dir)).split('_')
+        options = get_options(analysis_runner.load_phantom_config(site, device, phantom))
+        baseline_file = get_baseline_file(options['folder'], site, device, phantom)
+        result = cases.read_case_result(case_dir)
+        if result is None:
+            raise Exception(f'No result.json in {case_dir}')
+        baseline = save_baseline(baseline_file, result, source=case_dir)
+        print(f"baseline saved: {baseline_file} ({len(baseline['metrics'])} metrics)")
+        return
+
+    config = helper.read_json_file(args.config)
+    case_list = cases.find_case_folders(args.output_folder or config['output_folder'], site=args.site, device=args.device,
+                                        phantom=args.phantom)
+
+    # one comparison per device and phantom for all its cases
+    groups = {}
+    for case in case_list:
+        groups.setdefault((case['site'], case['device'], case['phantom']), []).append(case)
+
+    rows = []
+    for (site, device, phantom), group in groups.items():
+        options = get_options(analysis_runner.load_phantom_config(site, device, phantom))
+        baseline = load_baseline(get_baseline_file(options['folder'], site, device, phantom))
+        if baseline is None:
+            print(f'no baseline for {site}|{device}|{phantom}, {len(group)} cases skipped')
+            continue
+
+        results = [cases.read_case_result(case['case_dir']) or {} for case in group]
+        summaries = Comparator(baseline, options['tolerances'], options['warn_fraction'], options['ignore']).compare(results)
+        for case, summary in zip(group, summaries):
+            rows.append({'case_dir': case['case_dir'], 'site': site, 'device': device, 'phantom': phantom,
+                         'status': summary['status'], **summary['counts'],
+                         'failed': ' '.join(item['key'] for item in summary['failed'])})
+
+    with open(args.report, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=['case_dir', 'site', 'device', 'phantom', 'status', *STATUS_NAMES, 'failed'])
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f'{len(rows)} cases compared, report saved: {args.report}')
+
+if __name__ == '__main__':
+    main()
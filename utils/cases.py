@@ -0,0 +1,93 @@
+import os
+import json
+from datetime import datetime
+
+# Case folders are stored as output_folder/<site>_<device>_<phantom>/<yyyyMMdd_HHmmss>/
+CASE_DATETIME_FORMAT = '%Y%m%d_%H%M%S'
+
+def phantom_folder_name(site, device, phantom):
+    return f'{site.lower()}_{device.lower()}_{phantom.lower()}'
+
+def parse_case_datetime(case_dir):
+    # The case folder name is the image date time (yyyyMMdd_HHmmss)
+    try:
+        return datetime.strptime(os.path.basename(os.path.normpath(case_dir)), CASE_DATETIME_FORMAT)
+    except ValueError:
+        return None
+
+def find_case_folders(output_folder, site=None, device=None, phantom=None, start=None, end=None):
+    """Returns the case folders under output_folder, sorted by phantom folder and case date time.
+
+    site, device and phantom filter the phantom folders (case-insensitive).
+    start and end (datetime) filter the cases by the date time in the case folder name.
+    """
+    cases = []
+
+    if not os.path.exists(output_folder):
+        raise Exception(f"The output folder not found. {output_folder}")
+
+    with os.scandir(output_folder) as phantom_entries:
+        phantom_dirs = sorted(entry.path for entry in phantom_entries if entry.is_dir())
+
+    for phantom_dir in phantom_dirs:
+        parts = os.path.basename(phantom_dir).split('_')
+        if len(parts) != 3:
+            continue
+
+        site_id, device_id, phantom_id = parts
+        if site and site.lower() != site_id:
+            continue
+        if device and device.lower() != device_id:
+            continue
+        if phantom and phantom.lower() != phantom_id:
+            continue
+
+        with os.scandir(phantom_dir) as case_entries:
+            case_dirs = sorted(entry.path for entry in case_entries if entry.is_dir())
+
+        for case_dir in case_dirs:
+            dt = parse_case_datetime(case_dir)
+            if dt is None:
+                continue
+            if start and dt < start:
+                continue
+            if end and dt > end:
+                continue
+
+            cases.append({
+                'case_dir': case_dir,
+                'site': site_id,
+                'device': device_id,
+                'phantom': phantom_id,
+                'datetime': dt
+            })
+
+    return cases
+
+def get_case_input_files(case_dir):
+    # input.dcm for 2D phantoms, input_000.dcm, input_001.dcm... for 3D phantoms
+    # (input_resampled.dcm is written by phantoms.resample and is not an input)
+    files = [f for f in os.listdir(case_dir) if f.startswith('input') and f.endswith('.dcm') and f != 'input_resampled.dcm']
+    return [os.path.join(case_dir, f) for f in sorted(files)]
+
+def read_case_result(case_dir):
+    result_json = os.path.join(case_dir, 'result.json')
+
+    if not os.path.exists(result_json):
+        return None
+
+    with open(result_json, 'r') as json_file:
+        return json.load(json_file)
+
+def get_case_datetime(case_dir, log_message=print):
+    # acquisition time from the header of the stored input image, or the case folder name
+    import dicom_helper
+
+    input_files = get_case_input_files(case_dir)
+    if len(input_files) > 0:
+        try:
+            return dicom_helper.get_image_datetime(input_files[0])
+        except Exception as e:
+            log_message(f'{e} Using the case folder name.')
+
+    return parse_case_datetime(case_dir)
@@ -0,0 +1,29 @@
+import os
+
+class Checkpoint:
+    """A file of completed item keys, one per line, so that an interrupted job can resume.
+
+    Lines are appended and flushed as items complete, so a crash loses at most the item in progress.
+    """
+    def __init__(self, checkpoint_file):
+        self.checkpoint_file = checkpoint_file
+        self.done = set()
+
+        if os.path.exists(checkpoint_file):
+            with open(checkpoint_file, 'r') as file:
+                self.done = set(line.strip() for line in file if line.strip())
+
+    def is_done(self, key):
+        return key in self.done
+
+    def mark_done(self, key):
+        if key in self.done:
+            return
+
+        self.done.add(key)
+        with open(self.checkpoint_file, 'a') as file:
+            file.write(f'{key}\n')
+            file.flush()
+
+    def __len__(self):
+        return len(self.done)
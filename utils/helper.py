@@ -1,4 +1,6 @@
 from datetime import datetime, date
+from enum import Enum
+import dataclasses
 import json
 import sys
 import os
@@ -50,6 +52,57 @@ def obj_serializer(obj):
     else:
         return str(obj)  # Convert anything else to a string
 
+def to_serializable(obj, array_hook=None, _path=(), _active=None):
+    """Converts an object into JSON-compatible dicts, lists and scalars in one pass.
+
+    Handles dataclasses, objects with __dict__, NumPy scalars and arrays (kept as numbers)
+    and datetimes. Anything else is converted to a string, as obj_serializer() does.
+    array_hook(path, array) may return a replacement for a NumPy array (e.g. a sidecar reference),
+    or None to keep the array inline.
+    """
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return str(obj)
+    # NumPy arrays and scalars (np.float32, np.int64, np.bool_...)
+    if hasattr(obj, 'dtype') and hasattr(obj, 'tolist'):
+        if array_hook is not None and getattr(obj, 'ndim', 0) > 0:
+            ref = array_hook(_path, obj)
+            if ref is not None:
+                return ref
+        value = obj.tolist()
+        return value if not isinstance(value, bytes) else str(obj)
+
+    # guard against reference cycles in object graphs
+    if _active is None:
+        _active = set()
+    if id(obj) in _active:
+        return str(obj)
+    _active.add(id(obj))
+
+    try:
+        if isinstance(obj, dict):
+            return {str(key): to_serializable(value, array_hook, _path + (key,), _active) for key, value in obj.items()}
+        if isinstance(obj, (list, tuple, set, frozenset)):
+            return [to_serializable(value, array_hook, _path + (i,), _active) for i, value in enumerate(obj)]
+        if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+            return {field.name: to_serializable(getattr(obj, field.name), array_hook, _path + (field.name,), _active) for field in dataclasses.fields(obj)}
+        if hasattr(obj, '__dict__'):
+            return {str(key): to_serializable(value, array_hook, _path + (key,), _active) for key, value in vars(obj).items()}
+        return str(obj)
+    finally:
+        _active.discard(id(obj))
+
+def write_json_file(json_file_path, data, indent=None):
+    # compact separators when indentation is not needed
+    with open(json_file_path, 'w') as json_file:
+        if indent is None:
+            json.dump(data, json_file, separators=(',', ':'))
+        else:
+            json.dump(data, json_file, indent=indent)
+
 def read_json_file(json_file_path):
     # Open and read the JSON file
     with open(json_file_path, "r") as json_file:
@@ -75,4 +128,24 @@ def zip_folder(folder_path, filename_prefix, output_folder_path):
     return zip_filepath
 
 def datetime_to_string_yyyymmdd_hhmmss(dt):
-    return dt.strftime('%Y%m%d_%H%M%S')
\ No newline at end of file
+    return dt.strftime('%Y%m%d_%H%M%S')
+
+def append_csv_lines(csv_file, header, lines, log_message=print):
+    # the columns changed (e.g. a pylinac upgrade), keep the old file and start a new one
+    if os.path.exists(csv_file):
+        with open(csv_file, 'r') as file:
+            existing_header = file.readline().rstrip('\n')
+
+        if existing_header != header:
+            root, ext = os.path.splitext(csv_file)
+            old_csv_file = f"{root}_{datetime_to_string_yyyymmdd_hhmmss(datetime.now())}{ext}"
+            log_message(f'csv header changed. moving the old csv file to {old_csv_file}')
+            os.rename(csv_file, old_csv_file)
+
+    if not os.path.exists(csv_file):
+        log_message('csv file not found. creating and adding the header...')
+        with open(csv_file, 'w') as file:
+            file.write(f'{header}\n')
+
+    with open(csv_file, 'a') as file:
+        file.writelines(f'{line}\n' for line in lines)
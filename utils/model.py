@@ -1,16 +1,19 @@
 from datetime import datetime
 
 # Convert the key-value pairs into Number1D objects
-def convert_kvps_to_number1d_or_stirng1d_list(key_value_pairs, key_prefix, device_id, app):
+# `time` is the acquisition time of the result. Defaults to now.
+def convert_kvps_to_number1d_or_stirng1d_list(key_value_pairs, key_prefix, device_id, app, time=None):
     ret = []
-    current_time = datetime.now().isoformat()  # Current time for the `time` field
+    if time is None:
+        time = datetime.now()
+    current_time = time.isoformat() if isinstance(time, datetime) else time
 
     for pair in key_value_pairs:
         obj = {
             'device_id': device_id,
-            'series_id': f'{key_prefix}{pair['key']}',   # Map key to series_id
+            'series_id': f'{key_prefix}{pair["key"]}',   # Map key to series_id
             'value': pair['value'],     # Map value to value
-            'time': current_time,       # Set time to current time
+            'time': current_time,       # Set time to the acquisition time
             'notes': '',                # Empty notes field
             'by': '',                   # Empty 'by' field
             'app': app  # App name and version
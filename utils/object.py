@@ -1,54 +1,58 @@
 import json
 import re
+from functools import lru_cache
 
-def python_compatible_key(key):
-    # Replace non-alphanumeric characters and spaces with underscores
-    return re.sub(r'[^a-zA-Z0-9_]', '_', key)
+_non_key_chars = re.compile(r'[^a-zA-Z0-9_]')
 
-def traverse_and_collect_numbers(obj, parent_key='', result=None):
-    if result is None:
-        result = []
+# dicts with this key reference an array stored outside result.json (see utils.sidecar)
+ARRAY_REF_KEY = '__array__'
 
-    for key, value in obj.items():
-        full_key = f"{parent_key}_{key}" if parent_key else key
-        full_key = python_compatible_key(full_key)
+@lru_cache(maxsize=4096)
+def python_compatible_key(key):
+    # Replace non-alphanumeric characters and spaces with underscores
+    return _non_key_chars.sub('_', str(key))
 
-        if isinstance(value, (int, float)):  # Check if the value is a number
-            result.append({'key': full_key, 'value': value})
-        elif isinstance(value, dict):  # Recursively traverse dictionaries
-            traverse_and_collect_numbers(value, full_key, result)
+def flatten(obj):
+    """Flattens a result object into a list of {'key', 'value'} pairs sorted by key.
 
-    return  sorted(result, key=lambda x: x['key'])
+    Numbers and strings are collected in a single pass over the tree. Nested keys are joined with '_'
+    and list elements are indexed (e.g. mtf_lp_mm_0, mtf_lp_mm_1, ...).
+    The walk is iterative, so deeply nested results do not hit the recursion limit.
+    References to sidecar arrays are skipped.
+    """
+    result = []
+    stack = [('', obj)]
 
-def traverse_and_collect_strings(obj, parent_key='', result=None):
-    if result is None:
-        result = []
+    while stack:
+        parent_key, value = stack.pop()
 
-    for key, value in obj.items():
-        full_key = f"{parent_key}_{key}" if parent_key else key
-        full_key = python_compatible_key(full_key)
+        if isinstance(value, dict):
+            items = value.items()
+        else:
+            items = enumerate(value)
 
-        if isinstance(value, str):  # Check if the value is a string
-            result.append({'key': full_key, 'value': value})
-        elif isinstance(value, dict):  # Recursively traverse dictionaries
-            traverse_and_collect_strings(value, full_key, result)
+        for key, child in items:
+            # the parent key is already sanitized, so only the new part is
+            full_key = f"{parent_key}_{python_compatible_key(key)}" if parent_key else python_compatible_key(key)
 
-    return  sorted(result, key=lambda x: x['key'])
+            if isinstance(child, (int, float, str)):
+                result.append({'key': full_key, 'value': child})
+            elif isinstance(child, dict) and ARRAY_REF_KEY in child:
+                continue
+            elif isinstance(child, (dict, list, tuple)):
+                stack.append((full_key, child))
 
-def traverse_and_collect_numbers_strings(obj, parent_key='', result=None):
-    if result is None:
-        result = []
+    result.sort(key=lambda x: x['key'])
+    return result
 
-    for key, value in obj.items():
-        full_key = f"{parent_key}_{key}" if parent_key else key
-        full_key = python_compatible_key(full_key)
+def traverse_and_collect_numbers(obj):
+    return [item for item in flatten(obj) if not isinstance(item['value'], str)]
 
-        if isinstance(value, (int, float, str)):  # Check if the value is a number
-            result.append({'key': full_key, 'value': value})
-        elif isinstance(value, dict):  # Recursively traverse dictionaries
-            traverse_and_collect_numbers_strings(value, full_key, result)
+def traverse_and_collect_strings(obj):
+    return [item for item in flatten(obj) if isinstance(item['value'], str)]
 
-    return  sorted(result, key=lambda x: x['key'])
+def traverse_and_collect_numbers_strings(obj):
+    return flatten(obj)
 
 
 if __name__ == '__main__':
@@ -65,13 +69,14 @@ if __name__ == '__main__':
                     "value-1": 42.0,
                     "value 2": 19.5,
                     "Value!": 37
-                }
+                },
+                "mtf": [0.9, 0.5, 0.1]
             }
         }
     }
 
     # Traverse the result.json and collect the key-value pairs
-    key_value_pairs = traverse_and_collect(result_json)
+    key_value_pairs = flatten(result_json)
 
     # Print the result
     for pair in key_value_pairs:
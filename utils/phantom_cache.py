@@ -0,0 +1,70 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+# In-process LRU cache of loaded and analyzed pylinac phantoms, bounded by a memory budget.
+# It is off until configure() is called (by the GUI), so services and workers do not keep phantoms.
+
+class LRUCache:
+    """LRU cache of values with a known size in bytes. The least recently used values are evicted
+    when the total size exceeds max_bytes. A value larger than max_bytes is not cached."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            if size > self.max_bytes:
+                return False
+
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+            return True
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+_cache = None
+
+def configure(max_mb=1024, enabled=True):
+    global _cache
+    _cache = LRUCache(int(max_mb * 1024 * 1024)) if enabled else None
+    return _cache
+
+def get_cache():
+    return _cache
+
+def hash_files(files):
+    """Content hash of the files (sorted by name), the cache key of an input."""
+    h = hashlib.blake2b(digest_size=16)
+    for file in sorted(files):
+        h.update(os.path.basename(file).encode('utf-8'))
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+    return h.hexdigest()
@@ -0,0 +1,80 @@
+import os
+import io
+import json
+import pstats
+import cProfile
+import tracemalloc
+
+from utils import timing
+
+class Profiler:
+    """cProfile (and optionally tracemalloc) around one analysis run.
+
+    cProfile only sees the thread that calls start(), so start and stop it in the analysis thread.
+    """
+    def __init__(self, trace_malloc=False, top=50):
+        self.trace_malloc = trace_malloc
+        self.top = top
+        self.profile = cProfile.Profile()
+        self.snapshot = None
+        self.peak_traced_mb = None
+
+    def start(self):
+        if self.trace_malloc:
+            tracemalloc.start(25)
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        if self.trace_malloc and tracemalloc.is_tracing():
+            self.snapshot = tracemalloc.take_snapshot()
+            self.peak_traced_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+
+    def save(self, output_dir, recorder=None, log_message=print):
+        """Writes profile.prof, profile.txt, tracemalloc.txt and trace.json to output_dir."""
+        prof_file = os.path.join(output_dir, 'profile.prof')
+        log_message(f'Saving profile: {prof_file}')
+        self.profile.dump_stats(prof_file)
+
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(self.top)
+        stats.sort_stats('tottime').print_stats(self.top)
+        with open(os.path.join(output_dir, 'profile.txt'), 'w') as file:
+            file.write(stream.getvalue())
+
+        if self.snapshot is not None:
+            tracemalloc_file = os.path.join(output_dir, 'tracemalloc.txt')
+            log_message(f'Saving top allocations: {tracemalloc_file}')
+            snapshot = self.snapshot.filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ))
+            with open(tracemalloc_file, 'w') as file:
+                file.write(f'peak traced memory: {self.peak_traced_mb:.1f} MB\n\n')
+                file.write(f'top {self.top} allocations by line:\n')
+                for stat in snapshot.statistics('lineno')[:self.top]:
+                    file.write(f'{stat}\n')
+                file.write(f'\ntop {self.top} allocations by traceback:\n')
+                for stat in snapshot.statistics('traceback')[:self.top]:
+                    file.write(f'{stat}\n')
+                    for line in stat.traceback.format(limit=10):
+                        file.write(f'    {line}\n')
+
+        if recorder is not None:
+            trace_file = os.path.join(output_dir, 'trace.json')
+            log_message(f'Saving chrome trace: {trace_file}')
+            with open(trace_file, 'w') as file:
+                json.dump(timing.to_chrome_trace(recorder), file)
+
+def get_profiling_options(config, enabled=None, trace_malloc=None):
+    # "profiling" in config.json, overridden by the command line flags
+    options = {'enabled': False, 'tracemalloc': False, 'top': 50}
+    options.update(config.get('profiling', {}))
+    if enabled:
+        options['enabled'] = True
+    if trace_malloc:
+        options['enabled'] = True
+        options['tracemalloc'] = True
+    return options
@@ -0,0 +1,84 @@
+import os
+import shutil
+import numpy as np
+
+from utils.object import ARRAY_REF_KEY, python_compatible_key
+
+# Large arrays of a result are stored next to result.json as result_arrays/<key>.npy
+# and referenced from the JSON summary as {"__array__": "<key>", "shape": [...], "dtype": "..."}.
+# .npy (not .npz) is used so that readers can memory-map the arrays.
+ARRAYS_DIRNAME = 'result_arrays'
+
+def get_arrays_dir(result_dir):
+    return os.path.join(result_dir, ARRAYS_DIRNAME)
+
+class ArrayWriter:
+    """Array hook for utils.helper.to_serializable() that moves large arrays to the sidecar folder.
+
+    Arrays with fewer than min_size elements stay inline in the JSON summary.
+    """
+    def __init__(self, min_size=1000):
+        self.min_size = min_size
+        self.arrays = {}
+
+    def __call__(self, path, array):
+        if array.size < self.min_size:
+            return None
+
+        key = python_compatible_key('_'.join(str(p) for p in path)) or 'array'
+        # keys collide only if two paths sanitize to the same string
+        unique_key = key
+        n = 1
+        while unique_key in self.arrays:
+            unique_key = f'{key}_{n}'
+            n += 1
+
+        self.arrays[unique_key] = array
+        return {ARRAY_REF_KEY: unique_key, 'shape': list(array.shape), 'dtype': str(array.dtype)}
+
+    def save(self, result_dir, log_message=print):
+        arrays_dir = get_arrays_dir(result_dir)
+
+        # arrays of a previous run in the same folder are stale
+        if os.path.exists(arrays_dir):
+            shutil.rmtree(arrays_dir)
+
+        if len(self.arrays) == 0:
+            return
+
+        os.makedirs(arrays_dir)
+        log_message(f'Saving {len(self.arrays)} result arrays: {arrays_dir}')
+        for key, array in self.arrays.items():
+            np.save(os.path.join(arrays_dir, f'{key}.npy'), np.ascontiguousarray(array), allow_pickle=False)
+
+class ResultArrays:
+    """Lazy, read-only access to the sidecar arrays of a result folder.
+
+    Arrays are memory-mapped on first access, so reading the summary never touches the array data.
+    """
+    def __init__(self, result_dir):
+        self.arrays_dir = get_arrays_dir(result_dir)
+        self._loaded = {}
+
+    def keys(self):
+        if not os.path.exists(self.arrays_dir):
+            return []
+        return sorted(os.path.splitext(f)[0] for f in os.listdir(self.arrays_dir) if f.endswith('.npy'))
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self.arrays_dir, f'{key}.npy'))
+
+    def __getitem__(self, key):
+        if key not in self._loaded:
+            file = os.path.join(self.arrays_dir, f'{key}.npy')
+            if not os.path.exists(file):
+                raise KeyError(key)
+            self._loaded[key] = np.load(file, mmap_mode='r', allow_pickle=False)
+        return self._loaded[key]
+
+    def resolve(self, ref):
+        # ref is a {"__array__": key, ...} dict from the JSON summary
+        return self[ref[ARRAY_REF_KEY]]
+
+def is_array_ref(value):
+    return isinstance(value, dict) and ARRAY_REF_KEY in value
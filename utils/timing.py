@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+
+# The active recorder is per thread, so the analysis thread and a push thread record separately.
+_local = threading.local()
+
+def get_windows_memory_counters():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD),
+                    ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t),
+                    ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t),
+                    ('PeakPagefileUsage', ctypes.c_size_t)]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(PROCESS_MEMORY_COUNTERS)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None
+    return counters
+
+def get_peak_rss_mb():
+    """Returns the peak resident set size of this process (the high-water mark since it started) in MB,
+    or None if not available."""
+    try:
+        if sys.platform == 'win32':
+            counters = get_windows_memory_counters()
+            return counters.PeakWorkingSetSize / (1024 * 1024) if counters else None
+        else:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # KB on Linux, bytes on macOS
+            return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except Exception:
+        return None
+
+def get_rss_mb():
+    """Returns the current resident set size of this process in MB, or None if not available (macOS)."""
+    try:
+        if sys.platform == 'win32':
+            counters = get_windows_memory_counters()
+            return counters.WorkingSetSize / (1024 * 1024) if counters else None
+        with open('/proc/self/statm') as file:
+            resident_pages = int(file.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except Exception:
+        return None
+
+class TimingRecorder:
+    """Collects the spans (stages) of one run.
+
+    Each span records wall time, process CPU time, the process RSS at the end of the span (rss_mb) and its
+    change over the span (rss_delta_mb). The process peak RSS (peak_rss_mb) is recorded once per run: it is
+    the high-water mark since the process started, so it does not tell the stages apart.
+    """
+    def __init__(self):
+        self.spans = []
+        self.start_time = datetime.now()
+        self.t0 = time.perf_counter()
+        self.depth = 0
+
+    def total_s(self):
+        return time.perf_counter() - self.t0
+
+    def to_dict(self):
+        # spans of the same name (e.g. save_subimage) are summed
+        stages = {}
+        for s in self.spans:
+            stage = stages.setdefault(s['name'], {'wall_s': 0.0, 'cpu_s': 0.0, 'count': 0, 'rss_mb': None, 'rss_delta_mb': None})
+            stage['wall_s'] += s['wall_s']
+            stage['cpu_s'] += s['cpu_s']
+            stage['count'] += 1
+            if s['rss_mb'] is not None:
+                stage['rss_mb'] = max(stage['rss_mb'] or 0.0, s['rss_mb'])
+            if s['rss_delta_mb'] is not None:
+                stage['rss_delta_mb'] = (stage['rss_delta_mb'] or 0.0) + s['rss_delta_mb']
+
+        for stage in stages.values():
+            stage['wall_s'] = round(stage['wall_s'], 4)
+            stage['cpu_s'] = round(stage['cpu_s'], 4)
+            for key in ('rss_mb', 'rss_delta_mb'):
+                if stage[key] is not None:
+                    stage[key] = round(stage[key], 1)
+
+        peak_rss_mb = get_peak_rss_mb()
+        return {
+            'start_time': self.start_time.isoformat(),
+            'total_s': round(self.total_s(), 4),
+            'peak_rss_mb': round(peak_rss_mb, 1) if peak_rss_mb is not None else None,
+            'stages': stages
+        }
+
+def get_recorder():
+    return getattr(_local, 'recorder', None)
+
+@contextmanager
+def record(recorder=None):
+    """Makes a recorder active for spans in the current thread."""
+    if recorder is None:
+        recorder = TimingRecorder()
+
+    previous = get_recorder()
+    _local.recorder = recorder
+    try:
+        yield recorder
+    finally:
+        _local.recorder = previous
+
+@contextmanager
+def span(name):
+    """Times a stage. Does nothing when no recorder is active in this thread."""
+    recorder = get_recorder()
+    if recorder is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    rss_start = get_rss_mb()
+    recorder.depth += 1
+    try:
+        yield
+    finally:
+        recorder.depth -= 1
+        end = time.perf_counter()
+        rss = get_rss_mb()
+        recorder.spans.append({
+            'name': name,
+            'start_s': start - recorder.t0,
+            'wall_s': end - start,
+            'cpu_s': time.process_time() - cpu_start,
+            'rss_mb': rss,
+            'rss_delta_mb': rss - rss_start if rss is not None and rss_start is not None else None,
+            'depth': recorder.depth,
+            'thread_id': threading.get_ident()
+        })
+
+def timed(name):
+    """Decorator form of span()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def append_timings(metrics_dir, entry):
+    # one JSON line per run, one file per month
+    if not os.path.exists(metrics_dir):
+        os.makedirs(metrics_dir)
+
+    metrics_file = os.path.join(metrics_dir, f"timings_{datetime.now().strftime('%Y%m')}.jsonl")
+    with open(metrics_file, 'a') as file:
+        file.write(json.dumps(entry) + '\n')
+
+    return metrics_file
+
+def to_chrome_trace(recorder):
+    """Converts the spans to Chrome trace-event JSON (chrome://tracing, Perfetto)."""
+    pid = os.getpid()
+    events = [{
+        'name': s['name'],
+        'ph': 'X',
+        'ts': round(s['start_s'] * 1e6),
+        'dur': round(s['wall_s'] * 1e6),
+        'pid': pid,
+        'tid': s['thread_id'],
+        'args': {'cpu_s': round(s['cpu_s'], 4), 'rss_mb': s['rss_mb'], 'rss_delta_mb': s['rss_delta_mb']}
+    } for s in recorder.spans]
+
+    return {
+        'traceEvents': events,
+        'displayTimeUnit': 'ms',
+        'otherData': {'start_time': recorder.start_time.isoformat()}
+    }
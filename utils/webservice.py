@@ -3,8 +3,10 @@ import requests
 import os
 from utils.helper import zip_folder
 from utils.model import convert_kvps_to_number1d_or_stirng1d_list
+from utils import timing
 from utils.object import traverse_and_collect_numbers, traverse_and_collect_strings
 
+@timing.timed('post')
 def post(obj, url):
     # POST the result.json to the API
     headers = {'Content-Type': 'application/json'}
@@ -19,6 +21,7 @@ def post(obj, url):
     else:
         raise Exception(f"Failed to send record: {response.status_code} - {response.text}")
 
+@timing.timed('upload')
 def upload_zip_file(filepath, url):
 
     # Open the zip file in binary mode
@@ -36,6 +39,7 @@ def upload_zip_file(filepath, url):
         else:
             raise Exception(f"Failed to upload file: {response.status_code} - {response.text}")
         
+@timing.timed('post_analysis_result')
 def post_analysis_result(result_folder, config, url, log_message):
     
     temp_folder = config['temp_folder']
@@ -45,7 +49,8 @@ def post_analysis_result(result_folder, config, url, log_message):
     
     # Zip the input folder
     log_message(f"Zipping input folder: {result_folder}")
-    zip_filepath = zip_folder(result_folder, f'catphan_', temp_folder)
+    with timing.span('zip'):
+        zip_filepath = zip_folder(result_folder, f'catphan_', temp_folder)
     log_message(f"Result folder zipped at: {zip_filepath}")
     
     # Get the upload URL from config
@@ -89,7 +94,7 @@ def post_analysis_result(result_folder, config, url, log_message):
 
     return result_data
 
-def post_result_as_number1ds(result_data, app, site_id, device_id, phantom_id, url, log):
+def post_result_as_number1ds(result_data, app, site_id, device_id, phantom_id, url, log, time=None):
     # travese the result object and collect numbers
     log('collecting numbers from the result file...')
     kvps = traverse_and_collect_numbers(result_data)
@@ -99,7 +104,8 @@ def post_result_as_number1ds(result_data, app, site_id, device_id, phantom_id, u
     number1ds = convert_kvps_to_number1d_or_stirng1d_list(key_value_pairs=kvps, 
                                                             key_prefix=f'{phantom_id.lower()}_',
                                                             device_id=f'{site_id}|{device_id}', 
-                                                            app=app)
+                                                            app=app,
+                                                            time=time)
 
     log(f'posting the number1d array to the server... url={url}')
     res = post(number1ds, url=url)
@@ -109,7 +115,7 @@ def post_result_as_number1ds(result_data, app, site_id, device_id, phantom_id, u
     else:
         raise Exception("Post failed!")
     
-def post_result_as_string1ds(result_data, app, site_id, device_id, phantom_id, url, log):
+def post_result_as_string1ds(result_data, app, site_id, device_id, phantom_id, url, log, time=None):
     # travese the result object and collect numbers
     log('collecting strings from the result file...')
     kvps = traverse_and_collect_strings(result_data)
@@ -119,7 +125,8 @@ def post_result_as_string1ds(result_data, app, site_id, device_id, phantom_id, u
     string1ds = convert_kvps_to_number1d_or_stirng1d_list(key_value_pairs=kvps, 
                                                             key_prefix=f'{phantom_id.lower()}_',
                                                             device_id=f'{site_id}|{device_id}', 
-                                                            app=app)
+                                                            app=app,
+                                                            time=time)
 
     log(f'posting the string1d array to the server... url={url}')
     res = post(string1ds, url=url)
@@ -0,0 +1,311 @@
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from utils import helper
+from utils.checkpoint import Checkpoint
+import phantoms.classifier
+import analysis_runner
+
+from app_logger import logger, logs_dir
+
+APP_VERSION = '0.1.1'
+
+class Watcher:
+    """Polls export folders and analyzes new QC images on a pool of warm worker processes.
+
+    Polling (not file system events) is used so that network shares work.
+    A file is settled when its size and modification time did not change for settle_time_s.
+    Settled files are classified (phantoms.classifier), 2D images become one case each and CT slices
+    are grouped by series. A series is queued once no file in its folder is still changing.
+
+    watch_folders is a list of {'path', 'site', 'device', 'phantom', 'recursive'}. site, device and
+    phantom are optional and override the classifier.
+    Analyzed files are recorded in the checkpoint, so a restart does not repeat them. Skipped files (phantom
+    or device not recognized) are not: they are tried again when they change or after a restart, e.g. once
+    the config is fixed. A failed case is queued again on the next poll, up to max_attempts times; then its
+    files are left like skipped files.
+    """
+    def __init__(self, watch_folders, output_folder, app_config, checkpoint, settle_time_s=30, max_workers=2,
+                 min_confidence=0.6, performed_by='watcher', metrics_dir=None, max_attempts=3, executor=None,
+                 run_job=analysis_runner.run_job, log_message=print):
+        self.watch_folders = watch_folders
+        self.output_folder = output_folder
+        self.app_config = app_config
+        self.checkpoint = checkpoint
+        self.settle_time_s = settle_time_s
+        self.min_confidence = min_confidence
+        self.performed_by = performed_by
+        self.metrics_dir = metrics_dir
+        self.max_attempts = max_attempts
+        self.run_job = run_job
+        self.log_message = log_message
+
+        self.executor = executor or ProcessPoolExecutor(max_workers=max_workers, initializer=analysis_runner.warm_up)
+        self.files = {}        # path -> {'stat', 'changed', 'folder'}
+        self.classified = {}   # path -> classifier result
+        self.queued = set()
+        self.skipped = {}      # path -> stat of a skipped file
+        self.in_flight = {}    # future -> case
+        self.failures = {}     # path -> number of failed runs
+        self.retries = []      # failed cases to queue again
+
+    def scan(self, now):
+        seen = set()
+        for folder in self.watch_folders:
+            if not os.path.isdir(folder['path']):
+                continue
+
+            if folder.get('recursive', True):
+                walker = ((root, files) for root, _, files in os.walk(folder['path']))
+            else:
+                walker = [(folder['path'], [e.name for e in os.scandir(folder['path']) if e.is_file()])]
+
+            for root, names in walker:
+                for name in names:
+                    path = os.path.join(root, name)
+                    if self.checkpoint.is_done(path) or path in self.queued:
+                        continue
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+
+                    seen.add(path)
+                    stat = (st.st_size, st.st_mtime)
+                    if path in self.skipped:
+                        if self.skipped[path] == stat:
+                            continue
+                        del self.skipped[path]
+
+                    entry = self.files.get(path)
+                    if entry is None:
+                        # a file found at startup may have settled long ago
+                        self.files[path] = {'stat': stat, 'changed': min(now, st.st_mtime), 'folder': folder}
+                    elif entry['stat'] != stat:
+                        self.files[path] = {'stat': stat, 'changed': now, 'folder': folder}
+                        self.classified.pop(path, None)
+
+        # deleted files
+        for path in set(self.files) - seen:
+            del self.files[path]
+            self.classified.pop(path, None)
+        for path in set(self.skipped) - seen:
+            del self.skipped[path]
+
+    def is_settled(self, path, now):
+        return now - self.files[path]['changed'] >= self.settle_time_s
+
+    def skip(self, path, reason):
+        # not checkpointed: the file is tried again when it changes or after a restart
+        self.log_message(f'skipping {path}: {reason}')
+        self.failures.pop(path, None)
+        try:
+            st = os.stat(path)
+            self.skipped[path] = (st.st_size, st.st_mtime)
+        except OSError:
+            pass
+        self.files.pop(path, None)
+        self.classified.pop(path, None)
+
+    def get_phantom_reason(self, result):
+        if result.get('error'):
+            return f"not a readable DICOM file ({result['error']})"
+        candidates = phantoms.classifier.get_candidates(result)
+        if len(candidates) > 1:
+            return (f"phantom not decided between {', '.join(candidates)}; set 'phantom' on the watch folder or add "
+                    f"a keyword of the image labels to classifier.keywords in config.json")
+        return f"phantom not recognized ({result['phantom']}, confidence {result['confidence']} < {self.min_confidence})"
+
+    def find_cases(self, now):
+        settled = [path for path in self.files if self.is_settled(path, now)]
+        new = [path for path in settled if path not in self.classified]
+        for result in phantoms.classifier.classify_files(new, self.app_config, log_message=self.log_message):
+            self.classified[result['file']] = result
+
+        # folders that are still being written
+        busy = {os.path.dirname(path) for path in self.files if not self.is_settled(path, now)}
+
+        return self.make_cases(settled, lambda path: self.files[path]['folder'], busy)
+
+    def make_cases(self, paths, get_folder, busy=()):
+        # paths must be classified. files of 3D series in a busy folder are left for a later cycle.
+        cases = {}
+        for path in paths:
+            result = self.classified[path]
+            folder = get_folder(path)
+
+            phantom = folder.get('phantom') or result['phantom']
+            if phantom is None or (not folder.get('phantom') and result['confidence'] < self.min_confidence):
+                self.skip(path, self.get_phantom_reason(result))
+                continue
+
+            if folder.get('site') and folder.get('device'):
+                site, device = folder['site'], folder['device']
+            elif result.get('device_id'):
+                site, device = result['device_id'].split('|')
+            else:
+                self.skip(path, f"device not recognized (station name '{result.get('station_name', '')}'); add it to "
+                                f"station_names of the device in config.json or set site and device on the watch folder")
+                continue
+
+            if analysis_runner.get_phantom_dim(self.app_config, phantom) == 2:
+                key = path
+            else:
+                if os.path.dirname(path) in busy:
+                    continue
+                key = result['series_uid']
+
+            case = cases.setdefault(key, {'site': site, 'device': device, 'phantom': phantom, 'files': []})
+            case['files'].append(path)
+
+        return list(cases.values())
+
+    def queue_files(self, paths, folder):
+        """Classifies and queues complete files from another source (e.g. the DICOM receiver).
+
+        folder holds the optional site, device and phantom of the files, like a watch folder.
+        """
+        for result in phantoms.classifier.classify_files(paths, self.app_config, log_message=self.log_message):
+            self.classified[result['file']] = result
+
+        cases = self.make_cases(paths, lambda path: folder)
+        for case in cases:
+            self.submit(case)
+        return cases
+
+    def submit(self, case):
+        job = {
+            **case,
+            'output_folder': self.output_folder,
+            'performed_by': self.performed_by,
+            'performed_date': datetime.now().strftime('%Y-%m-%d'),
+            'notes': 'Analyzed by the watcher',
+            'metrics_dir': self.metrics_dir,
+            'app_version': APP_VERSION
+        }
+        self.log_message(f"queueing {case['phantom']} of {case['site']}|{case['device']} ({len(case['files'])} files)")
+        future = self.executor.submit(self.run_job, job)
+        self.in_flight[future] = case
+        for path in case['files']:
+            self.queued.add(path)
+            self.files.pop(path, None)
+            self.classified.pop(path, None)
+
+    def collect(self):
+        results = []
+        for future in [f for f in self.in_flight if f.done()]:
+            case = self.in_flight.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'status': 'error', 'case_dir': None, 'error': str(e)}
+
+            for line in result.get('log', []):
+                self.log_message(f"[{case['phantom']}] {line}")
+            self.log_message(f"{case['phantom']} {result['status']}: {result.get('case_dir')} {result.get('error') or ''}")
+            if result['status'] == 'ok':
+                for path in case['files']:
+                    self.checkpoint.mark_done(path)
+                    self.queued.discard(path)
+                    self.failures.pop(path, None)
+            else:
+                self.fail(case)
+            results.append(result)
+        return results
+
+    def fail(self, case):
+        attempts = max(self.failures.get(path, 0) for path in case['files']) + 1
+        for path in case['files']:
+            self.failures[path] = attempts
+
+        if attempts < self.max_attempts:
+            self.retries.append(case)
+            return
+
+        self.log_message(f"giving up on {case['phantom']} of {case['site']}|{case['device']} after {attempts} attempts")
+        for path in case['files']:
+            self.queued.discard(path)
+            self.skip(path, f'analysis failed {attempts} times')
+
+    def submit_retries(self):
+        retries, self.retries = self.retries, []
+        for case in retries:
+            self.submit(case)
+
+    def poll(self, now=None):
+        """One polling cycle. Returns the results of the jobs that finished since the last cycle."""
+        now = time.time() if now is None else now
+        self.scan(now)
+        self.submit_retries()
+        for case in self.find_cases(now):
+            self.submit(case)
+        return self.collect()
+
+    def wait(self):
+        results = []
+        while len(self.in_flight) > 0 or len(self.retries) > 0:
+            self.submit_retries()
+            time.sleep(0.1)
+            results.extend(self.collect())
+        return results
+
+    def run_forever(self, poll_interval_s=10):
+        self.log_message(f"watching {', '.join(f['path'] for f in self.watch_folders)} (settle time {self.settle_time_s}s)")
+        try:
+            while True:
+                self.poll()
+                time.sleep(poll_interval_s)
+        finally:
+            self.executor.shutdown(wait=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Watch export folders and analyze new QC images.')
+    parser.add_argument('--config', default='config.json', help='app config file (watcher, output_folder)')
+    parser.add_argument('--watch', nargs='*', help='folders to watch (default: watcher.watch_folders in the config)')
+    parser.add_argument('--site', help='site of the images in the --watch folders')
+    parser.add_argument('--device', help='device of the images in the --watch folders')
+    parser.add_argument('--output-folder', help='case folder root (default: output_folder in the config)')
+    parser.add_argument('--interval', type=float, help='polling interval in seconds')
+    parser.add_argument('--settle', type=float, help='seconds a file must be unchanged before it is analyzed')
+    parser.add_argument('--max-workers', type=int, help='number of analysis processes')
+    parser.add_argument('--once', action='store_true', help='analyze the settled files and exit')
+    args = parser.parse_args()
+
+    config = helper.read_json_file(args.config)
+    options = config.get('watcher', {})
+
+    if args.watch:
+        watch_folders = [{'path': path, 'site': args.site, 'device': args.device} for path in args.watch]
+    else:
+        watch_folders = options.get('watch_folders', [])
+    if len(watch_folders) == 0:
+        raise Exception('No folders to watch. Use --watch or watcher.watch_folders in the config.')
+
+    def log_message(message):
+        logger.info(message)
+
+    watcher = Watcher(watch_folders=watch_folders,
+                      output_folder=args.output_folder or config['output_folder'],
+                      app_config=config,
+                      checkpoint=Checkpoint(options.get('checkpoint', '_watcher_checkpoint.txt')),
+                      settle_time_s=args.settle if args.settle is not None else options.get('settle_time_s', 30),
+                      max_workers=args.max_workers or options.get('max_workers', 2),
+                      min_confidence=options.get('min_confidence', 0.6),
+                      performed_by=options.get('performed_by', 'watcher'),
+                      metrics_dir=logs_dir,
+                      max_attempts=options.get('max_attempts', 3),
+                      log_message=log_message)
+
+    if args.once:
+        watcher.poll()
+        watcher.wait()
+        watcher.executor.shutdown()
+        return
+
+    watcher.run_forever(poll_interval_s=args.interval or options.get('poll_interval_s', 10))
+
+if __name__ == '__main__':
+    main()